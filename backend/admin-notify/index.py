@@ -1,9 +1,39 @@
 import json
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any
+import hmac
+from typing import Dict, Any, Optional
+from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from email_templates import build_message, render
+from mail_transport import is_configured, send_message
+import jwt
+
+DIGEST_MAX_ITEMS = 200
+
+def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    jwt_secret = os.environ.get('JWT_SECRET')
+    if not auth_token or not jwt_secret:
+        return None
+    
+    try:
+        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return None
+    return payload if payload.get('is_admin') else None
+
+def verify_maintenance(event: Dict[str, Any]) -> bool:
+    '''Allow a maintenance run from the timer trigger, with X-Cron-Secret matching CRON_SECRET, or with an admin token'''
+    # Таймер-триггер вызывает функцию без HTTP-обёртки, поэтому HTTP-запрос не может выдать себя за него
+    if 'httpMethod' not in event:
+        return True
+    
+    headers = event.get('headers') or {}
+    cron_secret = os.environ.get('CRON_SECRET')
+    provided = headers.get('X-Cron-Secret') or headers.get('x-cron-secret')
+    if cron_secret and provided and hmac.compare_digest(provided.encode('utf-8'), cron_secret.encode('utf-8')):
+        return True
+    return verify_admin(headers) is not None
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -11,6 +41,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Args: event - dict с httpMethod, body (type, subject, message, data)
           context - объект с request_id
     Returns: HTTP response dict
+    
+    POST отправляет одно уведомление сразу. Вызов таймер-триггера (cron.txt, без httpMethod) и GET
+    собирают накопленные в admin_notifications события в одно письмо-сводку; GET принимается только
+    с X-Cron-Secret, равным CRON_SECRET, или с токеном администратора.
     '''
     method: str = event.get('httpMethod', 'POST')
     
@@ -20,13 +54,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
+    if method == 'GET' or 'httpMethod' not in event:
+        if not verify_maintenance(event):
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Unauthorized'})
+            }
+        return send_digest()
+    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -44,7 +87,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Получаем SMTP настройки из переменных окружения
     admin_email = os.environ.get('ADMIN_EMAIL')
     smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
     smtp_user = os.environ.get('SMTP_USER')
     smtp_password = os.environ.get('SMTP_PASSWORD')
     
@@ -55,52 +97,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'SMTP configuration missing'})
         }
     
-    # Формируем HTML письмо
-    html_body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
-                <h2 style="color: #2563eb; border-bottom: 2px solid #2563eb; padding-bottom: 10px;">
-                    {subject}
-                </h2>
-                <p style="font-size: 16px;">{message}</p>
-                
-                {f'<div style="background: #f5f5f5; padding: 15px; border-radius: 5px; margin-top: 20px;"><h3 style="margin-top: 0;">Детали:</h3><pre style="white-space: pre-wrap; word-wrap: break-word;">{json.dumps(data, indent=2, ensure_ascii=False)}</pre></div>' if data else ''}
-                
-                <hr style="margin: 20px 0; border: none; border-top: 1px solid #ddd;">
-                <p style="font-size: 12px; color: #666;">
-                    Это автоматическое уведомление с сайта банкротства<br>
-                    Тип события: {notification_type}
-                </p>
-            </div>
-        </body>
-    </html>
-    """
-    
-    # Создаем письмо
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = smtp_user
-    msg['To'] = admin_email
-    
-    html_part = MIMEText(html_body, 'html', 'utf-8')
-    msg.attach(html_part)
-    
     # Отправляем через SMTP
     try:
-        if smtp_port == 465:
-            # SSL
-            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10)
-        else:
-            # TLS (порт 587)
-            server = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
+        # Формируем письмо по общему шаблону
+        details_html = render('admin_details', details=json.dumps(data, indent=2, ensure_ascii=False)) if data else ''
+        email_message = build_message(
+            'admin_notification', smtp_user, admin_email,
+            subject=subject,
+            message=message,
+            details_html=details_html,
+            notification_type=notification_type
+        )
         
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        send_message(smtp_user, [admin_email], email_message)
         
         return {
             'statusCode': 200,
@@ -113,4 +122,81 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': f'Failed to send email: {str(e)}'})
-        }
\ No newline at end of file
+        }
+
+def send_digest() -> Dict[str, Any]:
+    '''Собирает неотправленные уведомления в одно письмо и отмечает их отправленными'''
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    admin_email = os.environ.get('ADMIN_EMAIL')
+    
+    if not admin_email or not is_configured():
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': 'SMTP configuration missing'})
+        }
+    
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # SKIP LOCKED: параллельный запуск не отправит те же события второй раз
+            cur.execute(
+                """SELECT id, event_type, subject, message, data, amount, created_at
+                FROM admin_notifications
+                WHERE sent_at IS NULL
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED""",
+                (int(os.environ.get('ADMIN_DIGEST_MAX_ITEMS', DIGEST_MAX_ITEMS)),)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                conn.rollback()
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'sent': 0})
+                }
+            
+            items_html = ''.join(
+                render(
+                    'admin_digest_item',
+                    created_at=row['created_at'].strftime('%d.%m.%Y %H:%M'),
+                    notification_type=row['event_type'],
+                    subject=row['subject'],
+                    message=row['message'],
+                    details_html=render('admin_details', details=json.dumps(row['data'], indent=2, ensure_ascii=False)) if row['data'] else ''
+                )
+                for row in rows
+            )
+            payments = [row for row in rows if row['event_type'] == 'payment']
+            smtp_user = os.environ.get('SMTP_USER')
+            send_message(smtp_user, [admin_email], build_message(
+                'admin_digest', smtp_user, admin_email,
+                count=len(rows),
+                period=f"{rows[0]['created_at'].strftime('%d.%m.%Y %H:%M')} — {rows[-1]['created_at'].strftime('%d.%m.%Y %H:%M')}",
+                payments_count=len(payments),
+                payments_total=f"{sum(float(row['amount'] or 0) for row in payments):,.0f}".replace(',', ' '),
+                items_html=items_html
+            ))
+            
+            cur.execute(
+                "UPDATE admin_notifications SET sent_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+                ([row['id'] for row in rows],)
+            )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps({'success': True, 'sent': len(rows)})
+            }
+    except Exception as e:
+        conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to send digest: {str(e)}'})
+        }
+    finally:
+        release_connection(conn)
\ No newline at end of file
@@ -8,11 +8,12 @@ import json
 import os
 import jwt
 from typing import Dict, Any, Optional
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+def bump_catalog_version(cur) -> None:
+    '''Invalidate cached course catalogs in the course function; call inside the write transaction'''
+    cur.execute("UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
 
 def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -71,6 +72,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return handle_lessons(method, event, headers_out)
         elif resource == 'materials':
             return handle_materials(method, event, headers_out)
+        elif resource == 'entitlements':
+            return handle_entitlements(method, event, headers_out)
         else:
             return {
                 'statusCode': 404,
@@ -86,7 +89,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 def handle_modules(method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    conn = get_db_connection()
+    conn = get_connection()
     
     try:
         if method == 'GET':
@@ -113,6 +116,7 @@ def handle_modules(method: str, event: Dict[str, Any], headers: Dict[str, str])
                     (title, description, sort_order, is_published)
                 )
                 module = cur.fetchone()
+                bump_catalog_version(cur)
                 conn.commit()
                 
                 return {
@@ -131,6 +135,7 @@ def handle_modules(method: str, event: Dict[str, Any], headers: Dict[str, str])
                     (body_data.get('title'), body_data.get('description'), body_data.get('sort_order'), body_data.get('is_published'), module_id)
                 )
                 module = cur.fetchone()
+                bump_catalog_version(cur)
                 conn.commit()
                 
                 return {
@@ -142,10 +147,10 @@ def handle_modules(method: str, event: Dict[str, Any], headers: Dict[str, str])
         return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
     
     finally:
-        conn.close()
+        release_connection(conn)
 
 def handle_lessons(method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    conn = get_db_connection()
+    conn = get_connection()
     
     try:
         if method == 'GET':
@@ -177,6 +182,7 @@ def handle_lessons(method: str, event: Dict[str, Any], headers: Dict[str, str])
                      body_data.get('sort_order', 0), body_data.get('is_published', False))
                 )
                 lesson = cur.fetchone()
+                bump_catalog_version(cur)
                 conn.commit()
                 
                 return {
@@ -197,6 +203,7 @@ def handle_lessons(method: str, event: Dict[str, Any], headers: Dict[str, str])
                      body_data.get('is_published'), lesson_id)
                 )
                 lesson = cur.fetchone()
+                bump_catalog_version(cur)
                 conn.commit()
                 
                 return {
@@ -208,10 +215,10 @@ def handle_lessons(method: str, event: Dict[str, Any], headers: Dict[str, str])
         return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
     
     finally:
-        conn.close()
+        release_connection(conn)
 
 def handle_materials(method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    conn = get_db_connection()
+    conn = get_connection()
     
     try:
         if method == 'GET':
@@ -245,6 +252,7 @@ def handle_materials(method: str, event: Dict[str, Any], headers: Dict[str, str]
                      body_data.get('file_url'), body_data.get('file_type'), body_data.get('file_size_kb'))
                 )
                 material = cur.fetchone()
+                bump_catalog_version(cur)
                 conn.commit()
                 
                 return {
@@ -256,4 +264,40 @@ def handle_materials(method: str, event: Dict[str, Any], headers: Dict[str, str]
         return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
     
     finally:
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
+
+def handle_entitlements(method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Consistency check for user_entitlements: GET reports drift against purchases, POST repairs it'''
+    conn = get_connection()
+    
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM user_entitlements_drift ORDER BY user_id, product")
+            drift = cur.fetchall()
+            
+            if method == 'GET':
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'consistent': not drift, 'drift': [dict(d) for d in drift]}, default=str)
+                }
+            
+            elif method == 'POST':
+                for row in drift:
+                    cur.execute("DELETE FROM user_entitlements WHERE user_id = %s AND product = %s", (row['user_id'], row['product']))
+                    cur.execute(
+                        "INSERT INTO user_entitlements (user_id, product, expires_at) SELECT user_id, product, expires_at FROM user_entitlement_sources WHERE user_id = %s AND product = %s",
+                        (row['user_id'], row['product'])
+                    )
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'repaired': len(drift)})
+                }
+        
+        return {'statusCode': 405, 'headers': headers, 'body': json.dumps({'error': 'Method not allowed'})}
+    
+    finally:
+        release_connection(conn)
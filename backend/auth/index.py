@@ -1,5 +1,5 @@
 '''
-Business: User authentication API - registration, login, token validation
+Business: User authentication API - registration, login, magic-link login, setting a password, token validation
 Args: event with httpMethod, body, headers; context with request_id
 Returns: JWT tokens for authenticated users or error messages
 '''
@@ -12,9 +12,8 @@ from datetime import datetime, timedelta
 from typing import Dict, Any
 import psycopg2
 from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+from db import get_connection, release_connection
+from magic_link import verify_login_token
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -45,6 +44,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 return register_user(body_data, headers)
             elif action == 'login':
                 return login_user(body_data, headers)
+            elif action == 'magic':
+                return login_with_magic_link(body_data, headers)
+            elif action == 'set_password':
+                auth_token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+                return set_password(auth_token, body_data, headers)
             else:
                 return {
                     'statusCode': 400,
@@ -97,7 +101,7 @@ def register_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, An
     
     password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     
-    conn = get_db_connection()
+    conn = get_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -130,7 +134,7 @@ def register_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, An
             'body': json.dumps({'error': 'User with this email already exists'})
         }
     finally:
-        conn.close()
+        release_connection(conn)
 
 def login_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
     email = data.get('email')
@@ -143,7 +147,7 @@ def login_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Email and password are required'})
         }
     
-    conn = get_db_connection()
+    conn = get_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -159,7 +163,7 @@ def login_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Invalid credentials'})
                 }
             
-            if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+            if not user['password_hash'] or not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
                 return {
                     'statusCode': 401,
                     'headers': headers,
@@ -182,7 +186,127 @@ def login_user(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
                 })
             }
     finally:
-        conn.close()
+        release_connection(conn)
+
+def login_with_magic_link(data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    login_token = verify_login_token(data.get('token') or '')
+    
+    if not login_token:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Ссылка для входа недействительна или устарела'})
+        }
+    
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                "INSERT INTO consumed_login_tokens (nonce, user_id, expires_at) VALUES (%s, %s, %s) ON CONFLICT (nonce) DO NOTHING RETURNING nonce",
+                (login_token['nonce'], login_token['user_id'], login_token['expires_at'])
+            )
+            if not cur.fetchone():
+                conn.rollback()
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Ссылка для входа уже использована'})
+                }
+            
+            cur.execute("DELETE FROM consumed_login_tokens WHERE expires_at < CURRENT_TIMESTAMP")
+            cur.execute(
+                "SELECT id, email, full_name, is_admin, password_hash IS NULL AS needs_password FROM users WHERE id = %s",
+                (login_token['user_id'],)
+            )
+            user = cur.fetchone()
+            conn.commit()
+    finally:
+        release_connection(conn)
+    
+    if not user:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Ссылка для входа недействительна или устарела'})
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'token': generate_token(dict(user)),
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name'],
+                'is_admin': user['is_admin']
+            },
+            'needs_password': user['needs_password']
+        })
+    }
+
+def set_password(auth_token: str, data: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    password = data.get('password') or ''
+    
+    if not auth_token:
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'No token provided'})
+        }
+    
+    try:
+        payload = jwt.decode(auth_token, os.environ['JWT_SECRET'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'Invalid token'})
+        }
+    
+    if len(password) < 6:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Пароль должен быть не менее 6 символов'})
+        }
+    
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT password_hash FROM users WHERE id = %s FOR UPDATE", (payload['id'],))
+            user = cur.fetchone()
+            if not user:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'User not found'})
+                }
+            
+            # Без текущего пароля задать пароль можно только при первом входе по ссылке, пока его ещё нет
+            current_password = data.get('current_password') or ''
+            if user['password_hash'] and not bcrypt.checkpw(current_password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+                return {
+                    'statusCode': 403,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Неверный текущий пароль'})
+                }
+            
+            cur.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (password_hash, payload['id'])
+            )
+            conn.commit()
+    finally:
+        release_connection(conn)
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'message': 'Пароль сохранён'})
+    }
 
 def validate_token(token: str, headers: Dict[str, str]) -> Dict[str, Any]:
     try:
@@ -197,17 +321,17 @@ def validate_token(token: str, headers: Dict[str, str]) -> Dict[str, Any]:
         payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
         user_id = payload['id']
         
-        conn = get_db_connection()
+        conn = get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
-                    "SELECT COUNT(*) as has_access FROM user_purchases WHERE user_id = %s AND payment_status = 'completed' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)",
+                    "SELECT EXISTS (SELECT 1 FROM user_entitlements WHERE user_id = %s AND product <> 'chat_access' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)) AS has_access",
                     (user_id,)
                 )
                 access_check = cur.fetchone()
-                has_course_access = access_check['has_access'] > 0 or payload.get('is_admin', False)
+                has_course_access = access_check['has_access'] or payload.get('is_admin', False)
         finally:
-            conn.close()
+            release_connection(conn)
         
         return {
             'statusCode': 200,
@@ -257,7 +381,7 @@ def verify_chat_token(token: str, headers: Dict[str, str]) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Token is required', 'valid': False})
         }
     
-    conn = get_db_connection()
+    conn = get_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
@@ -322,4 +446,4 @@ def verify_chat_token(token: str, headers: Dict[str, str]) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e), 'valid': False})
         }
     finally:
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
\ No newline at end of file
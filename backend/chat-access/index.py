@@ -6,15 +6,23 @@ Returns: HTTP response dict
 '''
 
 import json
-import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 from datetime import datetime, timedelta
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
 def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    conn = get_connection()
+    conn.cursor_factory = RealDictCursor
+    return conn
+
+def refresh_user_entitlement(cur, user_id: int, product: str) -> None:
+    '''Recompute one user_entitlements row from purchases and chat access; call inside the write transaction'''
+    cur.execute("DELETE FROM user_entitlements WHERE user_id = %s AND product = %s", (user_id, product))
+    cur.execute(
+        "INSERT INTO user_entitlements (user_id, product, expires_at) SELECT user_id, product, expires_at FROM user_entitlement_sources WHERE user_id = %s AND product = %s",
+        (user_id, product)
+    )
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -64,30 +72,32 @@ def get_clients(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any
     params = event.get('queryStringParameters') or {}
     active_only = params.get('active', 'true').lower() == 'true'
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     if active_only:
-        cur.execute("""
+        query = """
             SELECT id, client_name, client_email, client_phone, telegram_username,
                    access_start, access_end, is_active, payment_amount, notes,
                    created_at, updated_at
             FROM chat_access
             WHERE is_active = true AND access_end > NOW()
             ORDER BY access_end ASC
-        """)
+        """
     else:
-        cur.execute("""
+        query = """
             SELECT id, client_name, client_email, client_phone, telegram_username,
                    access_start, access_end, is_active, payment_amount, notes,
                    created_at, updated_at
             FROM chat_access
             ORDER BY created_at DESC
-        """)
+        """
     
-    clients = cur.fetchall()
-    cur.close()
-    conn.close()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        clients = cur.fetchall()
+        cur.close()
+    finally:
+        release_connection(conn)
     
     for client in clients:
         for key in ['access_start', 'access_end', 'created_at', 'updated_at']:
@@ -110,6 +120,7 @@ def add_client(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]
     client_email = body_data.get('client_email')
     client_phone = body_data.get('client_phone')
     telegram_username = body_data.get('telegram_username')
+    user_id = body_data.get('user_id')
     days = body_data.get('days', 7)
     payment_amount = body_data.get('payment_amount')
     notes = body_data.get('notes')
@@ -122,27 +133,30 @@ def add_client(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]
             'body': json.dumps({'error': 'client_name is required'})
         }
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     access_start = datetime.now()
     access_end = access_start + timedelta(days=days)
     
-    cur.execute("""
-        INSERT INTO chat_access (
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO chat_access (
+                client_name, client_email, client_phone, telegram_username,
+                access_start, access_end, is_active, payment_amount, notes, user_id
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id, client_name, access_start, access_end
+        """, (
             client_name, client_email, client_phone, telegram_username,
-            access_start, access_end, is_active, payment_amount, notes
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        RETURNING id, client_name, access_start, access_end
-    """, (
-        client_name, client_email, client_phone, telegram_username,
-        access_start, access_end, True, payment_amount, notes
-    ))
-    
-    result = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+            access_start, access_end, True, payment_amount, notes, user_id
+        ))
+        
+        result = cur.fetchone()
+        if user_id:
+            refresh_user_entitlement(cur, int(user_id), 'chat_access')
+        conn.commit()
+        cur.close()
+    finally:
+        release_connection(conn)
     
     if result:
         result['access_start'] = result['access_start'].isoformat()
@@ -169,9 +183,6 @@ def update_client(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, A
     
     body_data = json.loads(event.get('body', '{}'))
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     update_fields = []
     update_values = []
     
@@ -200,13 +211,19 @@ def update_client(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, A
     update_fields.append('updated_at = NOW()')
     update_values.append(client_id)
     
-    query = f"UPDATE chat_access SET {', '.join(update_fields)} WHERE id = %s RETURNING id"
+    query = f"UPDATE chat_access SET {', '.join(update_fields)} WHERE id = %s RETURNING id, user_id"
     
-    cur.execute(query, update_values)
-    result = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, update_values)
+        result = cur.fetchone()
+        if result and result['user_id']:
+            refresh_user_entitlement(cur, result['user_id'], 'chat_access')
+        conn.commit()
+        cur.close()
+    finally:
+        release_connection(conn)
     
     if result:
         return {
@@ -236,13 +253,16 @@ def delete_client(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, A
         }
     
     conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("DELETE FROM chat_access WHERE id = %s RETURNING id", (client_id,))
-    result = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM chat_access WHERE id = %s RETURNING id, user_id", (client_id,))
+        result = cur.fetchone()
+        if result and result['user_id']:
+            refresh_user_entitlement(cur, result['user_id'], 'chat_access')
+        conn.commit()
+        cur.close()
+    finally:
+        release_connection(conn)
     
     if result:
         return {
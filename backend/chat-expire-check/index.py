@@ -6,15 +6,23 @@ Returns: HTTP response dict с количеством деактивирован
 '''
 
 import json
-import os
 from typing import Dict, Any
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 
 def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    conn = get_connection()
+    conn.cursor_factory = RealDictCursor
+    return conn
+
+def refresh_user_entitlement(cur, user_id: int, product: str) -> None:
+    '''Recompute one user_entitlements row from purchases and chat access; call inside the write transaction'''
+    cur.execute("DELETE FROM user_entitlements WHERE user_id = %s AND product = %s", (user_id, product))
+    cur.execute(
+        "INSERT INTO user_entitlements (user_id, product, expires_at) SELECT user_id, product, expires_at FROM user_entitlement_sources WHERE user_id = %s AND product = %s",
+        (user_id, product)
+    )
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -38,27 +46,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT id, client_name, telegram_username, access_end
-            FROM chat_access
-            WHERE is_active = true AND access_end <= NOW()
-        """)
-        
-        expired_clients = cur.fetchall()
-        expired_count = len(expired_clients)
-        
-        if expired_count > 0:
+        try:
+            cur = conn.cursor()
             cur.execute("""
                 UPDATE chat_access
                 SET is_active = false, updated_at = NOW()
                 WHERE is_active = true AND access_end <= NOW()
+                RETURNING id, client_name, telegram_username, access_end, user_id
             """)
+            
+            expired_clients = cur.fetchall()
+            expired_count = len(expired_clients)
+            
+            for user_id in {client['user_id'] for client in expired_clients if client['user_id'] is not None}:
+                refresh_user_entitlement(cur, user_id, 'chat_access')
             conn.commit()
-        
-        cur.close()
-        conn.close()
+            
+            cur.close()
+        finally:
+            release_connection(conn)
         
         expired_list = []
         for client in expired_clients:
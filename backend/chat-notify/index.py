@@ -9,16 +9,16 @@ import json
 import os
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 import urllib.request
 import urllib.parse
-import string
-import secrets
+from chat_tokens import issue_chat_token
 
 def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    conn = get_connection()
+    conn.cursor_factory = RealDictCursor
+    return conn
 
 def get_telegram_chat_id(username: str, bot_token: str) -> Optional[str]:
     username_clean = username.lstrip('@')
@@ -88,23 +88,26 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         tomorrow = datetime.now() + timedelta(days=1)
         day_after = tomorrow + timedelta(days=1)
         
-        cur.execute("""
-            SELECT id, client_name, telegram_username, access_end
-            FROM chat_access
-            WHERE is_active = true 
-            AND access_end >= %s 
-            AND access_end < %s
-            AND telegram_username IS NOT NULL
-            AND telegram_username != ''
-        """, (tomorrow, day_after))
-        
-        expiring_clients = cur.fetchall()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, client_name, telegram_username, access_end
+                FROM chat_access
+                WHERE is_active = true 
+                AND access_end >= %s 
+                AND access_end < %s
+                AND telegram_username IS NOT NULL
+                AND telegram_username != ''
+            """, (tomorrow, day_after))
+            
+            expiring_clients = cur.fetchall()
+            cur.close()
+        finally:
+            release_connection(conn)
         
         notifications_sent = []
         notifications_failed = []
@@ -150,9 +153,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'reason': 'Chat ID not found. User needs to start bot first'
                 })
         
-        cur.close()
-        conn.close()
-        
         return {
             'statusCode': 200,
             'headers': headers,
@@ -175,14 +175,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)})
         }
 
-def generate_custom_token(email: str, amount: float) -> str:
-    '''Generate custom token format: {random}_manual_combo_{date}_{email_part}'''
-    random_part = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
-    date_part = datetime.utcnow().strftime('%b%d')
-    email_part = email.split('@')[0].replace('.', '').replace('-', '')[:8] if '@' in email else 'user'
-    token = f"{random_part}_manual_combo_{date_part}_{email_part}"
-    return token
-
 def handle_register(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
     '''Handle combo purchase registration and token generation'''
     api_key = event.get('headers', {}).get('X-Api-Key') or event.get('headers', {}).get('x-api-key')
@@ -214,12 +206,10 @@ def handle_register(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
                 'body': json.dumps({'success': False, 'error': 'Email is required'})
             }
         
-        token = generate_custom_token(email, amount)
-        expires_at = datetime.utcnow() + timedelta(days=30)
-        expires_at_iso = expires_at.strftime('%Y-%m-%dT%H:%M:%SZ')
-        chat_url = f'https://chat-bankrot.ru/?token={token}'
+        chat_token = issue_chat_token(email, amount)
+        expires_at_iso = chat_token['expires_at'].strftime('%Y-%m-%dT%H:%M:%SZ')
         
-        print(f"[CHAT-REGISTER] Generated token for {email}: {token}")
+        print(f"[CHAT-REGISTER] Generated token for {email}: {chat_token['token']}")
         print(f"[CHAT-REGISTER] Amount: {amount}, Expires: {expires_at_iso}")
         
         return {
@@ -227,8 +217,8 @@ def handle_register(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
             'headers': headers,
             'body': json.dumps({
                 'success': True,
-                'token': token,
-                'chat_url': chat_url,
+                'token': chat_token['token'],
+                'chat_url': chat_token['chat_url'],
                 'expires_at': expires_at_iso
             })
         }
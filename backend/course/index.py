@@ -6,13 +6,11 @@ Returns: Course content and user progress data
 
 import json
 import os
+import hashlib
 import jwt
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+from typing import Dict, Any, List, Optional
+from psycopg2.extras import RealDictCursor, execute_values
+from db import get_connection, release_connection
 
 def verify_user(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -38,7 +36,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -73,14 +71,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 def get_course_content(user: Dict[str, Any], event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    conn = get_db_connection()
+    conn = get_connection()
     user_id = user['id']
     
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                "SELECT COUNT(*) as has_access FROM user_purchases WHERE user_id = %s AND payment_status = 'completed' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)",
-                (user_id,)
+                """
+                SELECT
+                    EXISTS (SELECT 1 FROM user_entitlements WHERE user_id = %s AND product <> 'chat_access' AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)) AS has_access,
+                    (SELECT version FROM catalog_version WHERE id = 1) AS catalog_version,
+                    (SELECT MAX(last_watched_at) FROM user_progress WHERE user_id = %s) AS last_watched_at
+                """,
+                (user_id, user_id)
             )
             access_check = cur.fetchone()
             
@@ -91,47 +94,30 @@ def get_course_content(user: Dict[str, Any], event: Dict[str, Any], headers: Dic
                     'body': json.dumps({'error': 'Course access required. Please purchase the course.'})
                 }
             
-            cur.execute("SELECT * FROM course_modules WHERE is_published = TRUE ORDER BY sort_order")
-            modules = cur.fetchall()
+            etag = build_course_etag(user_id, access_check['catalog_version'], access_check['last_watched_at'])
+            if etag:
+                headers = {
+                    **headers,
+                    'ETag': etag,
+                    'Cache-Control': 'private, no-cache',
+                    'Access-Control-Expose-Headers': 'ETag'
+                }
+                request_headers = event.get('headers') or {}
+                if etag_matches(request_headers.get('If-None-Match') or request_headers.get('if-none-match'), etag):
+                    return {
+                        'statusCode': 304,
+                        'headers': headers,
+                        'body': ''
+                    }
+            
+            catalog = get_course_catalog(cur, access_check['catalog_version'])
             
-            result = []
-            for module in modules:
-                module_dict = dict(module)
-                
-                cur.execute("SELECT * FROM lessons WHERE module_id = %s AND is_published = TRUE ORDER BY sort_order", (module['id'],))
-                lessons = cur.fetchall()
-                
-                lessons_with_progress = []
-                for lesson in lessons:
-                    lesson_dict = dict(lesson)
-                    
-                    cur.execute(
-                        "SELECT completed, watch_time_seconds, last_watched_at FROM user_progress WHERE user_id = %s AND lesson_id = %s",
-                        (user_id, lesson['id'])
-                    )
-                    progress = cur.fetchone()
-                    lesson_dict['progress'] = dict(progress) if progress else {'completed': False, 'watch_time_seconds': 0}
-                    
-                    cur.execute("SELECT * FROM materials WHERE lesson_id = %s", (lesson['id'],))
-                    materials = cur.fetchall()
-                    lesson_dict['materials'] = [dict(m) for m in materials]
-                    
-                    cur.execute("SELECT id, title, description, file_name, file_url, file_type, file_size FROM course_files WHERE lesson_id = %s ORDER BY uploaded_at DESC", (lesson['id'],))
-                    lesson_files = cur.fetchall()
-                    lesson_dict['files'] = [dict(f) for f in lesson_files]
-                    
-                    lessons_with_progress.append(lesson_dict)
-                
-                cur.execute("SELECT * FROM materials WHERE module_id = %s AND lesson_id IS NULL", (module['id'],))
-                module_materials = cur.fetchall()
-                
-                cur.execute("SELECT id, title, description, file_name, file_url, file_type, file_size FROM course_files WHERE module_id = %s AND lesson_id IS NULL ORDER BY uploaded_at DESC", (module['id'],))
-                module_files = cur.fetchall()
-                
-                module_dict['lessons'] = lessons_with_progress
-                module_dict['materials'] = [dict(m) for m in module_materials]
-                module_dict['files'] = [dict(f) for f in module_files]
-                result.append(module_dict)
+            lesson_ids = [lesson['id'] for module in catalog for lesson in module['lessons']]
+            cur.execute(
+                "SELECT lesson_id, completed, watch_time_seconds, last_watched_at FROM user_progress WHERE user_id = %s AND lesson_id = ANY(%s)",
+                (user_id, lesson_ids)
+            )
+            result = overlay_progress(catalog, cur.fetchall())
             
             return {
                 'statusCode': 200,
@@ -140,14 +126,127 @@ def get_course_content(user: Dict[str, Any], event: Dict[str, Any], headers: Dic
             }
     
     finally:
-        conn.close()
+        release_connection(conn)
+
+def build_course_etag(user_id: int, catalog_version: Optional[int], last_watched_at: Any) -> Optional[str]:
+    '''Strong validator for the course response: changes when the catalog or the user's progress changes'''
+    if catalog_version is None:
+        return None
+    
+    fingerprint = f"{catalog_version}:{user_id}:{last_watched_at.isoformat() if last_watched_at else ''}"
+    return '"' + hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    
+    if if_none_match.strip() == '*':
+        return True
+    
+    candidates = [c.strip() for c in if_none_match.split(',')]
+    return any((c[2:] if c.startswith('W/') else c) == etag for c in candidates)
+
+_catalog_cache: Dict[str, Any] = {'version': None, 'modules': None}
+
+def get_course_catalog(cur, version: Optional[int]) -> List[Dict[str, Any]]:
+    '''Return the published course tree, reloading it only when admin writes have bumped catalog_version'''
+    if version is not None and _catalog_cache['version'] == version:
+        return _catalog_cache['modules']
+    
+    modules = load_course_catalog(cur)
+    _catalog_cache['version'] = version
+    _catalog_cache['modules'] = modules
+    return modules
+
+def load_course_catalog(cur) -> List[Dict[str, Any]]:
+    '''Load published modules with lessons, materials and files in a fixed number of queries'''
+    cur.execute("SELECT * FROM course_modules WHERE is_published = TRUE ORDER BY sort_order")
+    modules = [dict(m) for m in cur.fetchall()]
+    if not modules:
+        return []
+    
+    module_ids = [m['id'] for m in modules]
+    
+    cur.execute(
+        "SELECT * FROM lessons WHERE module_id = ANY(%s) AND is_published = TRUE ORDER BY sort_order",
+        (module_ids,)
+    )
+    lessons = [dict(l) for l in cur.fetchall()]
+    lesson_ids = [l['id'] for l in lessons]
+    
+    cur.execute(
+        "SELECT * FROM materials WHERE lesson_id = ANY(%s) OR (module_id = ANY(%s) AND lesson_id IS NULL)",
+        (lesson_ids, module_ids)
+    )
+    materials = cur.fetchall()
+    
+    cur.execute(
+        "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id FROM course_files WHERE lesson_id = ANY(%s) OR (module_id = ANY(%s) AND lesson_id IS NULL) ORDER BY uploaded_at DESC",
+        (lesson_ids, module_ids)
+    )
+    files = cur.fetchall()
+    
+    lesson_materials: Dict[int, List[Dict[str, Any]]] = {}
+    module_materials: Dict[int, List[Dict[str, Any]]] = {}
+    for material in materials:
+        if material['lesson_id'] is not None:
+            lesson_materials.setdefault(material['lesson_id'], []).append(dict(material))
+        else:
+            module_materials.setdefault(material['module_id'], []).append(dict(material))
+    
+    lesson_files: Dict[int, List[Dict[str, Any]]] = {}
+    module_files: Dict[int, List[Dict[str, Any]]] = {}
+    for f in files:
+        file_dict = dict(f)
+        file_lesson_id = file_dict.pop('lesson_id')
+        file_module_id = file_dict.pop('module_id')
+        if file_lesson_id is not None:
+            lesson_files.setdefault(file_lesson_id, []).append(file_dict)
+        else:
+            module_files.setdefault(file_module_id, []).append(file_dict)
+    
+    lessons_by_module: Dict[int, List[Dict[str, Any]]] = {}
+    for lesson in lessons:
+        lesson['materials'] = lesson_materials.get(lesson['id'], [])
+        lesson['files'] = lesson_files.get(lesson['id'], [])
+        lessons_by_module.setdefault(lesson['module_id'], []).append(lesson)
+    
+    for module in modules:
+        module['lessons'] = lessons_by_module.get(module['id'], [])
+        module['materials'] = module_materials.get(module['id'], [])
+        module['files'] = module_files.get(module['id'], [])
+    
+    return modules
+
+def overlay_progress(catalog: List[Dict[str, Any]], progress_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''Merge user progress into a copy of the shared catalog without mutating it'''
+    progress_by_lesson = {}
+    for row in progress_rows:
+        progress = dict(row)
+        progress_by_lesson[progress.pop('lesson_id')] = progress
+    
+    result = []
+    for module in catalog:
+        lessons = [
+            {**lesson, 'progress': progress_by_lesson.get(lesson['id']) or {'completed': False, 'watch_time_seconds': 0}}
+            for lesson in module['lessons']
+        ]
+        result.append({**module, 'lessons': lessons})
+    
+    return result
+
+MAX_PROGRESS_EVENTS = 500
 
 def update_progress(user: Dict[str, Any], event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
-    conn = get_db_connection()
+    body_data = json.loads(event.get('body', '{}'))
+    
+    if 'events' in body_data:
+        return update_progress_batch(user, body_data.get('events'), headers)
+    
+    conn = get_connection()
     user_id = user['id']
     
     try:
-        body_data = json.loads(event.get('body', '{}'))
         lesson_id = body_data.get('lesson_id')
         completed = body_data.get('completed', False)
         watch_time_seconds = body_data.get('watch_time_seconds', 0)
@@ -173,4 +272,85 @@ def update_progress(user: Dict[str, Any], event: Dict[str, Any], headers: Dict[s
             }
     
     finally:
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
+
+def coalesce_progress_events(events: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    '''Collapse heartbeat events to one per lesson: max watch time, completed once any event says so'''
+    coalesced: Dict[int, Dict[str, Any]] = {}
+    for progress_event in events:
+        lesson_id = int(progress_event['lesson_id'])
+        watch_time_seconds = int(progress_event.get('watch_time_seconds') or 0)
+        completed = bool(progress_event.get('completed', False))
+        
+        current = coalesced.get(lesson_id)
+        if current:
+            current['watch_time_seconds'] = max(current['watch_time_seconds'], watch_time_seconds)
+            current['completed'] = current['completed'] or completed
+        else:
+            coalesced[lesson_id] = {'watch_time_seconds': watch_time_seconds, 'completed': completed}
+    
+    return coalesced
+
+def update_progress_batch(user: Dict[str, Any], events: Any, headers: Dict[str, str]) -> Dict[str, Any]:
+    if not isinstance(events, list) or not events:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'events must be a non-empty array'})
+        }
+    
+    if len(events) > MAX_PROGRESS_EVENTS:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Too many events, max {MAX_PROGRESS_EVENTS}'})
+        }
+    
+    try:
+        coalesced = coalesce_progress_events(events)
+    except (KeyError, TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Each event requires a numeric lesson_id'})
+        }
+    
+    user_id = user['id']
+    rows = [
+        (user_id, lesson_id, p['completed'], p['watch_time_seconds'])
+        for lesson_id, p in coalesced.items()
+    ]
+    
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            updated = execute_values(
+                cur,
+                """
+                INSERT INTO user_progress (user_id, lesson_id, completed, watch_time_seconds, last_watched_at)
+                VALUES %s
+                ON CONFLICT (user_id, lesson_id)
+                DO UPDATE SET
+                    completed = user_progress.completed OR EXCLUDED.completed,
+                    watch_time_seconds = GREATEST(user_progress.watch_time_seconds, EXCLUDED.watch_time_seconds),
+                    last_watched_at = CURRENT_TIMESTAMP
+                RETURNING lesson_id, completed, watch_time_seconds, last_watched_at
+                """,
+                rows,
+                template='(%s, %s, %s, %s, CURRENT_TIMESTAMP)',
+                page_size=len(rows),
+                fetch=True
+            )
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps({
+                    'received': len(events),
+                    'updated': [dict(p) for p in updated]
+                }, default=str)
+            }
+    
+    finally:
+        release_connection(conn)
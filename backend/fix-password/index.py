@@ -5,10 +5,9 @@ Returns: Success message
 '''
 
 import json
-import os
 import bcrypt
 from typing import Dict, Any
-import psycopg2
+from db import get_connection, release_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -37,22 +36,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute("""
-            INSERT INTO users (email, password_hash, full_name, is_admin)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (email) 
-            DO UPDATE SET password_hash = EXCLUDED.password_hash, is_admin = true
-            RETURNING id, email, full_name, is_admin
-        """, (email, password_hash, full_name, True))
-        
-        user = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO users (email, password_hash, full_name, is_admin)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (email) 
+                DO UPDATE SET password_hash = EXCLUDED.password_hash, is_admin = true
+                RETURNING id, email, full_name, is_admin
+            """, (email, password_hash, full_name, True))
+            
+            user = cur.fetchone()
+            conn.commit()
+            
+            cur.close()
+        finally:
+            release_connection(conn)
         
         return {
             'statusCode': 200,
@@ -0,0 +1,110 @@
+'''
+Business: Postgres connection pool reused across warm invocations of a function
+Args: DATABASE_URL; optional DB_POOL_MAX, DB_POOL_MODE (session|transaction), DB_POOL_PING_AFTER seconds
+Returns: Pooled psycopg2 connections via get_connection/release_connection; pool_stats() counters are
+         reported in the payment reconcile response
+
+The same file is copied into every backend function because each one is deployed on its own.
+Keep the copies identical.
+
+DB_POOL_MODE=transaction is for PgBouncer in pool_mode=transaction: a connection never goes back to the
+pool with an open transaction, and no session-level state or liveness ping is issued on checkout.
+'''
+
+import os
+import time
+import threading
+from typing import Dict, Any, List, Tuple
+import psycopg2
+from psycopg2 import extensions
+
+_idle: List[Tuple[Any, float]] = []
+_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    'checkouts': 0,
+    'created': 0,
+    'reused': 0,
+    'discarded': 0,
+    'ping_failures': 0,
+    'in_use': 0
+}
+
+def _count(name: str, delta: int = 1) -> None:
+    with _lock:
+        _stats[name] += delta
+
+def _pool_mode() -> str:
+    return os.environ.get('DB_POOL_MODE', 'session').lower()
+
+def _is_alive(conn, last_used: float) -> bool:
+    if conn.closed:
+        return False
+    
+    if _pool_mode() == 'transaction':
+        return True
+    
+    if time.monotonic() - last_used < float(os.environ.get('DB_POOL_PING_AFTER', '30')):
+        return True
+    
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        _count('ping_failures')
+        return False
+
+def _discard(conn) -> None:
+    _count('discarded')
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def get_connection():
+    '''Check out a live connection; pair every call with release_connection'''
+    while True:
+        with _lock:
+            idle = _idle.pop() if _idle else None
+        
+        if idle is None:
+            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            _count('created')
+            break
+        
+        conn, last_used = idle
+        if _is_alive(conn, last_used):
+            _count('reused')
+            break
+        _discard(conn)
+    
+    _count('checkouts')
+    _count('in_use')
+    return conn
+
+def release_connection(conn) -> None:
+    '''Return a connection to the pool, rolling back anything left uncommitted'''
+    _count('in_use', -1)
+    
+    if not conn.closed and conn.status != extensions.STATUS_READY:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            _discard(conn)
+            return
+    
+    if conn.closed:
+        _count('discarded')
+        return
+    
+    conn.cursor_factory = None
+    with _lock:
+        if len(_idle) < int(os.environ.get('DB_POOL_MAX', '5')):
+            _idle.append((conn, time.monotonic()))
+            return
+    _discard(conn)
+
+def pool_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, 'idle': len(_idle), 'mode': _pool_mode()}
@@ -0,0 +1,240 @@
+import json
+import os
+import hmac
+import time
+from typing import Dict, Any, List, Optional
+from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from object_storage import BUCKET_NAME, get_client, is_configured, object_url
+import jwt
+
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    jwt_secret = os.environ.get('JWT_SECRET')
+    if not auth_token or not jwt_secret:
+        return None
+    
+    try:
+        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return None
+    return payload if payload.get('is_admin') else None
+
+def verify_maintenance(event: Dict[str, Any]) -> bool:
+    '''Allow a maintenance run from the timer trigger, with X-Cron-Secret matching CRON_SECRET, or with an admin token'''
+    # Таймер-триггер вызывает функцию без HTTP-обёртки, поэтому HTTP-запрос не может выдать себя за него
+    if 'httpMethod' not in event:
+        return True
+    
+    headers = event.get('headers') or {}
+    cron_secret = os.environ.get('CRON_SECRET')
+    provided = headers.get('X-Cron-Secret') or headers.get('x-cron-secret')
+    if cron_secret and provided and hmac.compare_digest(provided.encode('utf-8'), cron_secret.encode('utf-8')):
+        return True
+    return verify_admin(headers) is not None
+
+def json_response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': json.dumps(body)}
+
+def blob_key(sha256: str, file_name: str) -> str:
+    return f'course-files/{sha256}/{file_name}'
+
+def reference_blob(cur, sha256: str, file_size: int) -> Optional[Dict[str, Any]]:
+    cur.execute(
+        "UPDATE file_blobs SET ref_count = ref_count + 1, last_referenced_at = CURRENT_TIMESTAMP WHERE sha256 = %s AND file_size = %s RETURNING *",
+        (sha256, file_size)
+    )
+    return cur.fetchone()
+
+def register_blob(cur, sha256: str, file_key: str, file_size: int, file_type: str) -> Dict[str, Any]:
+    cur.execute(
+        """INSERT INTO file_blobs (sha256, file_key, file_size, file_type, ref_count)
+        VALUES (%s, %s, %s, %s, 1)
+        ON CONFLICT (sha256) DO UPDATE SET ref_count = file_blobs.ref_count + 1, last_referenced_at = CURRENT_TIMESTAMP
+        RETURNING *""",
+        (sha256, file_key, file_size, file_type)
+    )
+    return cur.fetchone()
+
+def file_data_column_exists(cur) -> bool:
+    cur.execute(
+        """SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'course_files' AND column_name = 'file_data'"""
+    )
+    return cur.fetchone() is not None
+
+def inline_data_stats(cur) -> Dict[str, int]:
+    cur.execute(
+        """SELECT COUNT(*) AS rows, COALESCE(SUM(octet_length(file_data)), 0) AS bytes,
+        pg_total_relation_size('course_files') AS table_bytes
+        FROM course_files WHERE file_data IS NOT NULL"""
+    )
+    row = cur.fetchone()
+    return {'rows': row['rows'], 'bytes': int(row['bytes']), 'table_bytes': row['table_bytes']}
+
+def stream_to_storage(s3, cur, course_file_id: int, file_key: str, file_size: int, file_type: str) -> None:
+    '''Copy file_data to the bucket in STREAM_CHUNK_SIZE slices, so a large blob never sits in memory whole'''
+    def read_chunk(offset: int) -> bytes:
+        cur.execute(
+            "SELECT substring(file_data FROM %s FOR %s) AS chunk FROM course_files WHERE id = %s",
+            (offset + 1, STREAM_CHUNK_SIZE, course_file_id)
+        )
+        return bytes(cur.fetchone()['chunk'])
+    
+    if file_size <= STREAM_CHUNK_SIZE:
+        s3.put_object(Bucket=BUCKET_NAME, Key=file_key, Body=read_chunk(0), ContentType=file_type)
+        return
+    
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET_NAME, Key=file_key, ContentType=file_type)['UploadId']
+    try:
+        parts = []
+        for part_number, offset in enumerate(range(0, file_size, STREAM_CHUNK_SIZE), start=1):
+            result = s3.upload_part(
+                Bucket=BUCKET_NAME, Key=file_key, UploadId=upload_id,
+                PartNumber=part_number, Body=read_chunk(offset)
+            )
+            parts.append({'PartNumber': part_number, 'ETag': result['ETag']})
+        s3.complete_multipart_upload(Bucket=BUCKET_NAME, Key=file_key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=file_key, UploadId=upload_id)
+        raise
+
+def migrate_one(s3, conn, skip_ids: List[int]) -> Optional[Dict[str, Any]]:
+    '''Move the next row with inline bytes to object storage in its own transaction; None when nothing is left'''
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(
+            """SELECT id, file_name, file_type, octet_length(file_data) AS size, encode(sha256(file_data), 'hex') AS sha256
+            FROM course_files
+            WHERE file_data IS NOT NULL AND NOT (id = ANY(%s))
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED""",
+            (skip_ids,)
+        )
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return None
+        
+        try:
+            blob = reference_blob(cur, row['sha256'], row['size'])
+            deduplicated = blob is not None
+            if not blob:
+                file_key = blob_key(row['sha256'], row['file_name'])
+                stream_to_storage(s3, cur, row['id'], file_key, row['size'], row['file_type'])
+                blob = register_blob(cur, row['sha256'], file_key, row['size'], row['file_type'])
+        except Exception as e:
+            # Объект, успевший попасть в бакет, уберёт storage-gc по истечении grace-периода
+            conn.rollback()
+            print(f"[FILE DATA] course file {row['id']} failed: {e}")
+            return {'id': row['id'], 'error': str(e)}
+        
+        cur.execute(
+            "UPDATE course_files SET file_url = %s, file_size = %s, blob_sha256 = %s, file_data = NULL WHERE id = %s",
+            (object_url(blob['file_key']), row['size'], row['sha256'], row['id'])
+        )
+        cur.execute("UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+        conn.commit()
+        print(f"[FILE DATA] course file {row['id']}: {row['size']} bytes -> {blob['file_key']}{' (deduplicated)' if deduplicated else ''}")
+        return {'id': row['id'], 'bytes': row['size'], 'deduplicated': deduplicated}
+
+def run_migration(dry_run: bool) -> Dict[str, Any]:
+    '''Move inline file_data to object storage until the row, byte or time budget of this run is spent'''
+    max_rows = int(os.environ.get('FILE_DATA_MIGRATION_MAX_ROWS', '20'))
+    max_bytes = int(os.environ.get('FILE_DATA_MIGRATION_MAX_BYTES', str(512 * 1024 * 1024)))
+    time_budget = float(os.environ.get('FILE_DATA_MIGRATION_TIME_BUDGET_SECONDS', '45'))
+    pause = float(os.environ.get('FILE_DATA_MIGRATION_PAUSE_MS', '200')) / 1000
+    started = time.monotonic()
+    report: Dict[str, Any] = {'dryRun': dry_run, 'migrated': 0, 'deduplicated': 0, 'bytesMoved': 0, 'errors': []}
+    failed_ids: List[int] = []
+    
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if not file_data_column_exists(cur):
+                conn.rollback()
+                return {**report, 'done': True, 'columnDropped': True}
+            before = inline_data_stats(cur)
+        conn.rollback()
+        report.update({'rowsBefore': before['rows'], 'inlineBytesBefore': before['bytes'], 'tableBytesBefore': before['table_bytes']})
+        
+        if not dry_run:
+            s3 = get_client()
+            while report['migrated'] < max_rows and report['bytesMoved'] < max_bytes and time.monotonic() - started < time_budget:
+                moved = migrate_one(s3, conn, failed_ids)
+                if moved is None:
+                    break
+                if 'error' in moved:
+                    failed_ids.append(moved['id'])
+                    report['errors'].append(f"course file {moved['id']}: {moved['error']}")
+                    continue
+                report['migrated'] += 1
+                report['deduplicated'] += int(moved['deduplicated'])
+                report['bytesMoved'] += moved['bytes']
+                time.sleep(pause)
+        
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            after = inline_data_stats(cur)
+        conn.rollback()
+    finally:
+        release_connection(conn)
+    
+    report.update({
+        'rowsRemaining': after['rows'],
+        'inlineBytesRemaining': after['bytes'],
+        'tableBytesAfter': after['table_bytes'],
+        'done': after['rows'] == 0
+    })
+    print(f"[FILE DATA] {json.dumps(report)}")
+    return report
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Move course file bytes stored inline in course_files.file_data (BYTEA) to object storage
+    Args: event with httpMethod, queryStringParameters (dry_run); context with request_id
+    Returns: HTTP response with rows and bytes moved, what is left and the course_files table size
+    
+    GET (scheduled, cron.txt) migrates rows one transaction at a time: the hash is computed in
+    Postgres, known content only gets a new file_blobs reference, new content is streamed to the
+    bucket in slices, then file_url is rewritten and file_data set to NULL. Each run stops at
+    FILE_DATA_MIGRATION_MAX_ROWS, FILE_DATA_MIGRATION_MAX_BYTES or the time budget and pauses
+    FILE_DATA_MIGRATION_PAUSE_MS between rows. GET ?dry_run=true only reports what is left.
+    Every run must come from the timer trigger, carry X-Cron-Secret equal to CRON_SECRET, or
+    carry an admin X-Auth-Token. Table space held by the nulled values is returned by VACUUM;
+    the column itself is dropped by a later migration, shipped once a run reports rowsRemaining 0.
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method != 'GET':
+        return json_response(405, {'error': 'Method not allowed'})
+    
+    if not verify_maintenance(event):
+        return json_response(401, {'error': 'Unauthorized'})
+    
+    query_params = event.get('queryStringParameters') or {}
+    dry_run = str(query_params.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    if not os.environ.get('DATABASE_URL') or not is_configured():
+        return json_response(500, {'error': 'Database or S3 credentials not configured'})
+    
+    try:
+        report = run_migration(dry_run)
+    except Exception as e:
+        print(f"[FILE DATA] Failed: {e}")
+        return json_response(500, {'error': f'File data migration failed: {str(e)}'})
+    
+    return json_response(200, {'success': True, **report})
@@ -6,8 +6,8 @@ Returns: HTTP response dict
 import json
 import os
 from typing import Dict, Any
-import psycopg2
 from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
 import requests
 from datetime import datetime, timedelta
 
@@ -49,25 +49,26 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'DATABASE_URL not configured'})
         }
     
-    conn = psycopg2.connect(dsn)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
     tomorrow = datetime.now() + timedelta(days=1)
     day_after = tomorrow + timedelta(days=1)
     
-    cursor.execute(f"""
-        SELECT id, client_name, telegram_username, access_end
-        FROM chat_access
-        WHERE is_active = true 
-        AND access_end >= '{tomorrow.strftime('%Y-%m-%d %H:%M:%S')}' 
-        AND access_end < '{day_after.strftime('%Y-%m-%d %H:%M:%S')}'
-        AND telegram_username IS NOT NULL
-        AND telegram_username != ''
-    """)
-    
-    clients = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"""
+            SELECT id, client_name, telegram_username, access_end
+            FROM chat_access
+            WHERE is_active = true 
+            AND access_end >= '{tomorrow.strftime('%Y-%m-%d %H:%M:%S')}' 
+            AND access_end < '{day_after.strftime('%Y-%m-%d %H:%M:%S')}'
+            AND telegram_username IS NOT NULL
+            AND telegram_username != ''
+        """)
+        
+        clients = cursor.fetchall()
+        cursor.close()
+    finally:
+        release_connection(conn)
     
     notifications_sent = 0
     notifications_failed = 0
@@ -0,0 +1,94 @@
+'''
+Business: Chat access tokens for chat-bankrot.ru, issued in-process or by an external chat backend
+Args: email and amount of the purchase; optional CHAT_REGISTER_URL, CHAT_REGISTER_API_KEY, CHAT_REGISTER_TIMEOUT,
+      CHAT_BREAKER_FAILURES, CHAT_BREAKER_COOLDOWN_SECONDS
+Returns: issue_chat_access -> {'token', 'expires_at', 'chat_url'}
+
+The same file is copied into every backend function that issues chat tokens.
+Keep the copies identical.
+
+Tokens are a pure function of the purchase, so by default they are generated right here.
+CHAT_REGISTER_URL is only for a chat backend that keeps its own registry: that call goes through
+a circuit breaker, which after CHAT_BREAKER_FAILURES consecutive failures rejects calls for
+CHAT_BREAKER_COOLDOWN_SECONDS instead of letting every fulfillment wait for the timeout; the
+first call after the cooldown is a probe, and one more failure opens the circuit again.
+'''
+
+import os
+import json
+import time
+import string
+import secrets
+import threading
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any
+
+CHAT_TOKEN_TTL_DAYS = 30
+CHAT_URL = 'https://chat-bankrot.ru/?token={token}'
+
+_breaker_lock = threading.Lock()
+_breaker: Dict[str, float] = {'failures': 0, 'open_until': 0.0}
+
+class ChatBackendUnavailable(Exception):
+    '''External chat backend failed or the circuit breaker is open; the caller should retry later'''
+
+def generate_custom_token(email: str, amount: float) -> str:
+    '''Generate custom token format: {random}_manual_combo_{date}_{email_part}'''
+    random_part = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(10))
+    date_part = datetime.utcnow().strftime('%b%d')
+    email_part = email.split('@')[0].replace('.', '').replace('-', '')[:8] if '@' in email else 'user'
+    token = f"{random_part}_manual_combo_{date_part}_{email_part}"
+    return token
+
+def issue_chat_token(email: str, amount: float) -> Dict[str, Any]:
+    token = generate_custom_token(email, amount)
+    return {
+        'token': token,
+        'expires_at': datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=CHAT_TOKEN_TTL_DAYS),
+        'chat_url': CHAT_URL.format(token=token)
+    }
+
+def _call_external_backend(url: str, email: str, amount: float) -> Dict[str, Any]:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({'email': email, 'amount': amount}).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'X-Api-Key': os.environ.get('CHAT_REGISTER_API_KEY', '')},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=float(os.environ.get('CHAT_REGISTER_TIMEOUT', '3'))) as response:
+        data = json.loads(response.read().decode('utf-8'))
+    
+    if not data.get('token') or not data.get('expires_at'):
+        raise ValueError('response missing token or expires_at')
+    return {
+        'token': data['token'],
+        'expires_at': datetime.fromisoformat(data['expires_at'].replace('Z', '+00:00')),
+        'chat_url': data.get('chat_url') or CHAT_URL.format(token=data['token'])
+    }
+
+def register_with_external_backend(url: str, email: str, amount: float) -> Dict[str, Any]:
+    '''Register the purchase with an external chat backend behind the circuit breaker'''
+    with _breaker_lock:
+        if _breaker['open_until'] > time.monotonic():
+            raise ChatBackendUnavailable('circuit open after repeated chat backend failures')
+    
+    try:
+        result = _call_external_backend(url, email, amount)
+    except Exception as e:
+        with _breaker_lock:
+            _breaker['failures'] += 1
+            if _breaker['failures'] >= int(os.environ.get('CHAT_BREAKER_FAILURES', '3')):
+                _breaker['open_until'] = time.monotonic() + float(os.environ.get('CHAT_BREAKER_COOLDOWN_SECONDS', '60'))
+        raise ChatBackendUnavailable(f'{type(e).__name__}: {e}') from e
+    
+    with _breaker_lock:
+        _breaker['failures'] = 0
+    return result
+
+def issue_chat_access(email: str, amount: float) -> Dict[str, Any]:
+    '''Token for a chat or combo purchase: external backend when CHAT_REGISTER_URL is set, otherwise local'''
+    url = os.environ.get('CHAT_REGISTER_URL')
+    if url:
+        return register_with_external_backend(url, email, amount)
+    return issue_chat_token(email, amount)
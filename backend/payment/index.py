@@ -1,7 +1,23 @@
 '''
-Business: Payment API - create payments via YooKassa, handle webhooks
+Business: Payment API - create payments via YooKassa, handle webhooks, run the fulfillment worker
 Args: event with httpMethod, body, headers; context with request_id
-Returns: Payment creation response or webhook processing status
+Returns: Payment creation response, webhook processing status or worker batch summary
+
+The webhook only completes the purchase and queues a fulfillment_jobs row, then answers 200.
+Emails, chat registration and admin notification run in the fulfillment worker: the scheduler
+(cron.txt) invokes the function every minute with a bare GET, which claims a batch of ready jobs;
+failed jobs are retried with exponential backoff. ?action=worker runs a batch on demand.
+Scheduled runs, ?action=worker and ?action=reconcile are refused unless the call comes from the timer
+trigger, carries X-Cron-Secret equal to CRON_SECRET, or carries an admin X-Auth-Token.
+Admin notifications are written to admin_notifications and mailed as an hourly digest by the
+admin-notify function; payments of at least ADMIN_NOTIFY_IMMEDIATE_AMOUNT (default 10000) and jobs
+that ran out of retries are also mailed to ADMIN_EMAIL right away.
+
+?action=status answers from user_purchases and asks YooKassa only for purchases still pending after
+PAYMENT_STATUS_UPSTREAM_AFTER seconds (default 60). Pass wait=N (up to 25) to long-poll for the webhook.
+Reconciliation settles stale pending purchases: fulfills succeeded payments, marks canceled ones and
+expires purchases still unpaid after RECONCILE_EXPIRE_AFTER_HOURS. The scheduled run starts it every
+RECONCILE_INTERVAL_MINUTES (default 60, on the minute count divisible by it); ?action=reconcile runs it now.
 
 CRITICAL SETUP REQUIRED:
 1. Go to yookassa.ru personal cabinet
@@ -14,20 +30,470 @@ Without this setup, webhooks will NOT work and users will NOT receive access aft
 
 import json
 import os
-import base64
-from typing import Dict, Any
-import psycopg2
+import hmac
+from typing import Dict, Any, List, Optional
 from psycopg2.extras import RealDictCursor
-import requests
+from db import get_connection, release_connection, pool_stats
+from magic_link import create_login_link
+from chat_tokens import issue_chat_access
+import yookassa_client
 from datetime import datetime, timedelta
 import uuid
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import bcrypt
+import time
+import threading
+
+FULFILLMENT_BATCH_SIZE = 10
+FULFILLMENT_LOCK_TIMEOUT = '10 minutes'
+STATUS_MAX_WAIT_SECONDS = 25
+STATUS_POLL_INTERVAL_SECONDS = 1
+RECONCILE_PAGE_SIZE = 50
+RECONCILE_MAX_CONCURRENCY = 8
+ADMIN_NOTIFY_IMMEDIATE_EVENTS = ('fulfillment_failed',)
+MAINTENANCE_ACTIONS = ('scheduled', 'worker', 'reconcile')
+
+def verify_admin(headers: Dict[str, str]) -> bool:
+    import jwt
+    
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    jwt_secret = os.environ.get('JWT_SECRET')
+    if not auth_token or not jwt_secret:
+        return False
+    
+    try:
+        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return False
+    return bool(payload.get('is_admin'))
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+def verify_maintenance(event: Dict[str, Any]) -> bool:
+    '''Allow a maintenance run from the timer trigger, with X-Cron-Secret matching CRON_SECRET, or with an admin token'''
+    # Таймер-триггер вызывает функцию без HTTP-обёртки, поэтому HTTP-запрос не может выдать себя за него
+    if 'httpMethod' not in event:
+        return True
+    
+    headers = event.get('headers') or {}
+    cron_secret = os.environ.get('CRON_SECRET')
+    provided = headers.get('X-Cron-Secret') or headers.get('x-cron-secret')
+    if cron_secret and provided and hmac.compare_digest(provided.encode('utf-8'), cron_secret.encode('utf-8')):
+        return True
+    return verify_admin(headers)
+
+def refresh_user_entitlement(cur, user_id: int, product: str) -> None:
+    '''Recompute one user_entitlements row from purchases and chat access; call inside the write transaction'''
+    cur.execute("DELETE FROM user_entitlements WHERE user_id = %s AND product = %s", (user_id, product))
+    cur.execute(
+        "INSERT INTO user_entitlements (user_id, product, expires_at) SELECT user_id, product, expires_at FROM user_entitlement_sources WHERE user_id = %s AND product = %s",
+        (user_id, product)
+    )
+
+def provision_account(cur, email: str, full_name: Optional[str]) -> int:
+    '''Find or create the buyer's account at payment time; new accounts get no password until the user sets one'''
+    cur.execute(
+        """INSERT INTO users (email, full_name, is_admin) VALUES (%s, %s, false)
+        ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+        RETURNING id""",
+        (email, full_name or 'Клиент')
+    )
+    return cur.fetchone()['id']
+
+def complete_purchase(cur, payment_id: str) -> Optional[Dict[str, Any]]:
+    '''Move a pending purchase to paid, creating the account if needed; returns user_id and product_type, None if it is no longer pending'''
+    cur.execute(
+        "SELECT id, user_id, customer_email, customer_name, product_type, fulfillment_state FROM user_purchases WHERE payment_id = %s ORDER BY id LIMIT 1 FOR UPDATE",
+        (payment_id,)
+    )
+    current_purchase = cur.fetchone()
+    if not current_purchase:
+        raise LookupError(f"No purchase for payment {payment_id}")
+    if current_purchase['fulfillment_state'] != 'pending':
+        return None
+    
+    user_id = current_purchase['user_id']
+    if user_id is None:
+        user_id = provision_account(cur, current_purchase['customer_email'], current_purchase['customer_name'])
+        cur.execute(
+            "UPDATE user_purchases SET user_id = %s WHERE id = %s",
+            (user_id, current_purchase['id'])
+        )
+        print(f"[FULFILLMENT] Account {user_id} provisioned for {current_purchase['customer_email']}")
+    
+    current_product_type = current_purchase['product_type'] or 'course'
+    
+    cur.execute(
+        "SELECT id, expires_at FROM user_purchases WHERE user_id = %s AND payment_status = 'completed' AND product_type = %s ORDER BY expires_at DESC LIMIT 1",
+        (user_id, current_product_type)
+    )
+    existing_purchase = cur.fetchone()
+    
+    if existing_purchase and existing_purchase['expires_at']:
+        if current_product_type == 'course':
+            extension_days = 180
+        elif current_product_type == 'chat':
+            extension_days = 30
+        elif current_product_type == 'combo':
+            extension_days = 180
+        else:
+            extension_days = 180
+        
+        if existing_purchase['expires_at'] > datetime.now():
+            new_expires_at = existing_purchase['expires_at'] + timedelta(days=extension_days)
+        else:
+            new_expires_at = datetime.now() + timedelta(days=extension_days)
+        
+        cur.execute(
+            "UPDATE user_purchases SET payment_status = %s, fulfillment_state = %s, expires_at = %s WHERE id = %s",
+            ('completed', 'paid', new_expires_at, current_purchase['id'])
+        )
+    else:
+        cur.execute(
+            "UPDATE user_purchases SET payment_status = %s, fulfillment_state = %s WHERE id = %s",
+            ('completed', 'paid', current_purchase['id'])
+        )
+    
+    refresh_user_entitlement(cur, user_id, current_product_type)
+    return {'user_id': user_id, 'product_type': current_product_type}
+
+def enqueue_fulfillment(cur, payment_id: str, user_id: int, product_type: str, amount: float) -> None:
+    '''Queue post-payment side effects; call in the same transaction that completes the purchase'''
+    cur.execute(
+        "INSERT INTO fulfillment_jobs (payment_id, user_id, product_type, amount) VALUES (%s, %s, %s, %s)",
+        (payment_id, user_id, product_type, amount)
+    )
+
+def record_payment_event(cur, payment_id: str, event_type: str, source: str) -> bool:
+    '''Insert into the processed-events ledger; False means this event was already handled'''
+    cur.execute(
+        "INSERT INTO payment_events (payment_id, event_type, source) VALUES (%s, %s, %s) ON CONFLICT (payment_id, event_type) DO NOTHING RETURNING payment_id",
+        (payment_id, event_type, source)
+    )
+    return cur.fetchone() is not None
+
+def fulfill_payment(cur, payment_id: str, amount: float, source: str) -> str:
+    '''Complete the purchase and queue side effects exactly once per payment; returns 'queued', 'duplicate' or 'unknown' when no purchase matches'''
+    cur.execute("SAVEPOINT fulfill_payment")
+    if not record_payment_event(cur, payment_id, 'payment.succeeded', source):
+        return 'duplicate'
+    
+    try:
+        purchase = complete_purchase(cur, payment_id)
+    except LookupError as e:
+        # Событие не записываем: повторная доставка или сверка выдадут доступ, когда покупка найдётся
+        cur.execute("ROLLBACK TO SAVEPOINT fulfill_payment")
+        print(f"[FULFILLMENT] {e} (via {source}), event not recorded")
+        return 'unknown'
+    if not purchase:
+        return 'duplicate'
+    
+    cur.execute(
+        "UPDATE payment_events SET user_id = %s WHERE payment_id = %s AND event_type = 'payment.succeeded'",
+        (purchase['user_id'], payment_id)
+    )
+    enqueue_fulfillment(cur, payment_id, purchase['user_id'], purchase['product_type'], amount)
+    return 'queued'
+
+def claim_fulfillment_jobs(limit: int) -> List[Dict[str, Any]]:
+    '''Lock ready jobs with SKIP LOCKED so concurrent workers never pick the same job'''
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"""UPDATE fulfillment_jobs
+                SET status = 'processing', attempts = attempts + 1,
+                    locked_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM fulfillment_jobs
+                    WHERE (status = 'pending' AND run_after <= CURRENT_TIMESTAMP)
+                       OR (status = 'processing' AND locked_at < CURRENT_TIMESTAMP - INTERVAL '{FULFILLMENT_LOCK_TIMEOUT}')
+                    ORDER BY run_after
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, payment_id, user_id, product_type, amount, attempts, max_attempts, steps""",
+                (limit,)
+            )
+            jobs = cur.fetchall()
+            conn.commit()
+    finally:
+        release_connection(conn)
+    return jobs
+
+def finish_fulfillment_job(job_id: int, error: Optional[str] = None) -> str:
+    '''Mark a job done, or schedule a retry with exponential backoff until max_attempts is reached'''
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if error is None:
+                cur.execute(
+                    "UPDATE fulfillment_jobs SET status = 'done', locked_at = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING status",
+                    (job_id,)
+                )
+            else:
+                cur.execute(
+                    """UPDATE fulfillment_jobs
+                    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                        run_after = CURRENT_TIMESTAMP + LEAST(INTERVAL '30 seconds' * POWER(2, attempts - 1), INTERVAL '1 hour'),
+                        locked_at = NULL, last_error = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING status, payment_id, amount, attempts""",
+                    (error, job_id)
+                )
+            job = cur.fetchone()
+            status = job['status']
+            if status == 'failed':
+                queue_admin_notification(
+                    cur, 'fulfillment_failed', job['payment_id'],
+                    subject='Не удалось выдать доступ после оплаты',
+                    message=f"Оплата {job['payment_id']} не обработана после {job['attempts']} попыток, нужна ручная проверка",
+                    data={'payment_id': job['payment_id'], 'amount': float(job['amount']), 'last_error': error}
+                )
+            conn.commit()
+    finally:
+        release_connection(conn)
+    return status
+
+def provision_purchase(cur, job: Dict[str, Any], purchase: Dict[str, Any]) -> None:
+    '''paid -> provisioned: issue the chat token for chat and combo purchases'''
+    if job['product_type'] not in ['chat', 'combo']:
+        return
+    
+    chat_token_data = issue_chat_access(purchase['email'], float(job['amount']))
+    print(f"[WORKER] Issued chat token for {purchase['email']}")
+    
+    save_external_chat_token(
+        cur,
+        user_id=job['user_id'],
+        user_email=purchase['email'],
+        token=chat_token_data['token'],
+        expires_at=chat_token_data['expires_at'],
+        product_type=job['product_type']
+    )
+    cur.execute(
+        "UPDATE fulfillment_jobs SET steps = steps || jsonb_build_object('chat_token', %s::jsonb), updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+        (json.dumps({'token': chat_token_data['token'], 'expires_at': chat_token_data['expires_at'].isoformat()}), job['id'])
+    )
+    job['steps']['chat_token'] = {'token': chat_token_data['token'], 'expires_at': chat_token_data['expires_at'].isoformat()}
+
+def notify_purchase(cur, job: Dict[str, Any], purchase: Dict[str, Any]) -> None:
+    '''provisioned -> notified: email the one-time login link, then queue the admin notification'''
+    chat_token_data = None
+    if 'chat_token' in job['steps']:
+        chat_token_data = {
+            'token': job['steps']['chat_token']['token'],
+            'expires_at': datetime.fromisoformat(job['steps']['chat_token']['expires_at'])
+        }
+    
+    if job['product_type'] in ['course', 'combo']:
+        print(f"[WORKER] Sending course login link to {purchase['email']}")
+        send_course_credentials_email(
+            user_email=purchase['email'],
+            user_name=purchase['full_name'],
+            login_link=create_login_link(job['user_id']),
+            product_type=job['product_type'],
+            chat_token_data=chat_token_data
+        )
+    
+    queue_admin_notification(
+        cur, 'payment', job['payment_id'],
+        subject='Новая оплата курса',
+        message=f"Клиент {purchase['full_name']} успешно оплатил курс",
+        data={
+            'email': purchase['email'],
+            'name': purchase['full_name'],
+            'product_type': job['product_type'],
+            'amount': float(job['amount']),
+            'payment_id': job['payment_id'],
+            'timestamp': datetime.now().isoformat()
+        },
+        amount=float(job['amount'])
+    )
+
+FULFILLMENT_TRANSITIONS = {
+    'paid': ('provisioned', provision_purchase),
+    'provisioned': ('notified', notify_purchase)
+}
+
+def run_fulfillment_job(job: Dict[str, Any]) -> None:
+    '''Advance the purchase through paid -> provisioned -> notified, one locked transaction per transition'''
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            while True:
+                cur.execute(
+                    """SELECT up.id, up.fulfillment_state, u.email, u.full_name
+                    FROM user_purchases up
+                    JOIN users u ON u.id = up.user_id
+                    WHERE up.payment_id = %s AND up.user_id = %s
+                    FOR UPDATE OF up""",
+                    (job['payment_id'], job['user_id'])
+                )
+                purchase = cur.fetchone()
+                if not purchase:
+                    raise ValueError(f"Purchase for payment {job['payment_id']} not found")
+                
+                transition = FULFILLMENT_TRANSITIONS.get(purchase['fulfillment_state'])
+                if not transition:
+                    conn.rollback()
+                    return
+                
+                next_state, step = transition
+                step(cur, job, purchase)
+                cur.execute(
+                    "UPDATE user_purchases SET fulfillment_state = %s WHERE id = %s",
+                    (next_state, purchase['id'])
+                )
+                conn.commit()
+                print(f"[WORKER] Payment {job['payment_id']}: {purchase['fulfillment_state']} -> {next_state}")
+    finally:
+        release_connection(conn)
+
+def process_fulfillment_jobs(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Worker entry point, called by the scheduler: claim a batch of ready jobs and run them'''
+    params = event.get('queryStringParameters') or {}
+    limit = min(int(params.get('limit', FULFILLMENT_BATCH_SIZE)), 50)
+    
+    jobs = claim_fulfillment_jobs(limit)
+    results = {'done': 0, 'pending': 0, 'failed': 0}
+    
+    for job in jobs:
+        try:
+            run_fulfillment_job(job)
+            status = finish_fulfillment_job(job['id'])
+        except Exception as e:
+            print(f"[WORKER] Job {job['id']} for payment {job['payment_id']} failed on attempt {job['attempts']}: {e}")
+            status = finish_fulfillment_job(job['id'], f'{type(e).__name__}: {e}')
+        results[status] += 1
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'claimed': len(jobs), **results})
+    }
+
+def query_payment_statuses(payment_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    '''Fetch payments from YooKassa concurrently, starting at most RECONCILE_RATE requests per second'''
+    from concurrent.futures import ThreadPoolExecutor
+    
+    concurrency = min(int(os.environ.get('RECONCILE_CONCURRENCY', '4')), RECONCILE_MAX_CONCURRENCY)
+    interval = 1 / float(os.environ.get('RECONCILE_RATE', '5'))
+    limiter_lock = threading.Lock()
+    next_slot = [time.monotonic()]
+    
+    def fetch(payment_id: str) -> Optional[Dict[str, Any]]:
+        with limiter_lock:
+            now = time.monotonic()
+            delay = max(next_slot[0] - now, 0)
+            next_slot[0] = max(next_slot[0], now) + interval
+        if delay:
+            time.sleep(delay)
+        
+        try:
+            response = yookassa_client.get_payment(payment_id)
+        except yookassa_client.YooKassaUnavailable as e:
+            print(f"[RECONCILE] YooKassa unavailable for {payment_id}: {e}")
+            return None
+        
+        if response.status_code == 404:
+            return {'status': 'not_found'}
+        if response.status_code != 200:
+            print(f"[RECONCILE] YooKassa returned {response.status_code} for {payment_id}")
+            return None
+        return response.json()
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(zip(payment_ids, pool.map(fetch, payment_ids)))
+
+def reconcile_pending_purchases(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Scheduled job: settle stale pending purchases against YooKassa page by page within a time budget'''
+    min_age_minutes = int(os.environ.get('RECONCILE_MIN_AGE_MINUTES', '15'))
+    expire_after_hours = float(os.environ.get('RECONCILE_EXPIRE_AFTER_HOURS', '24'))
+    time_budget = float(os.environ.get('RECONCILE_TIME_BUDGET', '20'))
+    
+    started = time.monotonic()
+    last_id = 0
+    results = {'checked': 0, 'fulfilled': 0, 'canceled': 0, 'expired': 0, 'still_pending': 0, 'errors': 0}
+    
+    while time.monotonic() - started < time_budget:
+        conn = get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """SELECT id, payment_id, amount,
+                        EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - purchase_date) / 3600 AS age_hours
+                    FROM user_purchases
+                    WHERE payment_status = 'pending'
+                      AND payment_id IS NOT NULL
+                      AND purchase_date < CURRENT_TIMESTAMP - make_interval(mins => %s)
+                      AND id > %s
+                    ORDER BY id
+                    LIMIT %s""",
+                    (min_age_minutes, last_id, RECONCILE_PAGE_SIZE)
+                )
+                page = cur.fetchall()
+        finally:
+            release_connection(conn)
+        
+        if not page:
+            break
+        last_id = page[-1]['id']
+        
+        statuses = query_payment_statuses([purchase['payment_id'] for purchase in page])
+        
+        conn = get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                for purchase in page:
+                    results['checked'] += 1
+                    payment_data = statuses[purchase['payment_id']]
+                    if payment_data is None:
+                        results['errors'] += 1
+                        continue
+                    
+                    status = payment_data.get('status')
+                    if status == 'succeeded':
+                        amount_value = float(payment_data.get('amount', {}).get('value', purchase['amount']))
+                        if fulfill_payment(cur, purchase['payment_id'], amount_value, 'reconcile') == 'queued':
+                            results['fulfilled'] += 1
+                    elif status == 'canceled':
+                        cur.execute(
+                            "UPDATE user_purchases SET payment_status = 'canceled' WHERE id = %s AND payment_status = 'pending'",
+                            (purchase['id'],)
+                        )
+                        results['canceled'] += 1
+                    elif float(purchase['age_hours']) >= expire_after_hours:
+                        cur.execute(
+                            "UPDATE user_purchases SET payment_status = 'expired' WHERE id = %s AND payment_status = 'pending'",
+                            (purchase['id'],)
+                        )
+                        results['expired'] += 1
+                    else:
+                        results['still_pending'] += 1
+                conn.commit()
+        finally:
+            release_connection(conn)
+    
+    print(f"[RECONCILE] {json.dumps(results)} in {time.monotonic() - started:.1f}s")
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({**results, 'yookassa': yookassa_client.client_stats(), 'db': pool_stats()})
+    }
+
+def reconcile_due() -> bool:
+    interval = max(int(os.environ.get('RECONCILE_INTERVAL_MINUTES', '60')), 1)
+    return int(time.time() // 60) % interval == 0
+
+def run_scheduled_tasks(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Cron entry point, every minute: reconciliation when it is due, then a fulfillment batch that picks up its jobs'''
+    result = {'reconcile': None}
+    if reconcile_due():
+        result['reconcile'] = json.loads(reconcile_pending_purchases(event, headers)['body'])
+    result['worker'] = json.loads(process_fulfillment_jobs(event, headers)['body'])
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result)
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -51,7 +517,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     try:
         params = event.get('queryStringParameters') or {}
-        action = params.get('action', 'create')
+        action = params.get('action') or ('scheduled' if method == 'GET' else 'create')
+        
+        if action in MAINTENANCE_ACTIONS and not verify_maintenance(event):
+            return {
+                'statusCode': 401,
+                'headers': headers_out,
+                'body': json.dumps({'error': 'Unauthorized'})
+            }
         
         if action == 'create':
             return create_payment(event, headers_out)
@@ -59,6 +532,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return handle_webhook(event, headers_out)
         elif action == 'status':
             return check_payment_status(event, headers_out)
+        elif action == 'scheduled':
+            return run_scheduled_tasks(event, headers_out)
+        elif action == 'worker':
+            return process_fulfillment_jobs(event, headers_out)
+        elif action == 'reconcile':
+            return reconcile_pending_purchases(event, headers_out)
         
         return {
             'statusCode': 400,
@@ -78,6 +557,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
 
+def find_purchase_by_idempotency_key(cur, idempotency_key: str) -> Optional[Dict[str, Any]]:
+    cur.execute(
+        "SELECT id, payment_id, payment_status, confirmation_url FROM user_purchases WHERE idempotency_key = %s",
+        (idempotency_key,)
+    )
+    return cur.fetchone()
+
+def stored_payment_response(purchase: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    '''Answer a repeated create with the purchase stored by the first request, without calling YooKassa'''
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'payment_id': purchase['payment_id'],
+            'purchase_id': purchase['id'],
+            'confirmation_url': purchase['confirmation_url'],
+            'status': 'succeeded' if purchase['payment_status'] == 'completed' else purchase['payment_status'],
+            'replayed': True
+        })
+    }
+
 def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
     body_data = json.loads(event.get('body', '{}'))
     user_id = body_data.get('user_id')
@@ -86,6 +586,7 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
     full_name = body_data.get('name', 'Клиент')
     return_url = body_data.get('return_url', '')
     product_type = body_data.get('product_type', 'course')
+    idempotency_key = body_data.get('idempotency_key')
     
     if not email:
         return {
@@ -94,36 +595,37 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
             'body': json.dumps({'error': 'email is required'})
         }
     
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            if not user_id:
+    if idempotency_key is not None and (not isinstance(idempotency_key, str) or not 0 < len(idempotency_key) <= 64):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'idempotency_key must be a string of 1-64 characters'})
+        }
+    
+    if idempotency_key:
+        conn = get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                existing = find_purchase_by_idempotency_key(cur, idempotency_key)
+        finally:
+            release_connection(conn)
+        
+        if existing:
+            print(f"Repeated create for idempotency key {idempotency_key}, returning payment {existing['payment_id']}")
+            return stored_payment_response(existing, headers)
+    
+    if not user_id:
+        conn = get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
                     "SELECT id FROM users WHERE email = %s",
                     (email,)
                 )
                 existing_user = cur.fetchone()
-                
-                if existing_user:
-                    user_id = existing_user['id']
-                else:
-                    password = str(uuid.uuid4())[:8]
-                    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                    cur.execute(
-                        "INSERT INTO users (email, password_hash, full_name, is_admin) VALUES (%s, %s, %s, false) RETURNING id",
-                        (email, password_hash, full_name)
-                    )
-                    user_id = cur.fetchone()['id']
-                    conn.commit()
-    finally:
-        conn.close()
-    
-    if not user_id:
-        return {
-            'statusCode': 400,
-            'headers': headers,
-            'body': json.dumps({'error': 'Failed to create/find user'})
-        }
+                user_id = existing_user['id'] if existing_user else None
+        finally:
+            release_connection(conn)
     
     shop_id = os.environ.get('YUKASSA_SHOP_ID')
     secret_key = os.environ.get('YUKASSA_SECRET_KEY')
@@ -135,10 +637,7 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
             'body': json.dumps({'error': 'Payment credentials not configured'})
         }
     
-    idempotence_key = str(uuid.uuid4())
-    
-    auth_string = f"{shop_id}:{secret_key}"
-    auth_encoded = base64.b64encode(auth_string.encode()).decode()
+    idempotence_key = idempotency_key or str(uuid.uuid4())
     
     payment_data = {
         "amount": {
@@ -152,12 +651,14 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
         "capture": True,
         "description": "Оплата курса 'Банкротство физических лиц'",
         "metadata": {
-            "user_id": str(user_id),
             "email": email,
             "product_type": product_type
         }
     }
     
+    if user_id:
+        payment_data["metadata"]["user_id"] = str(user_id)
+    
     if email:
         payment_data["receipt"] = {
             "customer": {
@@ -179,15 +680,15 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
     print(f"Creating payment with YooKassa: shop_id={shop_id}, amount={amount}, email={email}")
     print(f"Payment data: {json.dumps(payment_data, ensure_ascii=False)}")
     
-    response = requests.post(
-        'https://api.yookassa.ru/v3/payments',
-        json=payment_data,
-        headers={
-            'Authorization': f'Basic {auth_encoded}',
-            'Idempotence-Key': idempotence_key,
-            'Content-Type': 'application/json'
+    try:
+        response = yookassa_client.create_payment(payment_data, idempotence_key)
+    except yookassa_client.YooKassaUnavailable as e:
+        print(f"YooKassa unavailable: {e}")
+        return {
+            'statusCode': 504,
+            'headers': headers,
+            'body': json.dumps({'error': 'Payment provider is not responding, try again later'})
         }
-    )
     
     print(f"YooKassa response status: {response.status_code}")
     print(f"YooKassa response body: {response.text}")
@@ -221,17 +722,25 @@ def create_payment(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
     else:
         expires_interval = "6 months"
     
-    conn = get_db_connection()
+    conn = get_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                f"INSERT INTO user_purchases (user_id, amount, payment_status, payment_id, product_type, expires_at) VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP + INTERVAL '{expires_interval}') RETURNING id",
-                (user_id, amount, 'pending', payment_response['id'], product_type)
+                f"""INSERT INTO user_purchases (user_id, customer_email, customer_name, amount, payment_status, payment_id, product_type, expires_at, idempotency_key, confirmation_url)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP + INTERVAL '{expires_interval}', %s, %s)
+                ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                RETURNING id""",
+                (user_id, email, full_name, amount, 'pending', payment_response['id'], product_type, idempotency_key, payment_response['confirmation']['confirmation_url'])
             )
-            purchase_id = cur.fetchone()['id']
+            inserted = cur.fetchone()
+            existing = None if inserted else find_purchase_by_idempotency_key(cur, idempotency_key)
             conn.commit()
     finally:
-        conn.close()
+        release_connection(conn)
+    
+    if existing:
+        return stored_payment_response(existing, headers)
+    purchase_id = inserted['id']
     
     return {
         'statusCode': 200,
@@ -260,131 +769,62 @@ def handle_webhook(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str,
     
     payment = body_data.get('object', {})
     payment_id = payment.get('id')
-    user_id = payment.get('metadata', {}).get('user_id')
     
-    print(f"[WEBHOOK] Processing payment: payment_id={payment_id}, user_id={user_id}")
+    print(f"[WEBHOOK] Processing payment: payment_id={payment_id}")
     
-    if not payment_id or not user_id:
+    if not payment_id:
         return {
             'statusCode': 400,
             'headers': headers,
             'body': json.dumps({'error': 'Invalid webhook data'})
         }
     
-    conn = get_db_connection()
+    amount_value = float(payment.get('amount', {}).get('value', 0))
+    
+    conn = get_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT product_type FROM user_purchases WHERE payment_id = %s AND user_id = %s",
-                (payment_id, int(user_id))
-            )
-            current_purchase = cur.fetchone()
-            current_product_type = current_purchase['product_type'] if current_purchase else 'course'
-            
-            cur.execute(
-                "SELECT id, expires_at FROM user_purchases WHERE user_id = %s AND payment_status = 'completed' AND product_type = %s ORDER BY expires_at DESC LIMIT 1",
-                (int(user_id), current_product_type)
-            )
-            existing_purchase = cur.fetchone()
-            
-            if existing_purchase and existing_purchase['expires_at']:
-                if current_product_type == 'course':
-                    extension_days = 180
-                elif current_product_type == 'chat':
-                    extension_days = 30
-                elif current_product_type == 'combo':
-                    extension_days = 180
-                else:
-                    extension_days = 180
-                
-                if existing_purchase['expires_at'] > datetime.now():
-                    new_expires_at = existing_purchase['expires_at'] + timedelta(days=extension_days)
-                else:
-                    new_expires_at = datetime.now() + timedelta(days=extension_days)
-                
-                cur.execute(
-                    "UPDATE user_purchases SET payment_status = %s, expires_at = %s WHERE payment_id = %s AND user_id = %s",
-                    ('completed', new_expires_at, payment_id, int(user_id))
-                )
-            else:
-                cur.execute(
-                    "UPDATE user_purchases SET payment_status = %s WHERE payment_id = %s AND user_id = %s",
-                    ('completed', payment_id, int(user_id))
-                )
-            
+            fulfillment = fulfill_payment(cur, payment_id, amount_value, 'webhook')
             conn.commit()
-            
-            cur.execute(
-                "SELECT u.email, u.full_name FROM users u WHERE u.id = %s",
-                (int(user_id),)
-            )
-            user = cur.fetchone()
     finally:
-        conn.close()
+        release_connection(conn)
     
-    if user:
-        amount_value = float(payment.get('amount', {}).get('value', 0))
-        
-        send_admin_notification(
-            user_email=user['email'],
-            user_name=user['full_name'],
-            amount=amount_value,
-            payment_id=payment_id
-        )
-        
-        chat_token_data = None
-        if current_product_type in ['chat', 'combo']:
-            print(f"[WEBHOOK] Getting token from external chat system (chat-bankrot.ru)")
-            chat_token_data = register_in_chat_system(
-                email=user['email'],
-                amount=amount_value
-            )
-            
-            if chat_token_data:
-                print(f"[WEBHOOK] External chat token received: {chat_token_data['token']}, saving to DB")
-                save_external_chat_token(
-                    user_id=int(user_id),
-                    user_email=user['email'],
-                    token=chat_token_data['token'],
-                    expires_at=chat_token_data['expires_at'],
-                    product_type=current_product_type
-                )
-            else:
-                print(f"[WEBHOOK] ERROR: Failed to get token from external system (chat-bankrot.ru)")
-                print(f"[WEBHOOK] User will NOT receive chat access token!")
-        
-        if current_product_type in ['course', 'combo']:
-            print(f"[WEBHOOK] Sending course credentials to {user['email']}")
-            conn_main = get_db_connection()
-            try:
-                with conn_main.cursor(cursor_factory=RealDictCursor) as cur:
-                    temp_password = str(uuid.uuid4())[:8]
-                    temp_password_hash = bcrypt.hashpw(temp_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                    
-                    cur.execute(
-                        "UPDATE users SET password_hash = %s WHERE id = %s",
-                        (temp_password_hash, int(user_id))
-                    )
-                    conn_main.commit()
-                    
-                    print(f"[WEBHOOK] Password updated, sending email with password: {temp_password}")
-                    send_course_credentials_email(
-                        user_email=user['email'],
-                        user_name=user['full_name'],
-                        password=temp_password,
-                        product_type=current_product_type,
-                        chat_token_data=chat_token_data
-                    )
-                    print(f"[WEBHOOK] Email sent successfully!")
-            finally:
-                conn_main.close()
+    if fulfillment == 'unknown':
+        # Не 200: ЮKassa повторит уведомление, а сверка подберёт оплату, если покупка появится позже
+        return {
+            'statusCode': 404,
+            'headers': headers,
+            'body': json.dumps({'status': 'unknown_payment'})
+        }
     
+    if fulfillment == 'duplicate':
+        print(f"[WEBHOOK] Payment {payment_id} already processed, duplicate delivery ignored")
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({'status': 'already_processed'})
+        }
+    
+    print(f"[WEBHOOK] Fulfillment queued for payment {payment_id}")
     return {
         'statusCode': 200,
         'headers': headers,
-        'body': json.dumps({'status': 'processed'})
+        'body': json.dumps({'status': 'queued'})
     }
 
+def get_local_payment_status(payment_id: str) -> Optional[Dict[str, Any]]:
+    '''Read the purchase state written by the webhook; None if this payment is unknown locally'''
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                "SELECT payment_status, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - purchase_date) AS age_seconds FROM user_purchases WHERE payment_id = %s ORDER BY id LIMIT 1",
+                (payment_id,)
+            )
+            return cur.fetchone()
+    finally:
+        release_connection(conn)
+
 def check_payment_status(event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
     params = event.get('queryStringParameters') or {}
     payment_id = params.get('payment_id')
@@ -396,19 +836,49 @@ def check_payment_status(event: Dict[str, Any], headers: Dict[str, str]) -> Dict
             'body': json.dumps({'error': 'payment_id is required'})
         }
     
-    shop_id = os.environ.get('YUKASSA_SHOP_ID')
-    secret_key = os.environ.get('YUKASSA_SECRET_KEY')
+    try:
+        wait_seconds = min(max(float(params.get('wait', 0)), 0), STATUS_MAX_WAIT_SECONDS)
+    except ValueError:
+        wait_seconds = 0
+    deadline = time.monotonic() + wait_seconds
+    
+    local = get_local_payment_status(payment_id)
+    while local and local['payment_status'] == 'pending' and time.monotonic() < deadline:
+        time.sleep(STATUS_POLL_INTERVAL_SECONDS)
+        local = get_local_payment_status(payment_id)
     
-    auth_string = f"{shop_id}:{secret_key}"
-    auth_encoded = base64.b64encode(auth_string.encode()).decode()
+    if local and local['payment_status'] == 'completed':
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({
+                'payment_id': payment_id,
+                'status': 'succeeded',
+                'paid': True
+            })
+        }
+    
+    upstream_after = float(os.environ.get('PAYMENT_STATUS_UPSTREAM_AFTER', '60'))
+    if local and (local['payment_status'] != 'pending' or float(local['age_seconds']) < upstream_after):
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({
+                'payment_id': payment_id,
+                'status': local['payment_status'],
+                'paid': False
+            })
+        }
     
-    response = requests.get(
-        f'https://api.yookassa.ru/v3/payments/{payment_id}',
-        headers={
-            'Authorization': f'Basic {auth_encoded}',
-            'Content-Type': 'application/json'
+    try:
+        response = yookassa_client.get_payment(payment_id)
+    except yookassa_client.YooKassaUnavailable as e:
+        print(f"YooKassa unavailable: {e}")
+        return {
+            'statusCode': 504,
+            'headers': headers,
+            'body': json.dumps({'error': 'Payment provider is not responding, try again later'})
         }
-    )
     
     if response.status_code != 200:
         return {
@@ -420,78 +890,15 @@ def check_payment_status(event: Dict[str, Any], headers: Dict[str, str]) -> Dict
     payment_data = response.json()
     
     if payment_data.get('status') == 'succeeded':
-        user_id = payment_data.get('metadata', {}).get('user_id')
-        if user_id:
-            conn = get_db_connection()
-            try:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(
-                        "SELECT product_type FROM user_purchases WHERE payment_id = %s AND user_id = %s",
-                        (payment_id, int(user_id))
-                    )
-                    current_purchase = cur.fetchone()
-                    current_product_type = current_purchase['product_type'] if current_purchase else 'course'
-                    
-                    cur.execute(
-                        "SELECT id, expires_at FROM user_purchases WHERE user_id = %s AND payment_status = 'completed' AND product_type = %s ORDER BY expires_at DESC LIMIT 1",
-                        (int(user_id), current_product_type)
-                    )
-                    existing_purchase = cur.fetchone()
-                    
-                    if existing_purchase and existing_purchase['expires_at']:
-                        if current_product_type == 'course':
-                            extension_days = 180
-                        elif current_product_type == 'chat':
-                            extension_days = 30
-                        elif current_product_type == 'combo':
-                            extension_days = 180
-                        else:
-                            extension_days = 180
-                        
-                        if existing_purchase['expires_at'] > datetime.now():
-                            new_expires_at = existing_purchase['expires_at'] + timedelta(days=extension_days)
-                        else:
-                            new_expires_at = datetime.now() + timedelta(days=extension_days)
-                        
-                        cur.execute(
-                            "UPDATE user_purchases SET payment_status = %s, expires_at = %s WHERE payment_id = %s AND user_id = %s",
-                            ('completed', new_expires_at, payment_id, int(user_id))
-                        )
-                    else:
-                        cur.execute(
-                            "UPDATE user_purchases SET payment_status = %s WHERE payment_id = %s AND user_id = %s",
-                            ('completed', payment_id, int(user_id))
-                        )
-                    
-                    conn.commit()
-                    
-                    cur.execute(
-                        "SELECT u.email, u.full_name, up.product_type FROM users u JOIN user_purchases up ON u.id = up.user_id WHERE up.payment_id = %s",
-                        (payment_id,)
-                    )
-                    user = cur.fetchone()
-            finally:
-                conn.close()
-            
-            if user:
-                amount_value = float(payment_data.get('amount', {}).get('value', 0))
-                user_product_type = user.get('product_type', 'course')
-                
-                send_admin_notification(
-                    user_email=user['email'],
-                    user_name=user['full_name'],
-                    amount=amount_value,
-                    payment_id=payment_id
-                )
-                
-                grant_chat_access_in_bankrot_app(
-                    user_email=user['email'],
-                    user_name=user['full_name'],
-                    amount=amount_value,
-                    payment_id=payment_id,
-                    product_type=user_product_type,
-                    user_id=int(user_id)
-                )
+        amount_value = float(payment_data.get('amount', {}).get('value', 0))
+        
+        conn = get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                fulfill_payment(cur, payment_id, amount_value, 'status')
+                conn.commit()
+        finally:
+            release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -505,303 +912,96 @@ def check_payment_status(event: Dict[str, Any], headers: Dict[str, str]) -> Dict
 
 
 
-def save_external_chat_token(user_id: int, user_email: str, token: str, expires_at: datetime, product_type: str):
-    '''Save external chat token (from bankrot-kurs.ru) to our database'''
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """INSERT INTO chat_tokens 
-                (user_id, email, token, product_type, expires_at) 
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (token) DO UPDATE SET
-                    user_id = EXCLUDED.user_id,
-                    email = EXCLUDED.email,
-                    product_type = EXCLUDED.product_type,
-                    expires_at = EXCLUDED.expires_at
-                RETURNING token""",
-                (user_id, user_email, token, product_type, expires_at)
-            )
-            conn.commit()
-            print(f"[DB] Saved external chat token for user {user_id}: {token}")
-            return True
-    except Exception as e:
-        print(f"[DB] Error saving external chat token: {e}")
-        import traceback
-        print(f"[DB] Traceback: {traceback.format_exc()}")
-        return False
-    finally:
-        conn.close()
+def save_external_chat_token(cur, user_id: int, user_email: str, token: str, expires_at: datetime, product_type: str):
+    '''Save external chat token (from bankrot-kurs.ru) to our database; runs inside the caller's transaction'''
+    cur.execute(
+        """INSERT INTO chat_tokens 
+        (user_id, email, token, product_type, expires_at) 
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (token) DO UPDATE SET
+            user_id = EXCLUDED.user_id,
+            email = EXCLUDED.email,
+            product_type = EXCLUDED.product_type,
+            expires_at = EXCLUDED.expires_at""",
+        (user_id, user_email, token, product_type, expires_at)
+    )
+    print(f"[DB] Saved external chat token for user {user_id}: {token}")
 
-def send_chat_token_email(user_email: str, user_name: str, chat_token: str, product_type: str):
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', 465))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    
-    if not all([smtp_host, smtp_user, smtp_password]):
-        return
+def send_course_credentials_email(user_email: str, user_name: str, login_link: str, product_type: str = 'course', chat_token_data: dict = None):
+    from email_templates import build_message, render
+    from mail_transport import is_configured, send_message
     
-    chat_url = f'https://chat-bankrot.ru/?token={chat_token}'
-    subject = 'Доступ к чату с юристами — bankrot-kurs.ru'
-    
-    html_body = f'''
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-</head>
-<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
-        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать в чат!</h1>
-    </div>
-    
-    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
-        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{user_name}</strong>!</p>
-        
-        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за оплату! Ваш доступ к закрытому чату с юристами активирован на <strong>30 дней</strong>.</p>
-        
-        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
-            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">🔑 Ваш токен доступа:</h2>
-            
-            <p style="margin: 15px 0;"><strong>Токен:</strong><br><span style="background: #fff3cd; padding: 8px 12px; border-radius: 4px; font-family: monospace; font-weight: bold; font-size: 12px; display: inline-block; word-break: break-all;">{chat_token}</span></p>
-        </div>
-        
-        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
-            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">💬 Как войти в чат:</h3>
-            <ol style="margin: 10px 0; padding-left: 20px;">
-                <li style="margin: 8px 0;">Нажмите кнопку "Войти в чат" ниже</li>
-                <li style="margin: 8px 0;">Вставьте ваш токен в поле для входа</li>
-                <li style="margin: 8px 0;">Задавайте вопросы юристам в чате!</li>
-            </ol>
-        </div>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-            <strong>⚠️ Важно:</strong> Сохраните это письмо — в нём содержится токен для входа в чат. Доступ действует 30 дней.
-        </p>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 15px;">
-            Если у вас возникнут вопросы, просто ответьте на это письмо.
-        </p>
-        
-        <div style="text-align: center; margin-top: 30px;">
-            <a href="{chat_url}" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">💬 Войти в чат</a>
-        </div>
-        
-        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
-            С уважением,<br>
-            <strong>Валентина Голосова</strong><br>
-            Арбитражный управляющий
-        </p>
-    </div>
-</body>
-</html>
-    '''
-    
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = smtp_user
-        msg['To'] = user_email
-        
-        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-        
-        print(f"[EMAIL] Sending chat token to {user_email}")
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-        print(f"[EMAIL] Successfully sent chat token to {user_email}")
-    except Exception as e:
-        print(f"[EMAIL] Error sending chat token to {user_email}: {e}")
-        import traceback
-        print(f"[EMAIL] Traceback: {traceback.format_exc()}")
-
-def send_course_credentials_email(user_email: str, user_name: str, password: str, product_type: str = 'course', chat_token_data: dict = None):
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', 465))
     smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    
-    if not all([smtp_host, smtp_user, smtp_password]):
+    if not is_configured():
         return
     
-    subject = 'Доступ к курсу "Банкротство физических лиц"'
-    
-    chat_bonus_block = ''
+    chat_bonus_html = ''
     if product_type == 'combo' and chat_token_data:
-        expires_date = chat_token_data['expires_at'].strftime('%d.%m.%Y')
-        chat_bonus_block = f'''
-        <div style="background: linear-gradient(135deg, #e8f4fd 0%, #e0f2f1 100%); padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #00897b;">
-            <h2 style="margin-top: 0; color: #00897b; font-size: 20px;">💬 БОНУС: ДОСТУП К ЗАКРЫТОМУ ЧАТУ С ЮРИСТАМИ</h2>
-            
-            <p style="margin: 15px 0;">
-                <strong>Ваш токен доступа:</strong><br>
-                <span style="background: #fff3cd; padding: 8px 12px; border-radius: 4px; font-family: monospace; font-weight: bold; font-size: 14px; display: inline-block; word-break: break-all;">{chat_token_data['token']}</span>
-            </p>
-            
-            <p style="margin: 15px 0;">
-                <strong>Ссылка на чат:</strong> <a href="https://chat-bankrot.ru" style="color: #00897b; text-decoration: none; font-weight: bold;">chat-bankrot.ru</a>
-            </p>
-            
-            <p style="margin: 15px 0;">
-                <strong>Действителен до:</strong> {expires_date}
-            </p>
-            
-            <div style="background: white; padding: 20px; border-radius: 6px; margin-top: 20px;">
-                <h3 style="margin-top: 0; font-size: 16px; color: #333;">Как войти в чат:</h3>
-                <ol style="margin: 10px 0; padding-left: 20px;">
-                    <li style="margin: 8px 0;">Перейдите на <a href="https://chat-bankrot.ru" style="color: #00897b;">chat-bankrot.ru</a></li>
-                    <li style="margin: 8px 0;">Нажмите "Войти с токеном"</li>
-                    <li style="margin: 8px 0;">Вставьте ваш токен в поле для входа</li>
-                    <li style="margin: 8px 0;">Задавайте вопросы юристам в чате!</li>
-                </ol>
-            </div>
-            
-            <p style="font-size: 13px; color: #666; margin-top: 15px;">
-                ⚠️ Сохраните токен — он понадобится для входа в чат
-            </p>
-        </div>
-        '''
-    
-    html_body = f'''
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-</head>
-<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
-        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать на курс!</h1>
-    </div>
-    
-    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
-        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{user_name}</strong>!</p>
-        
-        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за покупку! Ваш доступ к курсу <strong>"Банкротство физических лиц - самостоятельно"</strong> активирован на <strong>6 месяцев</strong>.</p>
-        
-        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
-            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">📝 Ваши данные для входа:</h2>
-            
-            <p style="margin: 15px 0;"><strong>Сайт:</strong> <a href="https://bankrot-kurs.ru/login" style="color: #667eea; text-decoration: none;">bankrot-kurs.ru/login</a></p>
-            
-            <p style="margin: 15px 0;"><strong>Email:</strong> <span style="background: #f0f0f0; padding: 5px 10px; border-radius: 4px; font-family: monospace;">{user_email}</span></p>
-            
-            <p style="margin: 15px 0;"><strong>Пароль:</strong> <span style="background: #fff3cd; padding: 5px 10px; border-radius: 4px; font-family: monospace; font-weight: bold;">{password}</span></p>
-        </div>
-        
-        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
-            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">📚 Что вас ждёт в курсе:</h3>
-            <ul style="margin: 10px 0; padding-left: 20px;">
-                <li style="margin: 8px 0;">7 подробных видеомодулей</li>
-                <li style="margin: 8px 0;">Все шаблоны документов для подачи</li>
-                <li style="margin: 8px 0;">Пошаговые инструкции</li>
-                <li style="margin: 8px 0;">Доступ на 6 месяцев</li>
-            </ul>
-        </div>
-        
-        {chat_bonus_block}
-        
-        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-            <strong>Важно:</strong> Сохраните это письмо — в нём содержится пароль для входа в личный кабинет.
-        </p>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 15px;">
-            Если у вас возникнут вопросы, просто ответьте на это письмо.
-        </p>
-        
-        <div style="text-align: center; margin-top: 30px;">
-            <a href="https://bankrot-kurs.ru/login" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">Начать обучение</a>
-        </div>
-        
-        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
-            С уважением,<br>
-            <strong>Валентина Голосова</strong><br>
-            Арбитражный управляющий
-        </p>
-    </div>
-</body>
-</html>
-    '''
+        chat_bonus_html = render(
+            'chat_bonus',
+            chat_token=chat_token_data['token'],
+            expires_date=chat_token_data['expires_at'].strftime('%d.%m.%Y')
+        )
     
     try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = smtp_user
-        msg['To'] = user_email
-        
-        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+        message = build_message(
+            'course_credentials', smtp_user, user_email,
+            user_name=user_name,
+            user_email=user_email,
+            login_link=login_link,
+            chat_bonus_html=chat_bonus_html
+        )
         
         print(f"[EMAIL] Sending course credentials to {user_email}")
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        send_message(smtp_user, [user_email], message)
         print(f"[EMAIL] Successfully sent course credentials to {user_email}")
     except Exception as e:
         print(f"[EMAIL] Error sending course credentials to {user_email}: {e}")
         import traceback
         print(f"[EMAIL] Traceback: {traceback.format_exc()}")
+        raise
 
-def send_admin_notification(user_email: str, user_name: str, amount: float, payment_id: str):
-    admin_notify_url = 'https://functions.poehali.dev/d7308d73-82be-4249-9c4d-bd4ea5a81921'
+def send_admin_email(notification_type: str, subject: str, message: str, data: Dict[str, Any]) -> bool:
+    '''Mail one admin notification right away over the shared SMTP session; never raises'''
+    from email_templates import build_message, render
+    from mail_transport import is_configured, send_message
+    
+    admin_email = os.environ.get('ADMIN_EMAIL')
+    if not admin_email or not is_configured():
+        return False
     
     try:
-        requests.post(
-            admin_notify_url,
-            json={
-                'type': 'payment',
-                'subject': 'Новая оплата курса',
-                'message': f'Клиент {user_name} успешно оплатил курс',
-                'data': {
-                    'email': user_email,
-                    'name': user_name,
-                    'amount': amount,
-                    'payment_id': payment_id,
-                    'timestamp': datetime.now().isoformat()
-                }
-            },
-            headers={'Content-Type': 'application/json'},
-            timeout=5
-        )
+        smtp_user = os.environ.get('SMTP_USER')
+        send_message(smtp_user, [admin_email], build_message(
+            'admin_notification', smtp_user, admin_email,
+            subject=subject,
+            message=message,
+            details_html=render('admin_details', details=json.dumps(data, indent=2, ensure_ascii=False)) if data else '',
+            notification_type=notification_type
+        ))
+        return True
     except Exception as e:
-        pass
+        print(f"[ADMIN] Immediate notification failed, left for the digest: {e}")
+        return False
 
-def register_in_chat_system(email: str, amount: float):
-    '''Call external bankrot chat webhook to register combo purchase and get token'''
-    webhook_url = 'https://functions.poehali.dev/002375a1-91ef-4076-9822-c2342937fb42?action=register'
-    api_key = 'bankrot_combo_secret_2025'
+def queue_admin_notification(cur, notification_type: str, payment_id: Optional[str], subject: str, message: str, data: Dict[str, Any], amount: Optional[float] = None) -> None:
+    '''Record an admin notification for the scheduled digest; failures and large payments are also mailed now'''
+    cur.execute(
+        """INSERT INTO admin_notifications (event_type, payment_id, subject, message, data, amount)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (event_type, payment_id) WHERE payment_id IS NOT NULL DO NOTHING
+        RETURNING id""",
+        (notification_type, payment_id, subject, message, json.dumps(data, ensure_ascii=False, default=str), amount)
+    )
+    row = cur.fetchone()
+    if not row:
+        return
     
-    try:
-        print(f"[CHAT_WEBHOOK] Registering user {email} in chat system")
-        response = requests.post(
-            webhook_url,
-            json={'email': email, 'amount': amount},
-            headers={
-                'X-Api-Key': api_key,
-                'Content-Type': 'application/json'
-            },
-            timeout=10
-        )
-        print(f"[CHAT_WEBHOOK] Response status: {response.status_code}")
-        print(f"[CHAT_WEBHOOK] Response body: {response.text}")
-        
-        if response.status_code == 200:
-            response_data = response.json()
-            token = response_data.get('token')
-            expires_at_str = response_data.get('expires_at')
-            
-            if token and expires_at_str:
-                from datetime import datetime
-                expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-                print(f"[CHAT_WEBHOOK] Successfully registered {email} in chat, token: {token}")
-                return {'token': token, 'expires_at': expires_at}
-            else:
-                print(f"[CHAT_WEBHOOK] Response missing token or expires_at")
-                return None
-        else:
-            print(f"[CHAT_WEBHOOK] Failed to register {email}: {response.text}")
-            return None
-    except Exception as e:
-        print(f"[CHAT_WEBHOOK] Error calling chat webhook: {e}")
-        import traceback
-        print(f"[CHAT_WEBHOOK] Traceback: {traceback.format_exc()}")
-        return None
\ No newline at end of file
+    immediate = notification_type in ADMIN_NOTIFY_IMMEDIATE_EVENTS or (
+        amount is not None and amount >= float(os.environ.get('ADMIN_NOTIFY_IMMEDIATE_AMOUNT', '10000'))
+    )
+    if immediate and send_admin_email(notification_type, subject, message, data):
+        cur.execute(
+            "UPDATE admin_notifications SET sent_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (row['id'],)
+        )
\ No newline at end of file
@@ -0,0 +1,54 @@
+'''
+Business: Signed single-use login links, the onboarding credential emailed after payment
+Args: MAGIC_LINK_SECRET (falls back to JWT_SECRET); optional MAGIC_LINK_TTL_HOURS, MAGIC_LINK_BASE_URL
+Returns: create_login_link for emails and verify_login_token for the auth function
+
+The same file is copied into every backend function that issues or accepts links.
+Keep the copies identical.
+
+A token is "<user_id>.<expires_unix>.<nonce>.<hmac>". Issuing one needs no database write and no bcrypt;
+single use is enforced by the auth function, which records the nonce in consumed_login_tokens.
+'''
+
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+def _secret() -> bytes:
+    return (os.environ.get('MAGIC_LINK_SECRET') or os.environ['JWT_SECRET']).encode('utf-8')
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(_secret(), payload.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+def create_login_token(user_id: int) -> str:
+    expires = int(time.time()) + int(os.environ.get('MAGIC_LINK_TTL_HOURS', '72')) * 3600
+    payload = f'{user_id}.{expires}.{secrets.token_urlsafe(16)}'
+    return f'{payload}.{_sign(payload)}'
+
+def create_login_link(user_id: int) -> str:
+    base_url = os.environ.get('MAGIC_LINK_BASE_URL', 'https://bankrot-kurs.ru/login')
+    return f'{base_url}?magic={create_login_token(user_id)}'
+
+def verify_login_token(token: str) -> Optional[Dict[str, Any]]:
+    '''Check signature and expiry; returns user_id, nonce and expires_at, or None for a bad or expired token'''
+    parts = token.split('.')
+    if len(parts) != 4 or not parts[0].isdigit() or not parts[1].isdigit():
+        return None
+    
+    user_id, expires, nonce, signature = parts
+    if not hmac.compare_digest(signature, _sign(f'{user_id}.{expires}.{nonce}')):
+        return None
+    if int(expires) < time.time():
+        return None
+    
+    return {
+        'user_id': int(user_id),
+        'nonce': nonce,
+        'expires_at': datetime.fromtimestamp(int(expires))
+    }
@@ -0,0 +1,86 @@
+'''
+Business: YooKassa API client shared by payment creation and status checks
+Args: YUKASSA_SHOP_ID, YUKASSA_SECRET_KEY; optional YUKASSA_API_URL (local stand-in), YUKASSA_CONNECT_TIMEOUT, YUKASSA_READ_TIMEOUT seconds, YUKASSA_MAX_RETRIES
+Returns: requests.Response objects from create_payment/get_payment and per-operation latency via client_stats
+
+The session lives at module level, so TLS connections to api.yookassa.ru are reused across warm invocations.
+Timeouts and 5xx/429 answers are retried with backoff; POST retries resend the same Idempotence-Key,
+so YooKassa returns the payment created by the first attempt instead of creating a second one.
+'''
+
+import os
+import time
+import threading
+from typing import Dict, Any, Optional
+
+API_URL = os.environ.get('YUKASSA_API_URL', 'https://api.yookassa.ru/v3')
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+class YooKassaUnavailable(Exception):
+    '''Raised when YooKassa could not be reached after all retries'''
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+                session.auth = (os.environ.get('YUKASSA_SHOP_ID', ''), os.environ.get('YUKASSA_SECRET_KEY', ''))
+                session.headers['Content-Type'] = 'application/json'
+                _session = session
+    return _session
+
+def _record(operation: str, elapsed_ms: float, attempts: int, failed: bool) -> None:
+    stats = _stats.setdefault(operation, {'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+    stats['calls'] += 1
+    stats['retries'] += attempts - 1
+    stats['total_ms'] += elapsed_ms
+    stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+    if failed:
+        stats['errors'] += 1
+    print(f"[YOOKASSA] {operation} took {elapsed_ms:.0f}ms in {attempts} attempt(s){' and failed' if failed else ''}")
+
+def _request(operation: str, method: str, path: str, json_body: Optional[Dict[str, Any]] = None, idempotence_key: Optional[str] = None):
+    import requests
+    
+    session = _get_session()
+    timeout = (float(os.environ.get('YUKASSA_CONNECT_TIMEOUT', '3')), float(os.environ.get('YUKASSA_READ_TIMEOUT', '10')))
+    max_retries = int(os.environ.get('YUKASSA_MAX_RETRIES', '2'))
+    headers = {'Idempotence-Key': idempotence_key} if idempotence_key else {}
+    
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = session.request(method, f'{API_URL}{path}', json=json_body, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt > max_retries:
+                _record(operation, (time.monotonic() - started) * 1000, attempt, True)
+                raise YooKassaUnavailable(str(e)) from e
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt > max_retries:
+                _record(operation, (time.monotonic() - started) * 1000, attempt, response.status_code >= 400)
+                return response
+        
+        time.sleep(0.2 * 2 ** (attempt - 1))
+
+def create_payment(payment_data: Dict[str, Any], idempotence_key: str):
+    return _request('create_payment', 'POST', '/payments', json_body=payment_data, idempotence_key=idempotence_key)
+
+def get_payment(payment_id: str):
+    return _request('get_payment', 'GET', f'/payments/{payment_id}')
+
+def client_stats() -> Dict[str, Any]:
+    return {
+        operation: {**stats, 'avg_ms': round(stats['total_ms'] / stats['calls'], 1)}
+        for operation, stats in _stats.items()
+    }
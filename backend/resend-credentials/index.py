@@ -1,23 +1,18 @@
 '''
-Business: Resend course credentials email to user
+Business: Resend course access email with a fresh one-time login link
 Args: event with user_email in query params
 Returns: Success message
 '''
 
 import json
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
-import uuid
-import bcrypt
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from db import get_connection, release_connection
+from magic_link import create_login_link
+from email_templates import build_message, render
+from mail_transport import send_message
 from typing import Dict, Any
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
-
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -49,7 +44,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'email parameter required'})
             }
         
-        conn = get_db_connection()
+        conn = get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
@@ -82,19 +77,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     if token_row:
                         chat_token_data = {'token': token_row['token'], 'expires_at': token_row['expires_at']}
                 
-                temp_password = str(uuid.uuid4())[:8]
-                temp_password_hash = bcrypt.hashpw(temp_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                
-                cur.execute(
-                    "UPDATE users SET password_hash = %s WHERE id = %s",
-                    (temp_password_hash, user['id'])
-                )
-                conn.commit()
-                
                 send_course_credentials_email(
                     user_email=user['email'],
                     user_name=user['full_name'],
-                    password=temp_password,
+                    login_link=create_login_link(user['id']),
                     product_type=product_type,
                     chat_token_data=chat_token_data
                 )
@@ -105,11 +91,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({
                         'message': 'Credentials email sent successfully',
                         'email': user_email,
-                        'password_sent': True
+                        'login_link_sent': True
                     })
                 }
         finally:
-            conn.close()
+            release_connection(conn)
     
     except Exception as e:
         import traceback
@@ -122,7 +108,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
 
-def send_course_credentials_email(user_email: str, user_name: str, password: str, product_type: str = 'course', chat_token_data: dict = None):
+def send_course_credentials_email(user_email: str, user_name: str, login_link: str, product_type: str = 'course', chat_token_data: dict = None):
     smtp_host = os.environ.get('SMTP_HOST')
     smtp_port = int(os.environ.get('SMTP_PORT', 465))
     smtp_user = os.environ.get('SMTP_USER')
@@ -135,112 +121,21 @@ def send_course_credentials_email(user_email: str, user_name: str, password: str
         print("SMTP credentials missing!")
         raise Exception("SMTP not configured")
     
-    subject = 'Доступ к курсу "Банкротство физических лиц"'
-    
-    chat_bonus_block = ''
+    chat_bonus_html = ''
     if product_type == 'combo' and chat_token_data:
-        expires_date = chat_token_data['expires_at'].strftime('%d.%m.%Y')
-        chat_bonus_block = f'''
-        <div style="background: linear-gradient(135deg, #e8f4fd 0%, #e0f2f1 100%); padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #00897b;">
-            <h2 style="margin-top: 0; color: #00897b; font-size: 20px;">💬 БОНУС: ДОСТУП К ЗАКРЫТОМУ ЧАТУ С ЮРИСТАМИ</h2>
-            
-            <p style="margin: 15px 0;">
-                <strong>Ваш токен доступа:</strong><br>
-                <span style="background: #fff3cd; padding: 8px 12px; border-radius: 4px; font-family: monospace; font-weight: bold; font-size: 14px; display: inline-block; word-break: break-all;">{chat_token_data['token']}</span>
-            </p>
-            
-            <p style="margin: 15px 0;">
-                <strong>Ссылка на чат:</strong> <a href="https://chat-bankrot.ru" style="color: #00897b; text-decoration: none; font-weight: bold;">chat-bankrot.ru</a>
-            </p>
-            
-            <p style="margin: 15px 0;">
-                <strong>Действителен до:</strong> {expires_date}
-            </p>
-            
-            <div style="background: white; padding: 20px; border-radius: 6px; margin-top: 20px;">
-                <h3 style="margin-top: 0; font-size: 16px; color: #333;">Как войти в чат:</h3>
-                <ol style="margin: 10px 0; padding-left: 20px;">
-                    <li style="margin: 8px 0;">Перейдите на <a href="https://chat-bankrot.ru" style="color: #00897b;">chat-bankrot.ru</a></li>
-                    <li style="margin: 8px 0;">Нажмите "Войти с токеном"</li>
-                    <li style="margin: 8px 0;">Вставьте ваш токен в поле для входа</li>
-                    <li style="margin: 8px 0;">Задавайте вопросы юристам в чате!</li>
-                </ol>
-            </div>
-            
-            <p style="font-size: 13px; color: #666; margin-top: 15px;">
-                ⚠️ Сохраните токен — он понадобится для входа в чат
-            </p>
-        </div>
-        '''
-    
-    html_body = f'''
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-</head>
-<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
-        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать на курс!</h1>
-    </div>
-    
-    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
-        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{user_name}</strong>!</p>
-        
-        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за покупку! Ваш доступ к курсу <strong>"Банкротство физических лиц - самостоятельно"</strong> активирован на <strong>6 месяцев</strong>.</p>
-        
-        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
-            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">📝 Ваши данные для входа:</h2>
-            
-            <p style="margin: 15px 0;"><strong>Сайт:</strong> <a href="https://bankrot-kurs.ru/login" style="color: #667eea; text-decoration: none;">bankrot-kurs.ru/login</a></p>
-            
-            <p style="margin: 15px 0;"><strong>Email:</strong> <span style="background: #f0f0f0; padding: 5px 10px; border-radius: 4px; font-family: monospace;">{user_email}</span></p>
-            
-            <p style="margin: 15px 0;"><strong>Пароль:</strong> <span style="background: #fff3cd; padding: 5px 10px; border-radius: 4px; font-family: monospace; font-weight: bold;">{password}</span></p>
-        </div>
-        
-        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
-            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">📚 Что вас ждёт в курсе:</h3>
-            <ul style="margin: 10px 0; padding-left: 20px;">
-                <li style="margin: 8px 0;">7 подробных видеомодулей</li>
-                <li style="margin: 8px 0;">Все шаблоны документов для подачи</li>
-                <li style="margin: 8px 0;">Пошаговые инструкции</li>
-                <li style="margin: 8px 0;">Доступ на 6 месяцев</li>
-            </ul>
-        </div>
-        
-        {chat_bonus_block}
-        
-        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-            <strong>Важно:</strong> Сохраните это письмо — в нём содержится пароль для входа в личный кабинет.
-        </p>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 15px;">
-            Если у вас возникнут вопросы, просто ответьте на это письмо.
-        </p>
-        
-        <div style="text-align: center; margin-top: 30px;">
-            <a href="https://bankrot-kurs.ru/login" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">Начать обучение</a>
-        </div>
-        
-        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
-            С уважением,<br>
-            <strong>Валентина Голосова</strong><br>
-            Арбитражный управляющий
-        </p>
-    </div>
-</body>
-</html>
-    '''
-    
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = smtp_user
-    msg['To'] = user_email
+        chat_bonus_html = render(
+            'chat_bonus',
+            chat_token=chat_token_data['token'],
+            expires_date=chat_token_data['expires_at'].strftime('%d.%m.%Y')
+        )
     
-    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    message = build_message(
+        'course_credentials', smtp_user, user_email,
+        user_name=user_name,
+        user_email=user_email,
+        login_link=login_link,
+        chat_bonus_html=chat_bonus_html
+    )
     
-    with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        print(f"Email sent successfully to {user_email}")
\ No newline at end of file
+    send_message(smtp_user, [user_email], message)
+    print(f"Email sent successfully to {user_email}")
\ No newline at end of file
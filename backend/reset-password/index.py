@@ -6,7 +6,7 @@ Returns: Success message or error
 
 import json
 import os
-import psycopg2
+from db import get_connection, release_connection
 import bcrypt
 import secrets
 from datetime import datetime, timedelta
@@ -65,8 +65,7 @@ def request_reset(body: Dict[str, Any]) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Email обязателен'})
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -99,7 +98,7 @@ def request_reset(body: Dict[str, Any]) -> Dict[str, Any]:
         }
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 def confirm_reset(body: Dict[str, Any]) -> Dict[str, Any]:
     token = body.get('token', '').strip()
@@ -119,8 +118,7 @@ def confirm_reset(body: Dict[str, Any]) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Пароль должен быть не менее 6 символов'})
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -167,12 +165,11 @@ def confirm_reset(body: Dict[str, Any]) -> Dict[str, Any]:
         }
     finally:
         cursor.close()
-        conn.close()
+        release_connection(conn)
 
 def send_reset_email(email: str, name: str, token: str) -> None:
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
+    from email_templates import build_message
+    from mail_transport import send_message
     
     smtp_host = os.environ.get('SMTP_HOST')
     smtp_port = int(os.environ.get('SMTP_PORT', 465))
@@ -185,34 +182,13 @@ def send_reset_email(email: str, name: str, token: str) -> None:
         print('SMTP credentials not configured')
         return
     
-    reset_url = f"https://bankrot-kurs.ru/reset-password?token={token}"
-    
-    html_content = f'''
-    <html>
-      <body style="font-family: Arial, sans-serif; line-height: 1.6;">
-        <h2>Восстановление пароля</h2>
-        <p>Здравствуйте, {name}!</p>
-        <p>Вы запросили восстановление пароля для вашего аккаунта.</p>
-        <p>Перейдите по ссылке ниже, чтобы создать новый пароль:</p>
-        <p><a href="{reset_url}" style="background: #4F46E5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; display: inline-block;">Восстановить пароль</a></p>
-        <p>Ссылка действительна в течение 1 часа.</p>
-        <p>Если вы не запрашивали восстановление пароля, просто проигнорируйте это письмо.</p>
-        <br>
-        <p>С уважением,<br>Команда платформы обучения</p>
-      </body>
-    </html>
-    '''
-    
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = 'Восстановление пароля'
-    msg['From'] = smtp_user
-    msg['To'] = email
-    
-    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+    message = build_message(
+        'password_reset', smtp_user, email,
+        user_name=name,
+        reset_url=f"https://bankrot-kurs.ru/reset-password?token={token}"
+    )
     
     try:
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        send_message(smtp_user, [email], message)
     except Exception as e:
         print(f'Failed to send email: {e}')
\ No newline at end of file
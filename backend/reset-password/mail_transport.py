@@ -0,0 +1,126 @@
+'''
+Business: Outgoing mail over one authenticated SMTP session kept across warm invocations
+Args: SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD; optional SMTP_SECURITY (ssl, starttls, none),
+      SMTP_TIMEOUT, SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_IDLE_CHECK_SECONDS
+Returns: send_message for a single mail, send_messages for a batch over one session
+
+The same file is copied into every backend function that sends email.
+Keep the copies identical.
+
+The connection lives at module level, so a warm container pays the TLS handshake and AUTH once.
+A session idle for longer than SMTP_IDLE_CHECK_SECONDS is probed with NOOP before reuse, and it is
+recycled after SMTP_MAX_MESSAGES_PER_CONNECTION messages. A send that fails because the server
+dropped the session is retried once on a fresh connection; recipient or content rejections are not.
+'''
+
+import os
+import time
+import smtplib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {'server': None, 'key': None, 'sent': 0, 'last_used': 0.0}
+_stats = {'connections': 0, 'reconnects': 0, 'messages': 0}
+
+def _settings() -> Dict[str, Any]:
+    port = int(os.environ.get('SMTP_PORT', 465))
+    return {
+        'host': os.environ.get('SMTP_HOST'),
+        'port': port,
+        'user': os.environ.get('SMTP_USER'),
+        'password': os.environ.get('SMTP_PASSWORD'),
+        'security': os.environ.get('SMTP_SECURITY') or ('ssl' if port == 465 else 'starttls'),
+        'timeout': float(os.environ.get('SMTP_TIMEOUT', '10'))
+    }
+
+def is_configured() -> bool:
+    settings = _settings()
+    return all([settings['host'], settings['user'], settings['password']])
+
+def _connect(settings: Dict[str, Any]) -> smtplib.SMTP:
+    if settings['security'] == 'ssl':
+        server = smtplib.SMTP_SSL(settings['host'], settings['port'], timeout=settings['timeout'])
+    else:
+        server = smtplib.SMTP(settings['host'], settings['port'], timeout=settings['timeout'])
+        if settings['security'] == 'starttls':
+            server.ehlo()
+            server.starttls()
+            server.ehlo()
+    server.login(settings['user'], settings['password'])
+    _stats['connections'] += 1
+    return server
+
+def _close() -> None:
+    server = _state['server']
+    _state['server'] = None
+    if server is None:
+        return
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+def _session() -> smtplib.SMTP:
+    '''Return the live session, opening a new one when settings changed, it is worn out or it went stale'''
+    settings = _settings()
+    key = (settings['host'], settings['port'], settings['user'], settings['security'])
+    max_messages = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+    idle_check = float(os.environ.get('SMTP_IDLE_CHECK_SECONDS', '30'))
+    
+    if _state['server'] is not None:
+        if _state['key'] != key or _state['sent'] >= max_messages:
+            _close()
+        elif time.monotonic() - _state['last_used'] > idle_check:
+            try:
+                if _state['server'].noop()[0] != 250:
+                    _close()
+            except Exception:
+                _close()
+    
+    if _state['server'] is None:
+        _state['server'] = _connect(settings)
+        _state['key'] = key
+        _state['sent'] = 0
+    return _state['server']
+
+def _deliver(sender: str, recipients: List[str], message: bytes) -> None:
+    try:
+        _session().sendmail(sender, recipients, message)
+    except RECONNECT_ERRORS as e:
+        print(f"[SMTP] Session lost ({e.__class__.__name__}), reconnecting")
+        _close()
+        _stats['reconnects'] += 1
+        _session().sendmail(sender, recipients, message)
+    except smtplib.SMTPResponseException as e:
+        if e.smtp_code != 421:
+            raise
+        print(f"[SMTP] Server closing session ({e.smtp_code}), reconnecting")
+        _close()
+        _stats['reconnects'] += 1
+        _session().sendmail(sender, recipients, message)
+    _state['sent'] += 1
+    _state['last_used'] = time.monotonic()
+    _stats['messages'] += 1
+
+def send_message(sender: str, recipients: List[str], message: bytes) -> None:
+    '''Send one message over the shared session; raises smtplib errors the retry could not fix'''
+    with _lock:
+        _deliver(sender, recipients, message)
+
+def send_messages(batch: List[Tuple[str, List[str], bytes]]) -> List[Optional[str]]:
+    '''Send queued messages back to back over one session; returns None or the error text per message'''
+    results: List[Optional[str]] = []
+    with _lock:
+        for sender, recipients, message in batch:
+            try:
+                _deliver(sender, recipients, message)
+                results.append(None)
+            except Exception as e:
+                results.append(f'{e.__class__.__name__}: {e}')
+    return results
+
+def transport_stats() -> Dict[str, int]:
+    return dict(_stats)
@@ -0,0 +1,253 @@
+import json
+import os
+import hmac
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Set
+from urllib.parse import unquote
+from psycopg2.extras import RealDictCursor
+from db import get_connection, release_connection
+from object_storage import BUCKET_NAME, get_client, is_configured, key_from_url
+import jwt
+
+GC_PREFIX = 'course-files/'
+DELETE_BATCH_SIZE = 1000
+REPORT_SAMPLE_SIZE = 50
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+# Ключи, которые создаёт upload-file: course-files/<uuid>/<имя> и course-files/<sha256>/<имя>
+APP_KEY_PATTERN = re.compile(
+    r'^course-files/([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/.'
+)
+
+def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    jwt_secret = os.environ.get('JWT_SECRET')
+    if not auth_token or not jwt_secret:
+        return None
+    
+    try:
+        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return None
+    return payload if payload.get('is_admin') else None
+
+def verify_maintenance(event: Dict[str, Any]) -> bool:
+    '''Allow a maintenance run from the timer trigger, with X-Cron-Secret matching CRON_SECRET, or with an admin token'''
+    # Таймер-триггер вызывает функцию без HTTP-обёртки, поэтому HTTP-запрос не может выдать себя за него
+    if 'httpMethod' not in event:
+        return True
+    
+    headers = event.get('headers') or {}
+    cron_secret = os.environ.get('CRON_SECRET')
+    provided = headers.get('X-Cron-Secret') or headers.get('x-cron-secret')
+    if cron_secret and provided and hmac.compare_digest(provided.encode('utf-8'), cron_secret.encode('utf-8')):
+        return True
+    return verify_admin(headers) is not None
+
+def json_response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': json.dumps(body)}
+
+def referenced_keys(cur) -> Set[str]:
+    '''Every bucket key something in the database still points at, raw and URL-decoded'''
+    bucket_url = f'%/{BUCKET_NAME}/%'
+    cur.execute("SELECT file_url FROM course_files WHERE file_url LIKE %s", (bucket_url,))
+    keys = {key_from_url(row['file_url']) for row in cur.fetchall()}
+    cur.execute("SELECT video_url FROM lessons WHERE video_url LIKE %s", (bucket_url,))
+    keys.update(key_from_url(row['video_url']) for row in cur.fetchall())
+    cur.execute("SELECT file_url FROM materials WHERE file_url LIKE %s", (bucket_url,))
+    keys.update(key_from_url(row['file_url']) for row in cur.fetchall())
+    cur.execute("SELECT file_key FROM file_blobs WHERE ref_count > 0")
+    keys.update(row['file_key'] for row in cur.fetchall())
+    cur.execute("SELECT file_key FROM upload_sessions WHERE status = 'active'")
+    keys.update(row['file_key'] for row in cur.fetchall())
+    keys.discard(None)
+    return keys | {unquote(key) for key in keys}
+
+def blob_keys(cur) -> Set[str]:
+    cur.execute("SELECT file_key FROM file_blobs")
+    return {row['file_key'] for row in cur.fetchall()}
+
+def list_orphans(s3, referenced: Set[str], created: Set[str], listed: Set[str], cutoff: datetime, report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Walk the course-files prefix page by page and keep unreferenced app-created objects older than the cutoff'''
+    orphans = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=GC_PREFIX, PaginationConfig={'PageSize': DELETE_BATCH_SIZE}):
+        for obj in page.get('Contents', []):
+            listed.add(obj['Key'])
+            report['scanned'] += 1
+            report['scannedBytes'] += obj['Size']
+            if obj['Key'] in referenced:
+                continue
+            # Объекты, положенные в бакет не через upload-file, сборщик не трогает
+            if obj['Key'] not in created and not APP_KEY_PATTERN.match(obj['Key']):
+                report['skippedForeign'] += 1
+                continue
+            if obj['LastModified'] > cutoff:
+                report['skippedRecent'] += 1
+                continue
+            orphans.append({'key': obj['Key'], 'size': obj['Size']})
+    return orphans
+
+def lock_orphan_blobs(cur, keys: List[str]) -> Set[str]:
+    '''Lock unreferenced blob rows so no upload can reuse them mid-delete; returns blob keys that must be kept'''
+    cur.execute("SELECT file_key FROM file_blobs WHERE file_key = ANY(%s)", (keys,))
+    blob_keys = {row['file_key'] for row in cur.fetchall()}
+    if not blob_keys:
+        return set()
+    
+    # Blob, на который прямо сейчас ссылается новая загрузка, заблокирован или уже имеет ссылки: не трогаем
+    cur.execute(
+        "SELECT file_key FROM file_blobs WHERE file_key = ANY(%s) AND ref_count = 0 FOR UPDATE SKIP LOCKED",
+        (list(blob_keys),)
+    )
+    return blob_keys - {row['file_key'] for row in cur.fetchall()}
+
+def drop_missing_blobs(cur, listed: Set[str], dry_run: bool, report: Dict[str, Any]) -> None:
+    '''Forget unreferenced blobs whose object is already gone, so dedup never points a new file at it'''
+    cur.execute("SELECT sha256, file_key FROM file_blobs WHERE ref_count = 0 FOR UPDATE SKIP LOCKED")
+    missing = [row['sha256'] for row in cur.fetchall() if row['file_key'] not in listed]
+    report['missingBlobs'] = len(missing)
+    if missing and not dry_run:
+        cur.execute("DELETE FROM file_blobs WHERE sha256 = ANY(%s) AND ref_count = 0", (missing,))
+        report['blobsRemoved'] += cur.rowcount
+
+def delete_orphans(s3, cur, orphans: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+    sizes = {obj['key']: obj['size'] for obj in orphans}
+    for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+        batch = [obj['key'] for obj in orphans[start:start + DELETE_BATCH_SIZE]]
+        result = s3.delete_objects(
+            Bucket=BUCKET_NAME,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        failed = {error['Key'] for error in result.get('Errors', [])}
+        report['errors'].extend(f"{error['Key']}: {error.get('Code')}" for error in result.get('Errors', []))
+        deleted = [key for key in batch if key not in failed]
+        report['deleted'] += len(deleted)
+        report['deletedBytes'] += sum(sizes[key] for key in deleted)
+        
+        cur.execute("DELETE FROM file_blobs WHERE file_key = ANY(%s) AND ref_count = 0", (deleted,))
+        report['blobsRemoved'] += cur.rowcount
+
+def abort_stale_uploads(s3, cur, dry_run: bool, report: Dict[str, Any]) -> None:
+    '''Abort multipart uploads the admin UI never completed; their parts are billed like objects'''
+    from botocore.exceptions import ClientError
+    
+    cur.execute(
+        """SELECT id, file_key, s3_upload_id FROM upload_sessions
+        WHERE status = 'active' AND created_at < %s
+        FOR UPDATE SKIP LOCKED""",
+        (datetime.utcnow() - timedelta(hours=float(os.environ.get('STORAGE_GC_UPLOAD_TTL_HOURS', '72'))),)
+    )
+    sessions = cur.fetchall()
+    report['staleUploads'] = len(sessions)
+    if dry_run:
+        return
+    
+    for session in sessions:
+        try:
+            s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=session['file_key'], UploadId=session['s3_upload_id'])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                report['errors'].append(f"{session['file_key']}: abort {e.response.get('Error', {}).get('Code')}")
+                continue
+        cur.execute("UPDATE upload_sessions SET status = 'aborted' WHERE id = %s", (session['id'],))
+        report['abortedUploads'] += 1
+
+def collect_garbage(dry_run: bool) -> Dict[str, Any]:
+    '''Delete app-created course-files objects nothing references once they are older than the grace period'''
+    grace_hours = float(os.environ.get('STORAGE_GC_GRACE_HOURS', '24'))
+    max_deletes = int(os.environ.get('STORAGE_GC_MAX_DELETES', '5000'))
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    report: Dict[str, Any] = {
+        'dryRun': dry_run, 'graceHours': grace_hours,
+        'scanned': 0, 'scannedBytes': 0, 'referenced': 0, 'skippedRecent': 0, 'skippedForeign': 0,
+        'orphans': 0, 'orphanBytes': 0, 'deleted': 0, 'deletedBytes': 0, 'blobsRemoved': 0, 'missingBlobs': 0,
+        'staleUploads': 0, 'abortedUploads': 0, 'errors': []
+    }
+    
+    s3 = get_client()
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            referenced = referenced_keys(cur)
+            report['referenced'] = len(referenced)
+            listed: Set[str] = set()
+            orphans = list_orphans(s3, referenced, blob_keys(cur), listed, cutoff, report)
+            
+            if orphans:
+                kept = lock_orphan_blobs(cur, [obj['key'] for obj in orphans])
+                orphans = [obj for obj in orphans if obj['key'] not in kept]
+            report['orphans'] = len(orphans)
+            report['orphanBytes'] = sum(obj['size'] for obj in orphans)
+            
+            if dry_run:
+                report['sample'] = [obj['key'] for obj in orphans[:REPORT_SAMPLE_SIZE]]
+            elif orphans:
+                delete_orphans(s3, cur, orphans[:max_deletes], report)
+            
+            drop_missing_blobs(cur, listed, dry_run, report)
+            abort_stale_uploads(s3, cur, dry_run, report)
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_connection(conn)
+    
+    report['errors'] = report['errors'][:REPORT_SAMPLE_SIZE]
+    print(f"[STORAGE GC] {json.dumps({k: v for k, v in report.items() if k != 'sample'})}")
+    return report
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Garbage collector for the course-files bucket: removes objects no course file points at
+    Args: event with httpMethod, queryStringParameters (dry_run), headers; context with request_id
+    Returns: HTTP response with a report of scanned, orphaned and deleted objects
+    
+    GET (scheduled, cron.txt) lists course-files/ page by page, diffs it against course_files.file_url,
+    lessons.video_url, materials.file_url, file_blobs and active upload_sessions, and removes
+    unreferenced objects older than STORAGE_GC_GRACE_HOURS with bulk delete_objects, at most
+    STORAGE_GC_MAX_DELETES per run. Only keys upload-file creates are candidates: file_blobs keys and
+    course-files/<uuid>/ or course-files/<sha256>/ paths; anything else under the prefix is kept.
+    Unreferenced file_blobs rows whose object is gone are dropped, and multipart uploads left
+    active longer than STORAGE_GC_UPLOAD_TTL_HOURS are aborted.
+    GET ?dry_run=true only reports what would be removed, with a sample of keys.
+    Every run, dry or not, must come from the timer trigger, carry X-Cron-Secret equal to
+    CRON_SECRET, or carry an admin X-Auth-Token.
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method != 'GET':
+        return json_response(405, {'error': 'Method not allowed'})
+    
+    if not verify_maintenance(event):
+        return json_response(401, {'error': 'Unauthorized'})
+    
+    query_params = event.get('queryStringParameters') or {}
+    dry_run = str(query_params.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    
+    if not os.environ.get('DATABASE_URL') or not is_configured():
+        return json_response(500, {'error': 'Database or S3 credentials not configured'})
+    
+    try:
+        report = collect_garbage(dry_run)
+    except Exception as e:
+        print(f"[STORAGE GC] Failed: {e}")
+        return json_response(500, {'error': f'Storage GC failed: {str(e)}'})
+    
+    return json_response(200, {'success': True, **report})
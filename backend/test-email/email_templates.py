@@ -0,0 +1,295 @@
+'''
+Business: HTML email templates shared by every function that sends mail
+Args: template name, sender, recipient and the template slots
+Returns: render for the HTML body, build_message for a ready-to-send RFC 5322 message (bytes)
+
+The same file is copied into every backend function that sends email.
+Keep the copies identical.
+
+A template is split into static chunks and {{slot}} names once per process. Rendering joins the
+chunks with the HTML-escaped slot values; slots ending in _html are inserted as is and are meant
+for fragments produced by render(). build_message writes the MIME envelope from pre-encoded
+header and boundary bytes instead of going through email.mime and the generator on every send.
+'''
+
+import re
+import base64
+import secrets
+from html import escape
+from functools import lru_cache
+from email.header import Header
+from typing import Dict, List, Tuple
+
+SLOT_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+
+SUBJECTS: Dict[str, str] = {
+    'course_credentials': 'Доступ к курсу "Банкротство физических лиц"',
+    'chat_welcome': 'Доступ к чату с юристами — chat-bankrot.ru',
+    'password_reset': 'Восстановление пароля',
+    'admin_notification': '{{subject}}',
+    'admin_digest': 'Сводка уведомлений с сайта: {{count}}'
+}
+
+TEMPLATES: Dict[str, str] = {
+    'course_credentials': '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
+        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать на курс!</h1>
+    </div>
+
+    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
+        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{{user_name}}</strong>!</p>
+
+        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за покупку! Ваш доступ к курсу <strong>"Банкротство физических лиц - самостоятельно"</strong> активирован на <strong>6 месяцев</strong>.</p>
+
+        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
+            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">📝 Ваши данные для входа:</h2>
+
+            <p style="margin: 15px 0;"><strong>Сайт:</strong> <a href="https://bankrot-kurs.ru/login" style="color: #667eea; text-decoration: none;">bankrot-kurs.ru/login</a></p>
+
+            <p style="margin: 15px 0;"><strong>Email:</strong> <span style="background: #f0f0f0; padding: 5px 10px; border-radius: 4px; font-family: monospace;">{{user_email}}</span></p>
+
+            <p style="margin: 15px 0;"><strong>Вход:</strong> <a href="{{login_link}}" style="color: #667eea; font-weight: bold;">войти в личный кабинет по ссылке</a></p>
+        </div>
+
+        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
+            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">📚 Что вас ждёт в курсе:</h3>
+            <ul style="margin: 10px 0; padding-left: 20px;">
+                <li style="margin: 8px 0;">7 подробных видеомодулей</li>
+                <li style="margin: 8px 0;">Все шаблоны документов для подачи</li>
+                <li style="margin: 8px 0;">Пошаговые инструкции</li>
+                <li style="margin: 8px 0;">Доступ на 6 месяцев</li>
+            </ul>
+        </div>
+
+        {{chat_bonus_html}}
+
+        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
+            <strong>Важно:</strong> Ссылка для входа одноразовая и действует 3 дня. После входа задайте пароль в личном кабинете. Если ссылка устарела, воспользуйтесь восстановлением пароля на странице входа.
+        </p>
+
+        <p style="font-size: 14px; color: #666; margin-top: 15px;">
+            Если у вас возникнут вопросы, просто ответьте на это письмо.
+        </p>
+
+        <div style="text-align: center; margin-top: 30px;">
+            <a href="{{login_link}}" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">Начать обучение</a>
+        </div>
+
+        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
+            С уважением,<br>
+            <strong>Валентина Голосова</strong><br>
+            Арбитражный управляющий
+        </p>
+    </div>
+</body>
+</html>
+''',
+    'chat_bonus': '''
+        <div style="background: linear-gradient(135deg, #e8f4fd 0%, #e0f2f1 100%); padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #00897b;">
+            <h2 style="margin-top: 0; color: #00897b; font-size: 20px;">💬 БОНУС: ДОСТУП К ЗАКРЫТОМУ ЧАТУ С ЮРИСТАМИ</h2>
+
+            <p style="margin: 15px 0;">
+                <strong>Ваш токен доступа:</strong><br>
+                <span style="background: #fff3cd; padding: 8px 12px; border-radius: 4px; font-family: monospace; font-weight: bold; font-size: 14px; display: inline-block; word-break: break-all;">{{chat_token}}</span>
+            </p>
+
+            <p style="margin: 15px 0;">
+                <strong>Ссылка на чат:</strong> <a href="https://chat-bankrot.ru" style="color: #00897b; text-decoration: none; font-weight: bold;">chat-bankrot.ru</a>
+            </p>
+
+            <p style="margin: 15px 0;">
+                <strong>Действителен до:</strong> {{expires_date}}
+            </p>
+
+            <div style="background: white; padding: 20px; border-radius: 6px; margin-top: 20px;">
+                <h3 style="margin-top: 0; font-size: 16px; color: #333;">Как войти в чат:</h3>
+                <ol style="margin: 10px 0; padding-left: 20px;">
+                    <li style="margin: 8px 0;">Перейдите на <a href="https://chat-bankrot.ru" style="color: #00897b;">chat-bankrot.ru</a></li>
+                    <li style="margin: 8px 0;">Нажмите "Войти с токеном"</li>
+                    <li style="margin: 8px 0;">Вставьте ваш токен в поле для входа</li>
+                    <li style="margin: 8px 0;">Задавайте вопросы юристам в чате!</li>
+                </ol>
+            </div>
+
+            <p style="font-size: 13px; color: #666; margin-top: 15px;">
+                ⚠️ Сохраните токен — он понадобится для входа в чат
+            </p>
+        </div>
+''',
+    'chat_welcome': '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
+        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать!</h1>
+    </div>
+
+    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
+        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{{user_name}}</strong>!</p>
+
+        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за оплату! Ваш доступ к чату с юристами активирован на <strong>30 дней</strong>.</p>
+
+        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
+            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">📝 Ваши данные для входа:</h2>
+
+            <p style="margin: 15px 0;"><strong>Сайт:</strong> <a href="https://chat-bankrot.ru" style="color: #667eea; text-decoration: none;">chat-bankrot.ru</a></p>
+
+            <p style="margin: 15px 0;"><strong>Email:</strong> <span style="background: #f0f0f0; padding: 5px 10px; border-radius: 4px; font-family: monospace;">{{user_email}}</span></p>
+
+            <p style="margin: 15px 0;"><strong>Пароль:</strong> <span style="background: #fff3cd; padding: 5px 10px; border-radius: 4px; font-family: monospace; font-weight: bold;">{{password}}</span></p>
+        </div>
+
+        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
+            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">💬 Как начать:</h3>
+            <ol style="margin: 10px 0; padding-left: 20px;">
+                <li style="margin: 8px 0;">Перейдите на сайт <a href="https://chat-bankrot.ru" style="color: #0066cc;">chat-bankrot.ru</a></li>
+                <li style="margin: 8px 0;">Войдите используя ваш email и пароль</li>
+                <li style="margin: 8px 0;">Задавайте вопросы юристам в чате</li>
+            </ol>
+        </div>
+
+        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
+            <strong>Важно:</strong> Сохраните это письмо — в нём содержится пароль для входа в систему.
+        </p>
+
+        <p style="font-size: 14px; color: #666; margin-top: 15px;">
+            Если у вас возникнут вопросы, просто ответьте на это письмо.
+        </p>
+
+        <div style="text-align: center; margin-top: 30px;">
+            <a href="https://chat-bankrot.ru" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">Войти в чат</a>
+        </div>
+
+        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
+            С уважением,<br>
+            <strong>Команда chat-bankrot.ru</strong>
+        </p>
+    </div>
+</body>
+</html>
+''',
+    'password_reset': '''
+<html>
+  <body style="font-family: Arial, sans-serif; line-height: 1.6;">
+    <h2>Восстановление пароля</h2>
+    <p>Здравствуйте, {{user_name}}!</p>
+    <p>Вы запросили восстановление пароля для вашего аккаунта.</p>
+    <p>Перейдите по ссылке ниже, чтобы создать новый пароль:</p>
+    <p><a href="{{reset_url}}" style="background: #4F46E5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; display: inline-block;">Восстановить пароль</a></p>
+    <p>Ссылка действительна в течение 1 часа.</p>
+    <p>Если вы не запрашивали восстановление пароля, просто проигнорируйте это письмо.</p>
+    <br>
+    <p>С уважением,<br>Команда платформы обучения</p>
+  </body>
+</html>
+''',
+    'admin_notification': '''
+<html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
+            <h2 style="color: #2563eb; border-bottom: 2px solid #2563eb; padding-bottom: 10px;">
+                {{subject}}
+            </h2>
+            <p style="font-size: 16px;">{{message}}</p>
+
+            {{details_html}}
+
+            <hr style="margin: 20px 0; border: none; border-top: 1px solid #ddd;">
+            <p style="font-size: 12px; color: #666;">
+                Это автоматическое уведомление с сайта банкротства<br>
+                Тип события: {{notification_type}}
+            </p>
+        </div>
+    </body>
+</html>
+''',
+    'admin_details': '<div style="background: #f5f5f5; padding: 15px; border-radius: 5px; margin-top: 20px;"><h3 style="margin-top: 0;">Детали:</h3><pre style="white-space: pre-wrap; word-wrap: break-word;">{{details}}</pre></div>',
+    'admin_digest': '''
+<html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
+            <h2 style="color: #2563eb; border-bottom: 2px solid #2563eb; padding-bottom: 10px;">
+                Сводка уведомлений: {{count}}
+            </h2>
+            <p style="font-size: 16px;">{{period}}<br>Оплат: <strong>{{payments_count}}</strong> на сумму <strong>{{payments_total}} ₽</strong></p>
+
+            {{items_html}}
+
+            <hr style="margin: 20px 0; border: none; border-top: 1px solid #ddd;">
+            <p style="font-size: 12px; color: #666;">
+                Это автоматическая сводка с сайта банкротства
+            </p>
+        </div>
+    </body>
+</html>
+''',
+    'admin_digest_item': '''
+            <div style="border-top: 1px solid #eee; padding: 10px 0;">
+                <p style="margin: 0; font-size: 12px; color: #666;">{{created_at}} · {{notification_type}}</p>
+                <p style="margin: 5px 0; font-weight: bold;">{{subject}}</p>
+                <p style="margin: 5px 0;">{{message}}</p>
+                {{details_html}}
+            </div>
+'''
+}
+
+BOUNDARY = f'===============bankrot{secrets.token_hex(8)}=='
+MESSAGE_HEAD = f'Content-Type: multipart/alternative; boundary="{BOUNDARY}"\r\nMIME-Version: 1.0\r\n'.encode('ascii')
+HTML_PART_HEAD = (
+    f'\r\n--{BOUNDARY}\r\n'
+    'Content-Type: text/html; charset="utf-8"\r\n'
+    'MIME-Version: 1.0\r\n'
+    'Content-Transfer-Encoding: base64\r\n\r\n'
+).encode('ascii')
+MESSAGE_TAIL = f'\r\n--{BOUNDARY}--\r\n'.encode('ascii')
+
+@lru_cache(maxsize=None)
+def _compile(source: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    '''Split a template into static chunks and slot names; chunks has one item more than slots'''
+    parts = SLOT_PATTERN.split(source)
+    return tuple(parts[0::2]), tuple(parts[1::2])
+
+def _render(source: str, slots: Dict[str, str], html: bool) -> str:
+    chunks, names = _compile(source)
+    out: List[str] = [chunks[0]]
+    for name, chunk in zip(names, chunks[1:]):
+        value = str(slots[name])
+        out.append(escape(value) if html and not name.endswith('_html') else value)
+        out.append(chunk)
+    return ''.join(out)
+
+def render(template: str, **slots: str) -> str:
+    '''Render the HTML body of a template; slot values are escaped unless the slot name ends in _html'''
+    return _render(TEMPLATES[template], slots, html=True)
+
+@lru_cache(maxsize=256)
+def _header(name: str, value: str) -> bytes:
+    if '\r' in value or '\n' in value:
+        raise ValueError(f'{name} header must be a single line')
+    if value.isascii():
+        return f'{name}: {value}\r\n'.encode('ascii')
+    encoded = Header(value, 'utf-8', header_name=name).encode(linesep='\r\n')
+    return f'{name}: {encoded}\r\n'.encode('ascii')
+
+def build_message(template: str, sender: str, recipient: str, **slots: str) -> bytes:
+    '''Render a template into a multipart/alternative message ready for smtplib sendmail'''
+    subject = _render(SUBJECTS[template], slots, html=False)
+    body = base64.encodebytes(render(template, **slots).encode('utf-8')).replace(b'\n', b'\r\n')
+    return b''.join((
+        MESSAGE_HEAD,
+        _header('Subject', subject),
+        _header('From', sender),
+        _header('To', recipient),
+        HTML_PART_HEAD,
+        body,
+        MESSAGE_TAIL
+    ))
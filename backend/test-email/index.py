@@ -7,9 +7,8 @@ Returns: Status of email sending
 import json
 import os
 from typing import Dict, Any
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email_templates import build_message
+from mail_transport import is_configured, send_message
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -53,87 +52,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Email required'})
         }
     
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', 465))
     smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
-    
-    if not all([smtp_host, smtp_user, smtp_password]):
+    if not is_configured():
         return {
             'statusCode': 500,
             'headers': headers_out,
             'body': json.dumps({'error': 'SMTP not configured'})
         }
     
-    subject = 'Доступ к чату с юристами — chat-bankrot.ru'
-    
-    html_body = f'''
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-</head>
-<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; border-radius: 10px 10px 0 0; text-align: center;">
-        <h1 style="color: white; margin: 0; font-size: 28px;">🎉 Добро пожаловать!</h1>
-    </div>
-    
-    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
-        <p style="font-size: 16px; margin-bottom: 20px;">Здравствуйте, <strong>{user_name}</strong>!</p>
-        
-        <p style="font-size: 16px; margin-bottom: 20px;">Спасибо за оплату! Ваш доступ к чату с юристами активирован на <strong>30 дней</strong>.</p>
-        
-        <div style="background: white; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #667eea;">
-            <h2 style="margin-top: 0; color: #667eea; font-size: 20px;">📝 Ваши данные для входа:</h2>
-            
-            <p style="margin: 15px 0;"><strong>Сайт:</strong> <a href="https://chat-bankrot.ru" style="color: #667eea; text-decoration: none;">chat-bankrot.ru</a></p>
-            
-            <p style="margin: 15px 0;"><strong>Email:</strong> <span style="background: #f0f0f0; padding: 5px 10px; border-radius: 4px; font-family: monospace;">{user_email}</span></p>
-            
-            <p style="margin: 15px 0;"><strong>Пароль:</strong> <span style="background: #fff3cd; padding: 5px 10px; border-radius: 4px; font-family: monospace; font-weight: bold;">{password}</span></p>
-        </div>
-        
-        <div style="background: #e8f4fd; padding: 20px; border-radius: 8px; margin: 25px 0;">
-            <h3 style="margin-top: 0; color: #0066cc; font-size: 18px;">💬 Как начать:</h3>
-            <ol style="margin: 10px 0; padding-left: 20px;">
-                <li style="margin: 8px 0;">Перейдите на сайт <a href="https://chat-bankrot.ru" style="color: #0066cc;">chat-bankrot.ru</a></li>
-                <li style="margin: 8px 0;">Войдите используя ваш email и пароль</li>
-                <li style="margin: 8px 0;">Задавайте вопросы юристам в чате</li>
-            </ol>
-        </div>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd;">
-            <strong>Важно:</strong> Сохраните это письмо — в нём содержится пароль для входа в систему.
-        </p>
-        
-        <p style="font-size: 14px; color: #666; margin-top: 15px;">
-            Если у вас возникнут вопросы, просто ответьте на это письмо.
-        </p>
-        
-        <div style="text-align: center; margin-top: 30px;">
-            <a href="https://chat-bankrot.ru" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; font-weight: bold; font-size: 16px;">Войти в чат</a>
-        </div>
-        
-        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #999;">
-            С уважением,<br>
-            <strong>Команда chat-bankrot.ru</strong>
-        </p>
-    </div>
-</body>
-</html>
-    '''
-    
     try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = smtp_user
-        msg['To'] = user_email
-        
-        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+        message = build_message(
+            'chat_welcome', smtp_user, user_email,
+            user_name=user_name,
+            user_email=user_email,
+            password=password
+        )
         
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        send_message(smtp_user, [user_email], message)
         
         return {
             'statusCode': 200,
@@ -1,15 +1,28 @@
 import json
 import base64
+import hashlib
+import re
 import uuid
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
-import boto3
-from botocore.exceptions import ClientError
+from db import get_connection, release_connection
+from object_storage import BUCKET_NAME, get_client, is_configured, object_url
 import jwt
 
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+UPLOAD_MIN_PART_SIZE = 5 * 1024 * 1024
+UPLOAD_MAX_PARTS = 10000
+UPLOAD_URL_TTL_SECONDS = 3600
+UPLOAD_SESSION_ACTIONS = ('start', 'resume', 'complete', 'abort')
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def bump_catalog_version(cur) -> None:
+    '''Invalidate cached course catalogs in the course function; call inside the write transaction'''
+    cur.execute("UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+
 def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
     if not auth_token:
@@ -29,11 +42,309 @@ def verify_admin(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     except:
         return None
 
+def json_response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': json.dumps(body)}
+
+def presign_parts(s3, session: Dict[str, Any], part_numbers: List[int]) -> List[Dict[str, Any]]:
+    '''Presigned PUT URLs for the given parts; signing is local, no request to the storage'''
+    return [
+        {
+            'partNumber': part_number,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': BUCKET_NAME,
+                    'Key': session['file_key'],
+                    'UploadId': session['s3_upload_id'],
+                    'PartNumber': part_number
+                },
+                ExpiresIn=UPLOAD_URL_TTL_SECONDS
+            )
+        }
+        for part_number in part_numbers
+    ]
+
+def list_uploaded_parts(s3, session: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Parts the storage already has for this multipart upload, across ListParts pages'''
+    parts = []
+    marker = 0
+    while True:
+        page = s3.list_parts(
+            Bucket=BUCKET_NAME,
+            Key=session['file_key'],
+            UploadId=session['s3_upload_id'],
+            PartNumberMarker=marker
+        )
+        parts.extend(page.get('Parts', []))
+        if not page.get('IsTruncated'):
+            return parts
+        marker = page['NextPartNumberMarker']
+
+def load_upload_session(cur, upload_id: str) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT * FROM upload_sessions WHERE id = %s FOR UPDATE", (upload_id,))
+    return cur.fetchone()
+
+def upload_session_response(s3, session: Dict[str, Any], uploaded: List[Dict[str, Any]]) -> Dict[str, Any]:
+    done = {part['PartNumber'] for part in uploaded}
+    missing = [n for n in range(1, session['part_count'] + 1) if n not in done]
+    return {
+        'uploadId': session['id'],
+        'partSize': session['part_size'],
+        'partCount': session['part_count'],
+        'uploadedParts': sorted(done),
+        'uploadedBytes': sum(part['Size'] for part in uploaded),
+        'parts': presign_parts(s3, session, missing)
+    }
+
+def normalize_sha256(value: Any) -> Optional[str]:
+    value = str(value or '').strip().lower()
+    return value if SHA256_PATTERN.match(value) else None
+
+def blob_key(sha256: str, file_name: str) -> str:
+    return f'course-files/{sha256}/{file_name}'
+
+def object_sha256(s3, file_key: str) -> str:
+    '''Hash the assembled object in storage, reading it in part-sized chunks'''
+    digest = hashlib.sha256()
+    body = s3.get_object(Bucket=BUCKET_NAME, Key=file_key)['Body']
+    for chunk in body.iter_chunks(UPLOAD_PART_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def reference_blob(cur, sha256: str, file_size: int) -> Optional[Dict[str, Any]]:
+    '''Take one more reference on a stored blob with this hash and size; None means the bytes still have to be uploaded'''
+    cur.execute(
+        "UPDATE file_blobs SET ref_count = ref_count + 1, last_referenced_at = CURRENT_TIMESTAMP WHERE sha256 = %s AND file_size = %s RETURNING *",
+        (sha256, file_size)
+    )
+    return cur.fetchone()
+
+def register_blob(cur, sha256: str, file_key: str, file_size: int, file_type: str) -> Dict[str, Any]:
+    '''Record freshly stored bytes with their first reference; if a parallel upload of the same file won, reference its blob'''
+    cur.execute(
+        """INSERT INTO file_blobs (sha256, file_key, file_size, file_type, ref_count)
+        VALUES (%s, %s, %s, %s, 1)
+        ON CONFLICT (sha256) DO UPDATE SET ref_count = file_blobs.ref_count + 1, last_referenced_at = CURRENT_TIMESTAMP
+        RETURNING *""",
+        (sha256, file_key, file_size, file_type)
+    )
+    return cur.fetchone()
+
+def insert_course_file(cur, course_file: Dict[str, Any]) -> int:
+    cur.execute(
+        """INSERT INTO course_files
+        (title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, blob_sha256, uploaded_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+        (
+            course_file['title'], course_file['description'], course_file['file_name'], course_file['file_url'],
+            course_file['file_type'], course_file['file_size'], course_file['lesson_id'], course_file['module_id'],
+            course_file['is_welcome_video'], course_file.get('blob_sha256'), datetime.utcnow()
+        )
+    )
+    return cur.fetchone()['id']
+
+def course_file_response(cur, course_file_id: int) -> Dict[str, Any]:
+    cur.execute("SELECT id, title, file_url, uploaded_at FROM course_files WHERE id = %s", (course_file_id,))
+    result = cur.fetchone()
+    return {
+        'id': result['id'],
+        'title': result['title'],
+        'url': result['file_url'],
+        'uploadedAt': result['uploaded_at'].isoformat()
+    }
+
+def start_upload_session(s3, cur, body_data: Dict[str, Any], admin_user: Dict[str, Any]) -> Dict[str, Any]:
+    '''Open a multipart upload and hand out presigned URLs for every part'''
+    file_name = body_data.get('fileName')
+    file_size = int(body_data.get('fileSize') or 0)
+    if not file_name or file_size <= 0:
+        return json_response(400, {'error': 'fileName and fileSize are required'})
+    
+    file_type = body_data.get('fileType', 'application/octet-stream')
+    sha256 = normalize_sha256(body_data.get('sha256'))
+    if sha256:
+        blob = reference_blob(cur, sha256, file_size)
+        if blob:
+            course_file_id = insert_course_file(cur, {
+                'title': body_data.get('title', file_name),
+                'description': body_data.get('description', ''),
+                'file_name': file_name,
+                'file_url': object_url(blob['file_key']),
+                'file_type': file_type,
+                'file_size': blob['file_size'],
+                'lesson_id': body_data.get('lessonId'),
+                'module_id': body_data.get('moduleId'),
+                'is_welcome_video': body_data.get('isWelcomeVideo', False),
+                'blob_sha256': sha256
+            })
+            bump_catalog_version(cur)
+            print(f"Upload of {file_name} deduplicated: blob {sha256[:12]} now has {blob['ref_count']} references")
+            return json_response(200, {'deduplicated': True, 'file': course_file_response(cur, course_file_id)})
+    
+    part_size = max(UPLOAD_PART_SIZE, -(-file_size // UPLOAD_MAX_PARTS))
+    part_size = max(part_size, UPLOAD_MIN_PART_SIZE)
+    # Хэш от браузера ещё не проверен, поэтому части собираются под случайным ключом, а не под blob_key
+    file_key = f'course-files/{uuid.uuid4()}/{file_name}'
+    
+    multipart = s3.create_multipart_upload(Bucket=BUCKET_NAME, Key=file_key, ContentType=file_type)
+    cur.execute(
+        """INSERT INTO upload_sessions
+        (id, s3_upload_id, file_key, file_name, file_type, file_size, part_size, part_count,
+         title, description, lesson_id, module_id, is_welcome_video, sha256, created_by)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING *""",
+        (
+            str(uuid.uuid4()), multipart['UploadId'], file_key, file_name, file_type, file_size,
+            part_size, -(-file_size // part_size), body_data.get('title', file_name), body_data.get('description', ''),
+            body_data.get('lessonId'), body_data.get('moduleId'), body_data.get('isWelcomeVideo', False), sha256, admin_user.get('id')
+        )
+    )
+    session = cur.fetchone()
+    print(f"Upload session {session['id']} started: {file_key}, {file_size} bytes in {session['part_count']} parts")
+    return json_response(200, {**upload_session_response(s3, session, []), 'deduplicated': False})
+
+def resume_upload_session(s3, cur, session: Dict[str, Any]) -> Dict[str, Any]:
+    '''Report which parts the storage already has and re-sign URLs for the rest'''
+    from botocore.exceptions import ClientError
+    
+    if session['status'] == 'completed':
+        return json_response(200, {'uploadId': session['id'], 'status': 'completed', 'file': course_file_response(cur, session['course_file_id'])})
+    
+    try:
+        uploaded = list_uploaded_parts(s3, session)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+            raise
+        # Незавершённую загрузку удалило правило жизненного цикла бакета: начинать заново
+        cur.execute("UPDATE upload_sessions SET status = 'aborted' WHERE id = %s", (session['id'],))
+        return json_response(410, {'error': 'Upload expired, start again'})
+    return json_response(200, upload_session_response(s3, session, uploaded))
+
+def complete_upload_session(s3, cur, session: Dict[str, Any]) -> Dict[str, Any]:
+    '''Assemble the uploaded parts and record the course_files row; repeating the call returns the same file'''
+    from botocore.exceptions import ClientError
+    
+    if session['status'] == 'completed':
+        return json_response(200, course_file_response(cur, session['course_file_id']))
+    
+    try:
+        uploaded = list_uploaded_parts(s3, session)
+        done = {part['PartNumber'] for part in uploaded}
+        missing = [n for n in range(1, session['part_count'] + 1) if n not in done]
+        if missing:
+            return json_response(409, {'error': 'Upload is incomplete', 'missingParts': missing})
+        
+        s3.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=session['file_key'],
+            UploadId=session['s3_upload_id'],
+            MultipartUpload={'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in sorted(uploaded, key=lambda p: p['PartNumber'])]}
+        )
+        file_size = sum(part['Size'] for part in uploaded)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+            raise
+        # Хранилище уже собрало файл, но запись в БД не успела сохраниться: проверяем объект
+        file_size = s3.head_object(Bucket=BUCKET_NAME, Key=session['file_key'])['ContentLength']
+    
+    file_key = session['file_key']
+    blob_sha256 = None
+    # Хэш присылает браузер: файл становится целью дедупликации только если размер и SHA-256
+    # собранного объекта совпали с заявленными, иначе он сохраняется как обычный файл
+    verified = (
+        session['sha256'] and file_size == session['file_size']
+        and object_sha256(s3, file_key) == session['sha256']
+    )
+    if session['sha256'] and not verified:
+        print(f"Upload session {session['id']}: stored object does not match the declared size or sha256, skipping deduplication")
+    if verified:
+        blob = register_blob(cur, session['sha256'], file_key, file_size, session['file_type'])
+        blob_sha256 = blob['sha256']
+        if blob['file_key'] != file_key:
+            s3.delete_object(Bucket=BUCKET_NAME, Key=file_key)
+            file_key = blob['file_key']
+    
+    course_file_id = insert_course_file(cur, {
+        'title': session['title'],
+        'description': session['description'],
+        'file_name': session['file_name'],
+        'file_url': object_url(file_key),
+        'file_type': session['file_type'],
+        'file_size': file_size,
+        'lesson_id': session['lesson_id'],
+        'module_id': session['module_id'],
+        'is_welcome_video': session['is_welcome_video'],
+        'blob_sha256': blob_sha256
+    })
+    cur.execute(
+        "UPDATE upload_sessions SET status = 'completed', course_file_id = %s, completed_at = CURRENT_TIMESTAMP WHERE id = %s",
+        (course_file_id, session['id'])
+    )
+    bump_catalog_version(cur)
+    print(f"Upload session {session['id']} completed as course file {course_file_id}")
+    return json_response(200, course_file_response(cur, course_file_id))
+
+def abort_upload_session(s3, cur, session: Dict[str, Any]) -> Dict[str, Any]:
+    from botocore.exceptions import ClientError
+    
+    if session['status'] == 'active':
+        try:
+            s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=session['file_key'], UploadId=session['s3_upload_id'])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+                raise
+        cur.execute("UPDATE upload_sessions SET status = 'aborted' WHERE id = %s", (session['id'],))
+    return json_response(200, {'uploadId': session['id'], 'status': 'aborted' if session['status'] == 'active' else session['status']})
+
+def handle_upload_session(action: str, body_data: Dict[str, Any], admin_user: Dict[str, Any]) -> Dict[str, Any]:
+    '''Direct-to-storage multipart uploads: start, resume, complete, abort'''
+    if not is_configured():
+        return json_response(500, {'error': 'S3 credentials not configured'})
+    
+    s3 = get_client()
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if action == 'start':
+                response = start_upload_session(s3, cur, body_data, admin_user)
+            else:
+                session = load_upload_session(cur, body_data.get('uploadId', ''))
+                if not session:
+                    conn.rollback()
+                    return json_response(404, {'error': 'Upload session not found'})
+                if session['status'] == 'aborted':
+                    conn.rollback()
+                    return json_response(410, {'error': 'Upload session was aborted'})
+                
+                if action == 'resume':
+                    response = resume_upload_session(s3, cur, session)
+                elif action == 'complete':
+                    response = complete_upload_session(s3, cur, session)
+                else:
+                    response = abort_upload_session(s3, cur, session)
+            conn.commit()
+            return response
+    except Exception as e:
+        conn.rollback()
+        print(f"Upload session {action} failed: {e}")
+        return json_response(500, {'error': f'Upload {action} failed: {str(e)}'})
+    finally:
+        release_connection(conn)
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Upload files (PDF, videos, documents) to S3 storage and save metadata to database
     Args: event with httpMethod, body, headers; context with request_id
     Returns: HTTP response with file URL and metadata
+    
+    Large files go straight from the browser to the bucket: POST ?action=start opens a multipart
+    upload and returns presigned part URLs, ?action=resume lists the parts already stored and
+    re-signs the rest, ?action=complete assembles the file and records course_files, ?action=abort
+    drops it. The bucket CORS must allow PUT from the admin site. The base64 fileContent body is
+    kept for small files only.
+    
+    Stored bytes are keyed by SHA-256 in file_blobs with a reference count. When start gets a
+    sha256 that is already stored, it records the file right away and nothing is uploaded.
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -69,6 +380,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
+        action = (event.get('queryStringParameters') or {}).get('action')
+        if action in UPLOAD_SESSION_ACTIONS:
+            return handle_upload_session(action, body_data, admin_user)
         
         print(f"Received POST request with body keys: {list(body_data.keys())}")
         
@@ -85,18 +399,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         print(f"Parsed data - fileName: {file_name}, lessonId: {lesson_id}, moduleId: {module_id}, externalUrl: {external_url}")
         
         if external_url:
-            conn = psycopg2.connect(database_url)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            cur.execute(
-                "INSERT INTO course_files (title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id, title, file_url, uploaded_at",
-                (title, description, title or 'external-video', external_url, file_type, 0, lesson_id, module_id, is_welcome_video, datetime.utcnow())
-            )
-            
-            result = cur.fetchone()
-            conn.commit()
-            cur.close()
-            conn.close()
+            conn = get_connection()
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(
+                    "INSERT INTO course_files (title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id, title, file_url, uploaded_at",
+                    (title, description, title or 'external-video', external_url, file_type, 0, lesson_id, module_id, is_welcome_video, datetime.utcnow())
+                )
+                
+                result = cur.fetchone()
+                bump_catalog_version(cur)
+                conn.commit()
+                cur.close()
+            finally:
+                release_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -133,58 +449,66 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'S3 credentials not configured'})
             }
         
-        s3_client = boto3.client(
-            's3',
-            endpoint_url='https://storage.yandexcloud.net',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name='ru-central1'
-        )
+        from botocore.exceptions import ClientError
         
-        bucket_name = 'poehalidev-user-files'
-        file_key = f'course-files/{uuid.uuid4()}/{file_name}'
+        s3 = get_client()
+        bucket_name = BUCKET_NAME
+        sha256 = hashlib.sha256(file_data).hexdigest()
         
+        conn = get_connection()
         try:
-            print(f"Uploading to S3 - Bucket: {bucket_name}, Key: {file_key}")
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=file_key,
-                Body=file_data,
-                ContentType=file_type
-            )
-            print(f"Successfully uploaded to S3")
-        except ClientError as e:
-            print(f"S3 upload error: {str(e)}")
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'S3 upload failed: {str(e)}'})
-            }
-        
-        file_url = f'https://storage.yandexcloud.net/{bucket_name}/{file_key}'
-        
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute(
-            "INSERT INTO course_files (title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id, title, file_url, uploaded_at",
-            (title, description, file_name, file_url, file_type, len(file_data), lesson_id, module_id, is_welcome_video, datetime.utcnow())
-        )
-        
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            blob = reference_blob(cur, sha256, len(file_data))
+            
+            if blob:
+                print(f"Upload of {file_name} deduplicated: blob {sha256[:12]} now has {blob['ref_count']} references")
+            else:
+                file_key = blob_key(sha256, file_name)
+                try:
+                    print(f"Uploading to S3 - Bucket: {bucket_name}, Key: {file_key}")
+                    s3.put_object(
+                        Bucket=bucket_name,
+                        Key=file_key,
+                        Body=file_data,
+                        ContentType=file_type
+                    )
+                    print("Successfully uploaded to S3")
+                except ClientError as e:
+                    conn.rollback()
+                    print(f"S3 upload error: {str(e)}")
+                    return {
+                        'statusCode': 500,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'S3 upload failed: {str(e)}'})
+                    }
+                
+                blob = register_blob(cur, sha256, file_key, len(file_data), file_type)
+                if blob['file_key'] != file_key:
+                    s3.delete_object(Bucket=bucket_name, Key=file_key)
+            
+            course_file_id = insert_course_file(cur, {
+                'title': title,
+                'description': description,
+                'file_name': file_name,
+                'file_url': object_url(blob['file_key']),
+                'file_type': file_type,
+                'file_size': len(file_data),
+                'lesson_id': lesson_id,
+                'module_id': module_id,
+                'is_welcome_video': is_welcome_video,
+                'blob_sha256': sha256
+            })
+            bump_catalog_version(cur)
+            result = course_file_response(cur, course_file_id)
+            conn.commit()
+            cur.close()
+        finally:
+            release_connection(conn)
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'id': result['id'],
-                'title': result['title'],
-                'url': result['file_url'],
-                'uploadedAt': result['uploaded_at'].isoformat()
-            })
+            'body': json.dumps(result)
         }
     
     if method == 'GET':
@@ -193,18 +517,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         lesson_id = query_params.get('lesson_id')
         module_id = query_params.get('module_id')
         
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            
+            if file_id:
+                cur.execute(
+                    "SELECT file_name, file_url FROM course_files WHERE id = %s",
+                    (file_id,)
+                )
+                file_record = cur.fetchone()
+            elif lesson_id:
+                cur.execute(
+                    "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files WHERE lesson_id = %s ORDER BY uploaded_at DESC",
+                    (lesson_id,)
+                )
+            elif module_id:
+                cur.execute(
+                    "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files WHERE module_id = %s ORDER BY uploaded_at DESC",
+                    (module_id,)
+                )
+            else:
+                cur.execute(
+                    "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files ORDER BY uploaded_at DESC"
+                )
+            
+            if not file_id:
+                files = cur.fetchall()
+            cur.close()
+        finally:
+            release_connection(conn)
         
         if file_id:
-            cur.execute(
-                "SELECT file_name, file_url FROM course_files WHERE id = %s",
-                (file_id,)
-            )
-            file_record = cur.fetchone()
-            cur.close()
-            conn.close()
-            
             if not file_record or not file_record['file_url']:
                 return {
                     'statusCode': 404,
@@ -221,25 +565,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': ''
             }
         
-        if lesson_id:
-            cur.execute(
-                "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files WHERE lesson_id = %s ORDER BY uploaded_at DESC",
-                (lesson_id,)
-            )
-        elif module_id:
-            cur.execute(
-                "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files WHERE module_id = %s ORDER BY uploaded_at DESC",
-                (module_id,)
-            )
-        else:
-            cur.execute(
-                "SELECT id, title, description, file_name, file_url, file_type, file_size, lesson_id, module_id, is_welcome_video, uploaded_at FROM course_files ORDER BY uploaded_at DESC"
-            )
-        
-        files = cur.fetchall()
-        cur.close()
-        conn.close()
-        
         files_list = []
         for f in files:
             files_list.append({
@@ -273,15 +598,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'id parameter is required'})
             }
         
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute("DELETE FROM course_files WHERE id = %s RETURNING id", (file_id,))
-        result = cur.fetchone()
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        conn = get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("DELETE FROM course_files WHERE id = %s RETURNING id, blob_sha256", (file_id,))
+            result = cur.fetchone()
+            
+            if result:
+                # Объект в хранилище остаётся; blob без ссылок потом убирает сборщик мусора
+                if result['blob_sha256']:
+                    cur.execute("UPDATE file_blobs SET ref_count = ref_count - 1 WHERE sha256 = %s", (result['blob_sha256'],))
+                bump_catalog_version(cur)
+            conn.commit()
+            cur.close()
+        finally:
+            release_connection(conn)
         
         if not result:
             return {
@@ -0,0 +1,81 @@
+'''
+Business: One S3 client for the course-files bucket in Yandex Object Storage, kept across warm invocations
+Args: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY; optional S3_ENDPOINT_URL, S3_MAX_POOL_CONNECTIONS,
+      S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT
+Returns: get_client() for uploads, deletes and presigned URLs; object_url() and key_from_url()
+         map bucket keys to course_files.file_url and back
+
+The same file is copied into every backend function that works with the course-files bucket.
+Keep the copies identical.
+
+Building a boto3 client parses botocore's service model and starts with an empty connection pool,
+so a client per request costs tens of milliseconds of CPU plus a new TLS handshake. The client is
+built on first use and kept at module level; it is rebuilt only when the endpoint or credentials
+change. boto3 clients are thread-safe, so parallel part uploads can share it.
+'''
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+S3_ENDPOINT = 'https://storage.yandexcloud.net'
+S3_REGION = 'ru-central1'
+BUCKET_NAME = 'poehalidev-user-files'
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {'client': None, 'key': None}
+_stats = {'clients': 0}
+
+def endpoint_url() -> str:
+    return os.environ.get('S3_ENDPOINT_URL') or S3_ENDPOINT
+
+def is_configured() -> bool:
+    return bool(os.environ.get('AWS_ACCESS_KEY_ID') and os.environ.get('AWS_SECRET_ACCESS_KEY'))
+
+def _build_client(endpoint: str, access_key: str, secret_key: str):
+    import boto3
+    from botocore.config import Config
+    
+    config = Config(
+        region_name=S3_REGION,
+        max_pool_connections=int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '16')),
+        connect_timeout=float(os.environ.get('S3_CONNECT_TIMEOUT', '5')),
+        read_timeout=float(os.environ.get('S3_READ_TIMEOUT', '60')),
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        tcp_keepalive=True
+    )
+    client = boto3.session.Session().client(
+        's3',
+        endpoint_url=endpoint,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        config=config
+    )
+    _stats['clients'] += 1
+    return client
+
+def get_client():
+    '''Shared S3 client; the first call in a container builds it, later calls reuse it and its connections'''
+    key = (endpoint_url(), os.environ.get('AWS_ACCESS_KEY_ID'), os.environ.get('AWS_SECRET_ACCESS_KEY'))
+    client = _state['client']
+    if client is not None and _state['key'] == key:
+        return client
+    
+    with _lock:
+        if _state['client'] is None or _state['key'] != key:
+            _state['client'] = _build_client(*key)
+            _state['key'] = key
+        return _state['client']
+
+def object_url(file_key: str) -> str:
+    return f'{endpoint_url()}/{BUCKET_NAME}/{file_key}'
+
+def key_from_url(file_url: Optional[str]) -> Optional[str]:
+    '''Bucket key behind a course_files.file_url; None for external links and other buckets'''
+    marker = f'/{BUCKET_NAME}/'
+    if not file_url or marker not in file_url:
+        return None
+    return file_url.split(marker, 1)[1].split('?', 1)[0]
+
+def client_stats() -> Dict[str, int]:
+    return dict(_stats)
@@ -0,0 +1,113 @@
+'''
+Cold-start benchmark for backend functions.
+
+For every backend/<function>/index.py it starts a fresh interpreter and records
+  - import_us: cumulative `python -X importtime` cost of `import index`
+  - first_request_ms: wall time of import plus the first OPTIONS handler call
+and prints one JSON line per function.
+
+Usage:
+  python bench_cold_start.py                         # all functions
+  python bench_cold_start.py payment upload-file     # selected functions
+  python bench_cold_start.py --save bench_baseline.json
+  python bench_cold_start.py --baseline bench_baseline.json --tolerance 0.25
+
+With --baseline the script exits with code 1 if any function got slower than the
+baseline by more than the tolerance, so it can be run before merging backend changes.
+Function dependencies (requirements.txt) must be installed in the current interpreter.
+'''
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+FIRST_REQUEST_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import index
+index.handler({'httpMethod': 'OPTIONS', 'headers': {}, 'queryStringParameters': {}}, None)
+print(json.dumps({'first_request_ms': (time.perf_counter() - start) * 1000}))
+'''
+
+def list_functions():
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+def measure_import_time(function_dir):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import index'],
+        cwd=function_dir, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+index$', line)
+        if match:
+            return int(match.group(1))
+    raise RuntimeError('index not found in -X importtime output')
+
+def measure_first_request(function_dir, runs):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', FIRST_REQUEST_SCRIPT],
+            cwd=function_dir, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1])['first_request_ms'])
+    return sorted(samples)[len(samples) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start cost of backend functions')
+    parser.add_argument('functions', nargs='*')
+    parser.add_argument('--runs', type=int, default=5, help='first-request samples per function (median is reported)')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a file written with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs baseline, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.functions or list_functions():
+        function_dir = os.path.join(BACKEND_DIR, name)
+        try:
+            results[name] = {
+                'import_us': measure_import_time(function_dir),
+                'first_request_ms': round(measure_first_request(function_dir, args.runs), 2)
+            }
+        except RuntimeError as e:
+            results[name] = {'error': str(e)}
+        print(json.dumps({'function': name, **results[name]}))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if not previous or 'error' in current or 'error' in previous:
+                continue
+            for metric in ('import_us', 'first_request_ms'):
+                if current[metric] > previous[metric] * (1 + args.tolerance):
+                    regressions.append(f'{name}.{metric}: {previous[metric]} -> {current[metric]}')
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
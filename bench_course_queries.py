@@ -0,0 +1,129 @@
+'''
+Query-count check for the course content API (backend/course).
+
+Seeds catalogs of growing size inside one transaction, calls get_course_content for a
+student with progress on every lesson and counts the SQL statements it executes
+  - cold: the per-instance catalog cache is empty, the tree is loaded from the database
+  - warm: the catalog cache is hit, only access, ETag and progress queries run
+and prints one JSON line per catalog size. The transaction is rolled back at the end,
+so nothing is left in the database.
+
+Usage:
+  DATABASE_URL=postgres://... python bench_course_queries.py
+  DATABASE_URL=postgres://... python bench_course_queries.py --sizes 1 10 50 --lessons 8
+
+Exits with code 1 if the number of queries changes with the catalog size, i.e. a
+per-module or per-lesson query (N+1) has come back into the loader.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'course'))
+import index
+
+class CountingCursor(RealDictCursor):
+    executed = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executed += 1
+        return super().execute(query, vars)
+
+def seed_catalog(cur, user_id, modules, lessons_per_module):
+    for m in range(modules):
+        cur.execute(
+            "INSERT INTO course_modules (title, sort_order, is_published) VALUES (%s, %s, TRUE) RETURNING id",
+            (f'Bench module {m}', 10000 + m)
+        )
+        module_id = cur.fetchone()['id']
+        cur.execute(
+            "INSERT INTO materials (module_id, title, file_url) VALUES (%s, 'Module material', 'https://example.com/m.pdf')",
+            (module_id,)
+        )
+        cur.execute(
+            """INSERT INTO course_files (title, file_name, file_url, file_type, file_size, module_id)
+            VALUES ('Module file', 'm.pdf', 'https://example.com/m.pdf', 'application/pdf', 1, %s)""",
+            (module_id,)
+        )
+        for l in range(lessons_per_module):
+            cur.execute(
+                "INSERT INTO lessons (module_id, title, sort_order, is_published) VALUES (%s, %s, %s, TRUE) RETURNING id",
+                (module_id, f'Bench lesson {m}.{l}', l)
+            )
+            lesson_id = cur.fetchone()['id']
+            cur.execute(
+                "INSERT INTO materials (lesson_id, title, file_url) VALUES (%s, 'Lesson material', 'https://example.com/l.pdf')",
+                (lesson_id,)
+            )
+            cur.execute(
+                """INSERT INTO course_files (title, file_name, file_url, file_type, file_size, lesson_id)
+                VALUES ('Lesson file', 'l.pdf', 'https://example.com/l.pdf', 'application/pdf', 1, %s)""",
+                (lesson_id,)
+            )
+            cur.execute(
+                "INSERT INTO user_progress (user_id, lesson_id, watch_time_seconds) VALUES (%s, %s, 60)",
+                (user_id, lesson_id)
+            )
+    cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+
+def count_queries(user):
+    CountingCursor.executed = 0
+    start = time.perf_counter()
+    response = index.get_course_content(user, {'headers': {}}, {})
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"get_course_content returned {response['statusCode']}: {response['body']}")
+    return CountingCursor.executed, elapsed_ms, len(json.loads(response['body']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the course API query count does not grow with the catalog')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help='numbers of modules to seed')
+    parser.add_argument('--lessons', type=int, default=5, help='lessons per module')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    index.get_connection = lambda: conn
+    index.release_connection = lambda c: None
+    index.RealDictCursor = CountingCursor
+
+    results = []
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                "INSERT INTO users (email, password_hash, full_name) VALUES ('bench-course@example.com', 'x', 'Bench') RETURNING id"
+            )
+            user = {'id': cur.fetchone()['id'], 'is_admin': True}
+
+            seeded = 0
+            for size in sorted(args.sizes):
+                seed_catalog(cur, user['id'], size - seeded, args.lessons)
+                seeded = size
+
+                index._catalog_cache.update({'version': None, 'modules': None})
+                cold, cold_ms, modules = count_queries(user)
+                warm, warm_ms, _ = count_queries(user)
+                result = {
+                    'modules': size, 'lessons': size * args.lessons, 'returned_modules': modules,
+                    'cold_queries': cold, 'warm_queries': warm,
+                    'cold_ms': round(cold_ms, 2), 'warm_ms': round(warm_ms, 2)
+                }
+                results.append(result)
+                print(json.dumps(result))
+    finally:
+        conn.rollback()
+        conn.close()
+
+    for metric in ('cold_queries', 'warm_queries'):
+        counts = {r[metric] for r in results}
+        if len(counts) > 1:
+            print(f'REGRESSION {metric} grows with the catalog: {[r[metric] for r in results]}', file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+Render+encode micro-benchmark for the shared email templates.
+
+Compares, per template, building a complete message
+  - legacy: formatting the whole HTML per send and serialising it with
+    MIMEMultipart/MIMEText (what the senders did before email_templates.py)
+  - compiled: email_templates.build_message (pre-split template, cached MIME envelope)
+and prints one JSON line per template with messages/second and the speedup.
+
+Usage:
+  python bench_email_templates.py
+  python bench_email_templates.py --seconds 2 course_credentials password_reset
+
+Before timing, both paths are checked to produce the same decoded HTML body and subject.
+'''
+
+import argparse
+import email
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from email import policy
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from html import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'payment'))
+import email_templates
+
+SENDER = 'noreply@bankrot-kurs.ru'
+RECIPIENT = 'client@example.com'
+
+def sample_slots(template):
+    if template == 'course_credentials':
+        return {
+            'user_name': 'Иван Петров',
+            'user_email': RECIPIENT,
+            'login_link': 'https://bankrot-kurs.ru/login?magic=42.1760000000.nonce.signature',
+            'chat_bonus_html': email_templates.render(
+                'chat_bonus', chat_token='chat_0123456789abcdef',
+                expires_date=datetime(2026, 11, 18).strftime('%d.%m.%Y')
+            )
+        }
+    if template == 'chat_welcome':
+        return {'user_name': 'Иван Петров', 'user_email': RECIPIENT, 'password': 'Qw3rty12'}
+    if template == 'password_reset':
+        return {'user_name': 'Иван Петров', 'reset_url': 'https://bankrot-kurs.ru/reset-password?token=abcdef0123456789'}
+    if template == 'admin_notification':
+        return {
+            'subject': 'Новая оплата курса',
+            'message': 'Клиент Иван Петров успешно оплатил курс',
+            'details_html': email_templates.render('admin_details', details=json.dumps({'amount': 2999, 'payment_id': '2f1c'}, indent=2)),
+            'notification_type': 'payment'
+        }
+    if template == 'admin_digest':
+        items_html = ''.join(
+            email_templates.render(
+                'admin_digest_item', created_at=f'18.10.2026 1{i}:05', notification_type='payment',
+                subject='Новая оплата курса', message='Клиент Иван Петров успешно оплатил курс',
+                details_html=email_templates.render('admin_details', details=json.dumps({'amount': 2999, 'payment_id': f'2f1c{i}'}, indent=2))
+            )
+            for i in range(3)
+        )
+        return {
+            'count': '3',
+            'period': '18.10.2026 10:05 — 18.10.2026 12:05',
+            'payments_count': '3',
+            'payments_total': '8 997',
+            'items_html': items_html
+        }
+    raise ValueError(f'no sample slots for {template}')
+
+def legacy_message(template, slots):
+    '''Format the full template per send, as the f-strings did, and serialise through email.mime'''
+    escaped = {name: value if name.endswith('_html') else escape(value) for name, value in slots.items()}
+    html_body = email_templates.TEMPLATES[template].replace('{{', '{').replace('}}', '}').format(**escaped)
+    subject = email_templates.SUBJECTS[template].replace('{{', '{').replace('}}', '}').format(**slots)
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = SENDER
+    msg['To'] = RECIPIENT
+    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return msg.as_bytes()
+
+def compiled_message(template, slots):
+    return email_templates.build_message(template, SENDER, RECIPIENT, **slots)
+
+def decoded(message):
+    parsed = email.message_from_bytes(message, policy=policy.default)
+    return str(parsed['Subject']), parsed.get_payload()[0].get_content()
+
+def throughput(build, template, slots, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            build(template, slots)
+        count += 50
+    return count / (time.perf_counter() - start)
+
+def main():
+    templates = [name for name in email_templates.TEMPLATES if name in email_templates.SUBJECTS]
+    parser = argparse.ArgumentParser(description='Measure email render+encode throughput')
+    parser.add_argument('templates', nargs='*', help=f'default: all of {", ".join(templates)}')
+    parser.add_argument('--seconds', type=float, default=1.0, help='measuring time per template and path')
+    args = parser.parse_args()
+
+    for template in args.templates or templates:
+        if template not in templates:
+            parser.error(f'unknown template {template}')
+        slots = sample_slots(template)
+        if decoded(legacy_message(template, slots)) != decoded(compiled_message(template, slots)):
+            print(json.dumps({'template': template, 'error': 'legacy and compiled output differ'}))
+            sys.exit(1)
+
+        legacy = throughput(legacy_message, template, slots, args.seconds)
+        compiled = throughput(compiled_message, template, slots, args.seconds)
+        print(json.dumps({
+            'template': template,
+            'legacy_per_sec': round(legacy),
+            'compiled_per_sec': round(compiled),
+            'speedup': round(compiled / legacy, 1)
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+S3 client reuse benchmark for upload-file, run against tools/s3_standin.py.
+
+Each simulated request uploads a small object, signs a part URL and deletes the object, done
+two ways; one JSON line is printed per mode:
+  - per_request: boto3.client(...) built inside every request (what upload-file did before)
+  - shared: object_storage.get_client(), built once and reused with its connection pool
+
+Usage:
+  python tools/s3_standin.py --port 9000 --handshake-ms 40 &
+  python bench_s3_client.py --endpoint http://127.0.0.1:9000 --requests 100
+
+--handshake-ms on the stand-in charges every new connection, which is what the TLS handshake
+with storage.yandexcloud.net costs a fresh client in production.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'upload-file'))
+import object_storage
+
+def fresh_client(endpoint):
+    import boto3
+
+    return boto3.client(
+        's3',
+        endpoint_url=endpoint,
+        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+        region_name=object_storage.S3_REGION
+    )
+
+def simulated_request(s3, body):
+    key = f'bench/{uuid.uuid4()}/file.pdf'
+    s3.put_object(Bucket=object_storage.BUCKET_NAME, Key=key, Body=body, ContentType='application/pdf')
+    s3.generate_presigned_url(
+        'upload_part',
+        Params={'Bucket': object_storage.BUCKET_NAME, 'Key': key, 'UploadId': 'bench', 'PartNumber': 1},
+        ExpiresIn=3600
+    )
+    s3.delete_object(Bucket=object_storage.BUCKET_NAME, Key=key)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-request S3 client cost against the stand-in')
+    parser.add_argument('--endpoint', default='http://127.0.0.1:9000')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--object-kb', type=int, default=64)
+    args = parser.parse_args()
+
+    os.environ.update({
+        'S3_ENDPOINT_URL': args.endpoint,
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'bench'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'bench')
+    })
+    body = os.urandom(args.object_kb * 1024)
+
+    modes = (
+        ('per_request', lambda: fresh_client(args.endpoint)),
+        ('shared', object_storage.get_client)
+    )
+    for name, client_for_request in modes:
+        before = object_storage.client_stats()['clients']
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            simulated_request(client_for_request(), body)
+            timings.append((time.perf_counter() - start) * 1000)
+        built = object_storage.client_stats()['clients'] - before
+        print(json.dumps({
+            'mode': name,
+            'requests': args.requests,
+            'clients_built': args.requests if name == 'per_request' else built,
+            'mean_ms': round(statistics.mean(timings), 2),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(sorted(timings)[int(len(timings) * 0.95) - 1], 2),
+            'first_ms': round(timings[0], 2)
+        }))
+
+if __name__ == '__main__':
+    main()
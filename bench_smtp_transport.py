@@ -0,0 +1,83 @@
+'''
+Mail delivery throughput benchmark, run against tools/smtp_standin.py.
+
+Sends the same course-credentials message N times three ways and prints one JSON line each:
+  - per_message: new connection + login + send + quit per mail (what the senders did before)
+  - persistent: mail_transport.send_message, one session reused across sends
+  - batch: mail_transport.send_messages with the whole queue at once
+
+Usage:
+  python tools/smtp_standin.py --port 8025 --handshake-ms 150 --drop-after 40 &
+  python bench_smtp_transport.py --port 8025 --messages 200
+
+With --drop-after on the stand-in, the persistent and batch rows also report how many
+reconnects the transport needed; every message must still be delivered.
+'''
+
+import argparse
+import json
+import os
+import smtplib
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'payment'))
+import email_templates
+import mail_transport
+
+SENDER = 'noreply@bankrot-kurs.ru'
+RECIPIENT = 'client@example.com'
+
+def per_message(message, count, port):
+    for _ in range(count):
+        with smtplib.SMTP('127.0.0.1', port, timeout=10) as server:
+            server.login('bench', 'bench')
+            server.sendmail(SENDER, [RECIPIENT], message)
+    return 0
+
+def persistent(message, count, port):
+    for _ in range(count):
+        mail_transport.send_message(SENDER, [RECIPIENT], message)
+    return 0
+
+def batch(message, count, port):
+    results = mail_transport.send_messages([(SENDER, [RECIPIENT], message)] * count)
+    return sum(1 for error in results if error)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure SMTP delivery throughput against the stand-in')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--messages', type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ.update({
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': str(args.port),
+        'SMTP_SECURITY': 'none',
+        'SMTP_USER': 'bench',
+        'SMTP_PASSWORD': 'bench'
+    })
+    message = email_templates.build_message(
+        'course_credentials', SENDER, RECIPIENT,
+        user_name='Иван Петров', user_email=RECIPIENT,
+        login_link='https://bankrot-kurs.ru/login?magic=42.1760000000.nonce.signature', chat_bonus_html=''
+    )
+
+    for name, run in (('per_message', per_message), ('persistent', persistent), ('batch', batch)):
+        mail_transport._close()
+        before = mail_transport.transport_stats()
+        start = time.perf_counter()
+        failed = run(message, args.messages, args.port)
+        elapsed = time.perf_counter() - start
+        after = mail_transport.transport_stats()
+        print(json.dumps({
+            'mode': name,
+            'messages': args.messages,
+            'failed': failed,
+            'per_sec': round(args.messages / elapsed, 1),
+            'connections': after['connections'] - before['connections'] if name != 'per_message' else args.messages,
+            'reconnects': after['reconnects'] - before['reconnects']
+        }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+-- Версия каталога курса: увеличивается при каждом изменении модулей, уроков, материалов и файлов
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,43 @@
+-- Проекция активного доступа: одна строка на пользователя и продукт вместо COUNT(*) по всей истории покупок
+CREATE TABLE IF NOT EXISTS user_entitlements (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    product VARCHAR(50) NOT NULL,
+    expires_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, product)
+);
+
+-- Источники доступа: оплаченные покупки и ручные доступы к чату, привязанные к пользователю
+CREATE OR REPLACE VIEW user_entitlement_sources AS
+SELECT user_id,
+       COALESCE(product_type, 'course') AS product,
+       CASE WHEN bool_or(expires_at IS NULL) THEN NULL ELSE MAX(expires_at) END AS expires_at
+FROM (
+    SELECT user_id, product_type, expires_at
+    FROM user_purchases
+    WHERE payment_status = 'completed'
+    UNION ALL
+    SELECT user_id, 'chat', access_end
+    FROM chat_access
+    WHERE user_id IS NOT NULL AND is_active = true
+) sources
+GROUP BY user_id, COALESCE(product_type, 'course');
+
+-- Расхождения между проекцией и источниками (пусто, если всё согласовано)
+CREATE OR REPLACE VIEW user_entitlements_drift AS
+SELECT COALESCE(s.user_id, e.user_id) AS user_id,
+       COALESCE(s.product, e.product) AS product,
+       s.expires_at AS expected_expires_at,
+       e.expires_at AS actual_expires_at
+FROM user_entitlement_sources s
+FULL OUTER JOIN user_entitlements e ON e.user_id = s.user_id AND e.product = s.product
+WHERE s.user_id IS NULL
+   OR e.user_id IS NULL
+   OR s.expires_at IS DISTINCT FROM e.expires_at;
+
+-- Первичное заполнение
+INSERT INTO user_entitlements (user_id, product, expires_at)
+SELECT user_id, product, expires_at FROM user_entitlement_sources
+ON CONFLICT (user_id, product) DO UPDATE SET
+    expires_at = EXCLUDED.expires_at,
+    updated_at = CURRENT_TIMESTAMP;
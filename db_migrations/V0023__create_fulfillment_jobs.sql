@@ -0,0 +1,21 @@
+-- Очередь выдачи доступа после оплаты: вебхук только записывает задание, побочные эффекты выполняет воркер
+CREATE TABLE IF NOT EXISTS fulfillment_jobs (
+    id SERIAL PRIMARY KEY,
+    payment_id VARCHAR(255) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    product_type VARCHAR(50) NOT NULL DEFAULT 'course',
+    amount DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 8,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    steps JSONB NOT NULL DEFAULT '{}'::jsonb,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Воркер выбирает готовые к запуску задания по run_after
+CREATE INDEX IF NOT EXISTS idx_fulfillment_jobs_ready ON fulfillment_jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS idx_fulfillment_jobs_payment ON fulfillment_jobs(payment_id);
@@ -0,0 +1,17 @@
+-- Журнал обработанных событий оплаты: повторная доставка вебхука или опрос статуса не запускают выдачу доступа второй раз
+CREATE TABLE IF NOT EXISTS payment_events (
+    payment_id VARCHAR(255) NOT NULL,
+    event_type VARCHAR(50) NOT NULL,
+    user_id INTEGER REFERENCES users(id),
+    source VARCHAR(20) NOT NULL,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (payment_id, event_type)
+);
+
+-- Уже оплаченные покупки считаем обработанными
+INSERT INTO payment_events (payment_id, event_type, user_id, source)
+SELECT DISTINCT ON (payment_id) payment_id, 'payment.succeeded', user_id, 'backfill'
+FROM user_purchases
+WHERE payment_status = 'completed' AND payment_id IS NOT NULL
+ORDER BY payment_id, id
+ON CONFLICT (payment_id, event_type) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Явные состояния выдачи доступа: pending -> paid -> provisioned -> notified
+ALTER TABLE user_purchases ADD COLUMN IF NOT EXISTS fulfillment_state VARCHAR(20) NOT NULL DEFAULT 'pending';
+
+ALTER TABLE user_purchases ADD CONSTRAINT user_purchases_fulfillment_state_check
+    CHECK (fulfillment_state IN ('pending', 'paid', 'provisioned', 'notified'));
+
+-- Оплаченные покупки считаем полностью обработанными, кроме тех, чьё задание ещё в очереди
+UPDATE user_purchases up
+SET fulfillment_state = CASE
+    WHEN EXISTS (
+        SELECT 1 FROM fulfillment_jobs fj
+        WHERE fj.payment_id = up.payment_id AND fj.status IN ('pending', 'processing')
+    ) THEN 'paid'
+    ELSE 'notified'
+END
+WHERE up.payment_status = 'completed';
@@ -0,0 +1,2 @@
+-- Опрос статуса оплаты и вебхук ищут покупку по payment_id
+CREATE INDEX IF NOT EXISTS idx_user_purchases_payment_id ON user_purchases(payment_id);
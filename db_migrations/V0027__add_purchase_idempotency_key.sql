@@ -0,0 +1,6 @@
+-- Ключ идемпотентности от клиента: повторное создание платежа возвращает сохранённую ссылку на оплату
+ALTER TABLE user_purchases ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+ALTER TABLE user_purchases ADD COLUMN IF NOT EXISTS confirmation_url TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_purchases_idempotency_key
+    ON user_purchases(idempotency_key) WHERE idempotency_key IS NOT NULL;
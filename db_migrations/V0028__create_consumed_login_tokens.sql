@@ -0,0 +1,12 @@
+-- Одноразовые ссылки для входа: подпись проверяется без БД, использованные ссылки запоминаются здесь
+CREATE TABLE IF NOT EXISTS consumed_login_tokens (
+    nonce VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    expires_at TIMESTAMP NOT NULL,
+    consumed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_consumed_login_tokens_expires ON consumed_login_tokens(expires_at);
+
+-- Покупатель получает ссылку для входа вместо пароля, пароль задаётся позже
+ALTER TABLE users ALTER COLUMN password_hash DROP NOT NULL;
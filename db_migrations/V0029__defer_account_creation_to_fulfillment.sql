@@ -0,0 +1,39 @@
+-- Аккаунт создаётся при оплате: неоплаченная покупка хранит только email и имя покупателя
+ALTER TABLE user_purchases ALTER COLUMN user_id DROP NOT NULL;
+ALTER TABLE user_purchases ADD COLUMN IF NOT EXISTS customer_email VARCHAR(255);
+ALTER TABLE user_purchases ADD COLUMN IF NOT EXISTS customer_name VARCHAR(255);
+
+UPDATE user_purchases up
+SET customer_email = u.email,
+    customer_name = u.full_name
+FROM users u
+WHERE u.id = up.user_id AND up.customer_email IS NULL;
+
+-- Удаляем пользователей-заглушки: созданы оформлением заказа (не раньше первой покупки),
+-- ни разу не оплатили и больше нигде не упоминаются. Их покупки остаются с контактами без user_id
+WITH stub_users AS (
+    SELECT u.id
+    FROM users u
+    JOIN user_purchases up ON up.user_id = u.id
+    WHERE u.is_admin = false
+    GROUP BY u.id, u.created_at
+    HAVING bool_and(up.payment_status <> 'completed')
+       AND u.created_at >= MIN(up.purchase_date) - INTERVAL '1 minute'
+),
+unreferenced AS (
+    SELECT s.id FROM stub_users s
+    WHERE NOT EXISTS (SELECT 1 FROM user_progress WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM user_entitlements WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM chat_access WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM chat_tokens WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM password_reset_tokens WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM consumed_login_tokens WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM fulfillment_jobs WHERE user_id = s.id)
+      AND NOT EXISTS (SELECT 1 FROM payment_events WHERE user_id = s.id)
+),
+detached AS (
+    UPDATE user_purchases SET user_id = NULL
+    WHERE user_id IN (SELECT id FROM unreferenced)
+    RETURNING user_id
+)
+DELETE FROM users WHERE id IN (SELECT id FROM unreferenced);
@@ -0,0 +1,20 @@
+-- Уведомления администратору: обычные события копятся и уходят одной сводкой по расписанию, крупные оплаты и сбои отправляются сразу
+CREATE TABLE IF NOT EXISTS admin_notifications (
+    id SERIAL PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    payment_id VARCHAR(255),
+    subject VARCHAR(255) NOT NULL,
+    message TEXT NOT NULL,
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+    amount DECIMAL(10, 2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Повторный шаг выдачи доступа не создаёт второе уведомление по той же оплате
+CREATE UNIQUE INDEX IF NOT EXISTS idx_admin_notifications_event_payment
+    ON admin_notifications(event_type, payment_id) WHERE payment_id IS NOT NULL;
+
+-- Выборка неотправленных уведомлений для сводки
+CREATE INDEX IF NOT EXISTS idx_admin_notifications_unsent
+    ON admin_notifications(id) WHERE sent_at IS NULL;
@@ -0,0 +1,28 @@
+-- Сессии загрузки файлов курса напрямую в Object Storage (multipart): браузер грузит части по подписанным ссылкам,
+-- функция только открывает сессию, выдаёт ссылки и по завершении записывает course_files
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    s3_upload_id TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    file_name VARCHAR(500) NOT NULL,
+    file_type VARCHAR(100) NOT NULL,
+    file_size BIGINT NOT NULL,
+    part_size INTEGER NOT NULL,
+    part_count INTEGER NOT NULL,
+    title VARCHAR(500),
+    description TEXT,
+    lesson_id INTEGER,
+    module_id INTEGER,
+    is_welcome_video BOOLEAN DEFAULT FALSE,
+    status VARCHAR(20) NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'completed', 'aborted')),
+    course_file_id INTEGER REFERENCES course_files(id) ON DELETE SET NULL,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+-- Поиск незавершённых сессий (продолжение загрузки, очистка брошенных)
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_active ON upload_sessions(created_at) WHERE status = 'active';
+
+-- Видео уроков бывают больше 2 ГБ
+ALTER TABLE course_files ALTER COLUMN file_size TYPE BIGINT;
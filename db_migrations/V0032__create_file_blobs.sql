@@ -0,0 +1,21 @@
+-- Содержимое файлов курса по SHA-256: одинаковый файл хранится в бакете один раз,
+-- записи course_files ссылаются на него, ref_count считает ссылки
+CREATE TABLE IF NOT EXISTS file_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    file_key TEXT NOT NULL,
+    file_size BIGINT NOT NULL,
+    file_type VARCHAR(100),
+    ref_count INTEGER NOT NULL DEFAULT 0 CHECK (ref_count >= 0),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_referenced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Внешние ссылки и файлы, загруженные до этой миграции, остаются без blob_sha256
+ALTER TABLE course_files
+ADD COLUMN IF NOT EXISTS blob_sha256 CHAR(64) REFERENCES file_blobs(sha256);
+
+CREATE INDEX IF NOT EXISTS idx_course_files_blob_sha256 ON course_files(blob_sha256);
+
+-- Хэш, который браузер посчитал до начала multipart-загрузки
+ALTER TABLE upload_sessions
+ADD COLUMN IF NOT EXISTS sha256 CHAR(64);
@@ -0,0 +1,26 @@
+-- Ручной доступ к чату (chat_access) — отдельный продукт 'chat_access', а не 'chat':
+-- доступ к курсу даёт любая оплаченная покупка, но не выданный вручную чат
+CREATE OR REPLACE VIEW user_entitlement_sources AS
+SELECT user_id,
+       product,
+       CASE WHEN bool_or(expires_at IS NULL) THEN NULL ELSE MAX(expires_at) END AS expires_at
+FROM (
+    SELECT user_id, COALESCE(product_type, 'course') AS product, expires_at
+    FROM user_purchases
+    WHERE payment_status = 'completed'
+    UNION ALL
+    SELECT user_id, 'chat_access', access_end
+    FROM chat_access
+    WHERE user_id IS NOT NULL AND is_active = true
+) sources
+GROUP BY user_id, product;
+
+-- Пересобираем строки чата из источников
+DELETE FROM user_entitlements WHERE product IN ('chat', 'chat_access');
+
+INSERT INTO user_entitlements (user_id, product, expires_at)
+SELECT user_id, product, expires_at FROM user_entitlement_sources
+WHERE product IN ('chat', 'chat_access')
+ON CONFLICT (user_id, product) DO UPDATE SET
+    expires_at = EXCLUDED.expires_at,
+    updated_at = CURRENT_TIMESTAMP;
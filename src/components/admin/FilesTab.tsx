@@ -41,6 +41,8 @@ interface FilesTabProps {
   moduleFileUrl: string;
   moduleFileTitle: string;
   moduleFileDescription: string;
+  moduleFile: File | null;
+  uploadProgress: { stage: 'hash' | 'upload'; percent: number } | null;
   onSelectedModuleChange: (moduleId?: number) => void;
   onSelectedLessonChange: (lessonId?: number) => void;
   onWelcomeVideoUrlChange: (url: string) => void;
@@ -49,6 +51,7 @@ interface FilesTabProps {
   onModuleFileUrlChange: (url: string) => void;
   onModuleFileTitleChange: (title: string) => void;
   onModuleFileDescriptionChange: (description: string) => void;
+  onModuleFileChange: (file: File | null) => void;
   onSaveWelcomeVideo: (e: React.FormEvent) => void;
   onSaveModuleFile: (e: React.FormEvent) => void;
   onDeleteFile: (fileId: number) => void;
@@ -67,6 +70,8 @@ export default function FilesTab({
   moduleFileUrl,
   moduleFileTitle,
   moduleFileDescription,
+  moduleFile,
+  uploadProgress,
   onSelectedModuleChange,
   onSelectedLessonChange,
   onWelcomeVideoUrlChange,
@@ -75,6 +80,7 @@ export default function FilesTab({
   onModuleFileUrlChange,
   onModuleFileTitleChange,
   onModuleFileDescriptionChange,
+  onModuleFileChange,
   onSaveWelcomeVideo,
   onSaveModuleFile,
   onDeleteFile,
@@ -214,20 +220,34 @@ export default function FilesTab({
             </div>
 
             <div className="space-y-2">
-              <Label htmlFor="module-file-url">Ссылка на файл (PDF, видео)</Label>
+              <Label htmlFor="module-file-upload">Файл с компьютера (PDF, видео)</Label>
               <Input
-                id="module-file-url"
-                type="url"
-                placeholder="https://example.com/file.pdf"
-                value={moduleFileUrl}
-                onChange={(e) => onModuleFileUrlChange(e.target.value)}
-                required
+                id="module-file-upload"
+                type="file"
+                accept=".pdf,video/*,application/pdf"
+                onChange={(e) => onModuleFileChange(e.target.files?.[0] || null)}
               />
               <p className="text-xs text-muted-foreground">
-                Вставьте прямую ссылку на PDF или видео из облачного хранилища
+                Файл загружается частями напрямую в хранилище; если загрузка прервалась, выберите тот же файл снова — она продолжится с места обрыва
               </p>
             </div>
 
+            {!moduleFile && (
+              <div className="space-y-2">
+                <Label htmlFor="module-file-url">Или ссылка на файл (PDF, видео)</Label>
+                <Input
+                  id="module-file-url"
+                  type="url"
+                  placeholder="https://example.com/file.pdf"
+                  value={moduleFileUrl}
+                  onChange={(e) => onModuleFileUrlChange(e.target.value)}
+                />
+                <p className="text-xs text-muted-foreground">
+                  Вставьте прямую ссылку на PDF или видео из облачного хранилища
+                </p>
+              </div>
+            )}
+
             <div className="space-y-2">
               <Label htmlFor="module-file-title">Название</Label>
               <Input
@@ -253,7 +273,11 @@ export default function FilesTab({
 
             <Button type="submit" className="w-full" disabled={uploading}>
               <Icon name="Save" size={16} className="mr-2" />
-              {uploading ? 'Сохранение...' : 'Добавить файл'}
+              {uploading
+                ? uploadProgress
+                  ? `${uploadProgress.stage === 'hash' ? 'Проверка файла' : 'Загрузка'}... ${uploadProgress.percent}%`
+                  : 'Сохранение...'
+                : 'Добавить файл'}
             </Button>
           </form>
         </CardContent>
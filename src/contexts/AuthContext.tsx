@@ -12,6 +12,7 @@ interface AuthContextType {
   user: User | null;
   token: string | null;
   login: (email: string, password: string) => Promise<void>;
+  loginWithMagicLink: (magicToken: string) => Promise<{ needsPassword: boolean }>;
   register: (email: string, password: string, fullName: string, telegramUsername?: string) => Promise<void>;
   logout: () => void;
   loading: boolean;
@@ -57,6 +58,17 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
     localStorage.setItem('auth_token', data.token);
   };
 
+  const loginWithMagicLink = async (magicToken: string) => {
+    const data = await auth.magicLogin(magicToken);
+    if (data.error) {
+      throw new Error(data.error);
+    }
+    setUser(data.user);
+    setToken(data.token);
+    localStorage.setItem('auth_token', data.token);
+    return { needsPassword: data.needs_password === true };
+  };
+
   const register = async (email: string, password: string, fullName: string, telegramUsername?: string) => {
     const data = await auth.register(email, password, fullName, telegramUsername);
     if (data.error) {
@@ -74,7 +86,7 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
   };
 
   return (
-    <AuthContext.Provider value={{ user, token, login, register, logout, loading }}>
+    <AuthContext.Provider value={{ user, token, login, loginWithMagicLink, register, logout, loading }}>
       {children}
     </AuthContext.Provider>
   );
@@ -1,3 +1,5 @@
+import { sha256File } from '@/lib/sha256';
+
 const API_BASE = {
   auth: 'https://functions.poehali.dev/c499486b-a97c-4ff5-8905-0ccd7fddcf9d',
   admin: 'https://functions.poehali.dev/94be9de0-6f48-41a7-98b1-708c24fb05ad',
@@ -25,6 +27,24 @@ export const auth = {
     return response.json();
   },
 
+  magicLogin: async (token: string) => {
+    const response = await fetch(API_BASE.auth, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ action: 'magic', token }),
+    });
+    return response.json();
+  },
+
+  setPassword: async (authToken: string, password: string, currentPassword?: string) => {
+    const response = await fetch(API_BASE.auth, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'X-Auth-Token': authToken },
+      body: JSON.stringify({ action: 'set_password', password, current_password: currentPassword }),
+    });
+    return response.json();
+  },
+
   validateToken: async (token: string) => {
     const response = await fetch(API_BASE.auth, {
       method: 'GET',
@@ -128,10 +148,21 @@ export const course = {
     });
     return response.json();
   },
+
+  updateProgressBatch: async (token: string, events: { lesson_id: number; completed: boolean; watch_time_seconds: number }[], keepalive = false) => {
+    // keepalive lets the request outlive the page when it is sent while the tab is closing
+    const response = await fetch(API_BASE.course, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'X-Auth-Token': token },
+      body: JSON.stringify({ events }),
+      keepalive,
+    });
+    return response.json();
+  },
 };
 
 export const payment = {
-  createPayment: async (userId: number, amount: number, email: string, returnUrl: string, name?: string, productType?: string) => {
+  createPayment: async (userId: number, amount: number, email: string, returnUrl: string, name?: string, productType?: string, idempotencyKey?: string) => {
     const response = await fetch(`${API_BASE.payment}?action=create`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -141,14 +172,15 @@ export const payment = {
         email, 
         return_url: returnUrl,
         name: name || 'Клиент',
-        product_type: productType || 'course'
+        product_type: productType || 'course',
+        idempotency_key: idempotencyKey
       }),
     });
     return response.json();
   },
 
-  checkStatus: async (paymentId: string) => {
-    const response = await fetch(`${API_BASE.payment}?action=status&payment_id=${paymentId}`);
+  checkStatus: async (paymentId: string, waitSeconds = 0) => {
+    const response = await fetch(`${API_BASE.payment}?action=status&payment_id=${paymentId}&wait=${waitSeconds}`);
     return response.json();
   },
 };
@@ -191,4 +223,78 @@ export const deleteFile = async (token: string, fileId: number) => {
     headers: { 'X-Auth-Token': token },
   });
   return response.json();
-};
\ No newline at end of file
+};
+
+const UPLOAD_PARALLEL_PARTS = 4;
+
+const uploadSessionRequest = async (token: string, action: string, body: object) => {
+  const response = await fetch(`${API_BASE.upload}?action=${action}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'X-Auth-Token': token },
+    body: JSON.stringify(body),
+  });
+  const data = await response.json();
+  return { status: response.status, data };
+};
+
+const uploadResumeKey = (file: File) => `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+
+// Файл уходит частями прямо в Object Storage по подписанным ссылкам, функция только выдаёт ссылки
+// и записывает course_files. uploadId хранится в localStorage: после обрыва повторный вызов
+// с тем же файлом догружает только недостающие части. Перед загрузкой считается SHA-256:
+// если такой файл уже есть в хранилище, функция сразу создаёт запись и байты не передаются.
+export const uploadFileMultipart = async (token: string, file: File, meta: {
+  title: string;
+  description: string;
+  lessonId?: number;
+  moduleId?: number;
+  isWelcomeVideo?: boolean;
+}, onProgress?: (doneBytes: number, totalBytes: number, stage: 'hash' | 'upload') => void) => {
+  const resumeKey = uploadResumeKey(file);
+  let session: any = null;
+
+  const savedUploadId = localStorage.getItem(resumeKey);
+  if (savedUploadId) {
+    const resumed = await uploadSessionRequest(token, 'resume', { uploadId: savedUploadId });
+    if (resumed.status === 200 && resumed.data.status === 'completed') {
+      localStorage.removeItem(resumeKey);
+      return resumed.data.file;
+    }
+    if (resumed.status === 200) session = resumed.data;
+    else localStorage.removeItem(resumeKey);
+  }
+
+  if (!session) {
+    const sha256 = await sha256File(file, (hashed, total) => onProgress?.(hashed, total, 'hash'));
+    const started = await uploadSessionRequest(token, 'start', {
+      ...meta,
+      fileName: file.name,
+      fileType: file.type || 'application/octet-stream',
+      fileSize: file.size,
+      sha256,
+    });
+    if (started.status !== 200) return started.data;
+    if (started.data.deduplicated) return started.data.file;
+    session = started.data;
+    localStorage.setItem(resumeKey, session.uploadId);
+  }
+
+  let uploadedBytes = session.uploadedBytes;
+  onProgress?.(uploadedBytes, file.size, 'upload');
+
+  const queue = [...session.parts];
+  const worker = async () => {
+    for (let part = queue.shift(); part; part = queue.shift()) {
+      const chunk = file.slice((part.partNumber - 1) * session.partSize, part.partNumber * session.partSize);
+      const response = await fetch(part.url, { method: 'PUT', body: chunk });
+      if (!response.ok) throw new Error(`Часть ${part.partNumber} не загружена (${response.status})`);
+      uploadedBytes += chunk.size;
+      onProgress?.(uploadedBytes, file.size, 'upload');
+    }
+  };
+  await Promise.all(Array.from({ length: UPLOAD_PARALLEL_PARTS }, worker));
+
+  const completed = await uploadSessionRequest(token, 'complete', { uploadId: session.uploadId });
+  if (completed.status === 200) localStorage.removeItem(resumeKey);
+  return completed.data;
+};
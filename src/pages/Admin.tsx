@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '@/contexts/AuthContext';
-import { admin, uploadFile, getFiles, deleteFile } from '@/lib/api';
+import { admin, uploadFile, uploadFileMultipart, getFiles, deleteFile } from '@/lib/api';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { useToast } from '@/hooks/use-toast';
 import AdminHeader from '@/components/admin/AdminHeader';
@@ -58,6 +58,8 @@ const Admin = () => {
   const [welcomeVideoDescription, setWelcomeVideoDescription] = useState('');
   const [moduleFileUrl, setModuleFileUrl] = useState('');
   const [moduleFileTitle, setModuleFileTitle] = useState('');
+  const [moduleFile, setModuleFile] = useState<File | null>(null);
+  const [uploadProgress, setUploadProgress] = useState<{ stage: 'hash' | 'upload'; percent: number } | null>(null);
   const [moduleFileDescription, setModuleFileDescription] = useState('');
   const [sendingTestEmail, setSendingTestEmail] = useState(false);
   const [newModule, setNewModule] = useState<Module>({
@@ -237,21 +239,28 @@ const Admin = () => {
   const handleSaveModuleFile = async (e: React.FormEvent) => {
     e.preventDefault();
     
-    if (!moduleFileUrl.trim()) {
-      toast({ title: 'Ошибка', description: 'Введите ссылку на файл', variant: 'destructive' });
+    if (!moduleFile && !moduleFileUrl.trim()) {
+      toast({ title: 'Ошибка', description: 'Выберите файл или введите ссылку', variant: 'destructive' });
       return;
     }
 
     setUploading(true);
     try {
-      const data = await uploadFile(token!, {
-        title: moduleFileTitle || 'Файл модуля',
-        description: moduleFileDescription,
-        fileType: 'application/pdf',
-        externalUrl: moduleFileUrl,
-        moduleId: selectedModule,
-        lessonId: selectedLesson,
-      });
+      const data = moduleFile
+        ? await uploadFileMultipart(token!, moduleFile, {
+            title: moduleFileTitle || moduleFile.name,
+            description: moduleFileDescription,
+            moduleId: selectedModule,
+            lessonId: selectedLesson,
+          }, (done, total, stage) => setUploadProgress({ stage, percent: Math.floor((done / total) * 100) }))
+        : await uploadFile(token!, {
+            title: moduleFileTitle || 'Файл модуля',
+            description: moduleFileDescription,
+            fileType: 'application/pdf',
+            externalUrl: moduleFileUrl,
+            moduleId: selectedModule,
+            lessonId: selectedLesson,
+          });
 
       if (data.error) {
         toast({ title: 'Ошибка', description: data.error, variant: 'destructive' });
@@ -260,12 +269,14 @@ const Admin = () => {
         setModuleFileUrl('');
         setModuleFileTitle('');
         setModuleFileDescription('');
+        setModuleFile(null);
         loadFiles();
       }
     } catch (err: any) {
       toast({ title: 'Ошибка', description: err.message, variant: 'destructive' });
     } finally {
       setUploading(false);
+      setUploadProgress(null);
     }
   };
 
@@ -365,6 +376,8 @@ const Admin = () => {
               moduleFileUrl={moduleFileUrl}
               moduleFileTitle={moduleFileTitle}
               moduleFileDescription={moduleFileDescription}
+              moduleFile={moduleFile}
+              uploadProgress={uploadProgress}
               onSelectedModuleChange={setSelectedModule}
               onSelectedLessonChange={setSelectedLesson}
               onWelcomeVideoUrlChange={setWelcomeVideoUrl}
@@ -373,6 +386,7 @@ const Admin = () => {
               onModuleFileUrlChange={setModuleFileUrl}
               onModuleFileTitleChange={setModuleFileTitle}
               onModuleFileDescriptionChange={setModuleFileDescription}
+              onModuleFileChange={setModuleFile}
               onSaveWelcomeVideo={handleSaveWelcomeVideo}
               onSaveModuleFile={handleSaveModuleFile}
               onDeleteFile={handleDeleteFile}
@@ -54,6 +54,8 @@ interface Module {
   files?: CourseFile[];
 }
 
+const PROGRESS_BATCH_SIZE = 6;
+
 export const Dashboard = () => {
   const { token, user, logout } = useAuth();
   const navigate = useNavigate();
@@ -63,6 +65,14 @@ export const Dashboard = () => {
   const [files, setFiles] = useState<any[]>([]);
   const videoRefs = useRef<{ [key: number]: HTMLVideoElement | null }>({});
   const progressIntervals = useRef<{ [key: number]: NodeJS.Timeout }>({});
+  const pendingProgress = useRef<{ lesson_id: number; completed: boolean; watch_time_seconds: number }[]>([]);
+
+  const flushProgress = async (keepalive = false) => {
+    const events = pendingProgress.current;
+    if (events.length === 0) return;
+    pendingProgress.current = [];
+    await course.updateProgressBatch(token!, events, keepalive);
+  };
 
   useEffect(() => {
     if (!token) {
@@ -150,8 +160,12 @@ export const Dashboard = () => {
           }))
         );
         
+        pendingProgress.current.push({ lesson_id: lessonId, completed, watch_time_seconds: watchTime });
+        
         try {
-          await course.updateProgress(token!, lessonId, completed, watchTime);
+          if (completed || pendingProgress.current.length >= PROGRESS_BATCH_SIZE) {
+            await flushProgress();
+          }
           if (completed) {
             clearInterval(progressIntervals.current[lessonId]);
           }
@@ -190,7 +204,8 @@ export const Dashboard = () => {
         }))
       );
       
-      course.updateProgress(token!, lessonId, completed, watchTime).catch(err => {
+      pendingProgress.current.push({ lesson_id: lessonId, completed, watch_time_seconds: watchTime });
+      flushProgress().catch(err => {
         console.error('Error saving progress on pause:', err);
       });
     }
@@ -222,8 +237,10 @@ export const Dashboard = () => {
         }))
       );
       
+      pendingProgress.current.push({ lesson_id: lessonId, completed: true, watch_time_seconds: watchTime });
+      
       try {
-        await course.updateProgress(token!, lessonId, true, watchTime);
+        await flushProgress();
       } catch (err) {
         console.error('Error marking as completed:', err);
       }
@@ -231,10 +248,21 @@ export const Dashboard = () => {
   };
 
   useEffect(() => {
+    const handlePageHide = () => {
+      flushProgress(true).catch(err => {
+        console.error('Error saving progress on page close:', err);
+      });
+    };
+    window.addEventListener('pagehide', handlePageHide);
+    
     return () => {
+      window.removeEventListener('pagehide', handlePageHide);
       Object.values(progressIntervals.current).forEach(interval => {
         clearInterval(interval);
       });
+      flushProgress(true).catch(err => {
+        console.error('Error saving progress on unmount:', err);
+      });
     };
   }, []);
 
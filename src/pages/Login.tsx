@@ -1,6 +1,7 @@
-import { useState } from 'react';
-import { useNavigate, Link } from 'react-router-dom';
+import { useEffect, useState } from 'react';
+import { useNavigate, useSearchParams, Link } from 'react-router-dom';
 import { useAuth } from '@/contexts/AuthContext';
+import { auth } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/components/ui/card';
@@ -14,10 +15,62 @@ const Login = () => {
   const [fullName, setFullName] = useState('');
   const [telegramUsername, setTelegramUsername] = useState('');
   const [loading, setLoading] = useState(false);
+  const [settingPassword, setSettingPassword] = useState(false);
   
-  const { login, register } = useAuth();
+  const { login, loginWithMagicLink, register } = useAuth();
   const navigate = useNavigate();
+  const [searchParams] = useSearchParams();
   const { toast } = useToast();
+  const magicToken = searchParams.get('magic');
+
+  useEffect(() => {
+    if (!magicToken) return;
+
+    setLoading(true);
+    loginWithMagicLink(magicToken)
+      .then(({ needsPassword }) => {
+        if (needsPassword) {
+          setSettingPassword(true);
+        } else {
+          navigate('/dashboard');
+        }
+      })
+      .catch((error: any) => {
+        toast({
+          title: 'Ошибка',
+          description: error.message || 'Не удалось войти по ссылке',
+          variant: 'destructive',
+        });
+      })
+      .finally(() => {
+        setLoading(false);
+      });
+  }, [magicToken]);
+
+  const handleSetPassword = async (e: React.FormEvent) => {
+    e.preventDefault();
+    setLoading(true);
+
+    try {
+      const data = await auth.setPassword(localStorage.getItem('auth_token') || '', password);
+      if (data.error) {
+        throw new Error(data.error);
+      }
+      toast({
+        title: 'Пароль сохранён',
+        description: 'Теперь вы можете входить по email и паролю',
+      });
+      navigate('/dashboard');
+    } catch (error: any) {
+      toast({
+        title: 'Ошибка',
+        description: error.message || 'Не удалось сохранить пароль',
+        variant: 'destructive',
+      });
+    } finally {
+      setLoading(false);
+    }
+  };
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -49,6 +102,51 @@ const Login = () => {
     }
   };
 
+  if (settingPassword) {
+    return (
+      <div className="min-h-screen flex items-center justify-center bg-gradient-to-br from-primary/5 via-background to-accent/5 p-4">
+        <Card className="w-full max-w-md">
+          <CardHeader className="text-center">
+            <CardTitle className="text-3xl font-bold">Задайте пароль</CardTitle>
+            <CardDescription>
+              Вы вошли по ссылке из письма. Пароль понадобится для следующих входов
+            </CardDescription>
+          </CardHeader>
+          <CardContent>
+            <form onSubmit={handleSetPassword} className="space-y-4">
+              <div className="space-y-2">
+                <Label htmlFor="newPassword">Пароль</Label>
+                <Input
+                  id="newPassword"
+                  type="password"
+                  placeholder="••••••••"
+                  value={password}
+                  onChange={(e) => setPassword(e.target.value)}
+                  required
+                  minLength={6}
+                />
+              </div>
+
+              <Button type="submit" className="w-full" disabled={loading}>
+                {loading ? 'Загрузка...' : 'Сохранить и перейти к обучению'}
+              </Button>
+
+              <div className="text-center">
+                <button
+                  type="button"
+                  onClick={() => navigate('/dashboard')}
+                  className="text-sm text-muted-foreground hover:text-foreground"
+                >
+                  Позже
+                </button>
+              </div>
+            </form>
+          </CardContent>
+        </Card>
+      </div>
+    );
+  }
+
   return (
     <div className="min-h-screen flex items-center justify-center bg-gradient-to-br from-primary/5 via-background to-accent/5 p-4">
       <Card className="w-full max-w-md">
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 import { useAuth } from '@/contexts/AuthContext';
 import { payment } from '@/lib/api';
@@ -18,6 +18,7 @@ export default function Payment() {
 
   const paymentId = searchParams.get('payment_id');
   const serviceType = searchParams.get('type') || 'course';
+  const idempotencyKey = useMemo(() => crypto.randomUUID(), [user?.id, serviceType]);
   
   const serviceConfig = {
     course: {
@@ -102,7 +103,8 @@ export default function Payment() {
         user.email, 
         returnUrl,
         user.full_name,
-        serviceType
+        serviceType,
+        idempotencyKey
       );
 
       if (result.error) {
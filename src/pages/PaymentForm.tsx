@@ -1,4 +1,4 @@
-import { useState } from 'react';
+import { useState, useMemo } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -16,6 +16,7 @@ const PaymentForm = () => {
   const [email, setEmail] = useState('');
   const [name, setName] = useState('');
   const [isProcessing, setIsProcessing] = useState(false);
+  const idempotencyKey = useMemo(() => crypto.randomUUID(), [email, name, productType]);
 
   const products = {
     course: {
@@ -89,7 +90,8 @@ const PaymentForm = () => {
           name,
           amount: currentProduct.price,
           product_type: productType === 'test' ? 'combo' : productType,
-          return_url: returnUrl
+          return_url: returnUrl,
+          idempotency_key: idempotencyKey
         })
       });
 
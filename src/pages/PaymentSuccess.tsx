@@ -23,7 +23,7 @@ const PaymentSuccess = () => {
 
   const verifyPayment = async (id: string) => {
     try {
-      const result = await payment.checkStatus(id);
+      const result = await payment.checkStatus(id, 20);
       setVerified(result.paid === true);
     } catch (error) {
       console.error('Error verifying payment:', error);
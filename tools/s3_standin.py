@@ -0,0 +1,328 @@
+'''
+Local stand-in for Yandex Object Storage (S3 API, path-style), for running the upload-file
+function and storage jobs without touching the real bucket.
+
+Serves, for any bucket name:
+  PUT    /<bucket>                          create bucket
+  GET    /<bucket>?list-type=2              ListObjectsV2 (prefix, max-keys, continuation-token)
+  POST   /<bucket>?delete                   DeleteObjects
+  PUT    /<bucket>/<key>                    PutObject (CopyObject with x-amz-copy-source)
+  GET    /<bucket>/<key>, HEAD              GetObject, HeadObject
+  DELETE /<bucket>/<key>                    DeleteObject
+  POST   /<bucket>/<key>?uploads            CreateMultipartUpload
+  PUT    /<bucket>/<key>?partNumber&uploadId UploadPart (presigned URLs from the function work as is)
+  GET    /<bucket>/<key>?uploadId           ListParts (part-number-marker, max-parts)
+  POST   /<bucket>/<key>?uploadId           CompleteMultipartUpload
+  DELETE /<bucket>/<key>?uploadId           AbortMultipartUpload
+
+Signatures are not checked; objects live in memory.
+
+Usage:
+  python tools/s3_standin.py --port 9000 --handshake-ms 40 --latency-ms 2
+  S3_ENDPOINT_URL=http://127.0.0.1:9000 AWS_ACCESS_KEY_ID=x AWS_SECRET_ACCESS_KEY=y ... (function env)
+
+--handshake-ms delays every new connection to stand in for the TLS handshake with the real
+endpoint, --latency-ms delays every request. --age-seconds reports objects that much older
+than they are, so grace periods can be checked without waiting. Counters are printed on Ctrl+C.
+'''
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+buckets = {}
+uploads = {}
+lock = threading.Lock()
+counters = {'connections': 0, 'requests': 0}
+
+def iso_time(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+def xml_body(root, children, namespace=NS):
+    xmlns = f' xmlns="{namespace}"' if namespace else ''
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<{root}{xmlns}>']
+    for child in children:
+        lines.append(child)
+    lines.append(f'</{root}>')
+    return ''.join(lines).encode()
+
+def element(name, value):
+    text = str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return f'<{name}>{text}</{name}>'
+
+def stored_object(data, content_type):
+    return {
+        'data': data,
+        'etag': '"' + hashlib.md5(data).hexdigest() + '"',
+        'content_type': content_type or 'binary/octet-stream',
+        'modified': time.time()
+    }
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    handshake = 0.0
+    latency = 0.0
+    age = 0.0
+
+    def setup(self):
+        super().setup()
+        with lock:
+            counters['connections'] += 1
+        time.sleep(self.handshake)
+
+    def route(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path).lstrip('/')
+        bucket, _, key = path.partition('/')
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        with lock:
+            counters['requests'] += 1
+        time.sleep(self.latency)
+        return bucket, key, query
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def reply(self, status, body=b'', headers=None, content_type='application/xml'):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body or status == 200:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def error(self, status, code, message=''):
+        self.reply(status, xml_body('Error', [element('Code', code), element('Message', message or code)], namespace=None))
+
+    def bucket_objects(self, bucket):
+        if bucket not in buckets:
+            self.error(404, 'NoSuchBucket', 'The specified bucket does not exist')
+            return None
+        return buckets[bucket]
+
+    def upload_for(self, bucket, key, upload_id):
+        upload = uploads.get(upload_id)
+        if not upload or upload['bucket'] != bucket or upload['key'] != key:
+            self.error(404, 'NoSuchUpload', 'The specified upload does not exist')
+            return None
+        return upload
+
+    def object_headers(self, obj):
+        return {
+            'ETag': obj['etag'],
+            'Last-Modified': formatdate(obj['modified'] - self.age, usegmt=True)
+        }
+
+    def do_PUT(self):
+        bucket, key, query = self.route()
+        body = self.read_body()
+        with lock:
+            if not key:
+                if bucket in buckets:
+                    return self.error(409, 'BucketAlreadyOwnedByYou')
+                buckets[bucket] = {}
+                return self.reply(200, headers={'Location': f'/{bucket}'})
+            objects = self.bucket_objects(bucket)
+            if objects is None:
+                return
+
+            if 'uploadId' in query:
+                upload = self.upload_for(bucket, key, query['uploadId'])
+                if upload is None:
+                    return
+                part = stored_object(body, None)
+                upload['parts'][int(query['partNumber'])] = part
+                return self.reply(200, headers={'ETag': part['etag']})
+
+            source = self.headers.get('x-amz-copy-source')
+            if source:
+                source_bucket, _, source_key = unquote(source).lstrip('/').partition('/')
+                original = buckets.get(source_bucket, {}).get(source_key)
+                if original is None:
+                    return self.error(404, 'NoSuchKey', 'The specified key does not exist.')
+                copy = stored_object(original['data'], original['content_type'])
+                objects[key] = copy
+                return self.reply(200, xml_body('CopyObjectResult', [
+                    element('LastModified', iso_time(copy['modified'])), element('ETag', copy['etag'])
+                ]))
+
+            objects[key] = stored_object(body, self.headers.get('Content-Type'))
+            self.reply(200, headers={'ETag': objects[key]['etag']})
+
+    def do_GET(self):
+        bucket, key, query = self.route()
+        with lock:
+            objects = self.bucket_objects(bucket)
+            if objects is None:
+                return
+            if not key:
+                return self.list_objects(bucket, objects, query)
+            if 'uploadId' in query:
+                return self.list_parts(bucket, key, query)
+            obj = objects.get(key)
+            if obj is None:
+                return self.error(404, 'NoSuchKey', 'The specified key does not exist.')
+            self.reply(200, obj['data'], self.object_headers(obj), obj['content_type'])
+
+    def do_HEAD(self):
+        bucket, key, query = self.route()
+        with lock:
+            obj = buckets.get(bucket, {}).get(key)
+            if obj is None:
+                return self.reply(404)
+            self.send_response(200)
+            for name, value in self.object_headers(obj).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', obj['content_type'])
+            self.send_header('Content-Length', str(len(obj['data'])))
+            self.end_headers()
+
+    def do_DELETE(self):
+        bucket, key, query = self.route()
+        with lock:
+            if 'uploadId' in query:
+                if self.upload_for(bucket, key, query['uploadId']) is None:
+                    return
+                del uploads[query['uploadId']]
+                return self.reply(204)
+            objects = self.bucket_objects(bucket)
+            if objects is None:
+                return
+            objects.pop(key, None)
+            self.reply(204)
+
+    def do_POST(self):
+        bucket, key, query = self.route()
+        body = self.read_body()
+        with lock:
+            objects = self.bucket_objects(bucket)
+            if objects is None:
+                return
+            if not key and 'delete' in query:
+                return self.delete_objects(objects, body)
+            if 'uploads' in query:
+                upload_id = uuid.uuid4().hex
+                uploads[upload_id] = {
+                    'bucket': bucket, 'key': key, 'parts': {},
+                    'content_type': self.headers.get('Content-Type')
+                }
+                return self.reply(200, xml_body('InitiateMultipartUploadResult', [
+                    element('Bucket', bucket), element('Key', key), element('UploadId', upload_id)
+                ]))
+            if 'uploadId' in query:
+                return self.complete_upload(bucket, key, query['uploadId'], body)
+            self.error(400, 'InvalidRequest')
+
+    def list_objects(self, bucket, objects, query):
+        prefix = query.get('prefix', '')
+        max_keys = int(query.get('max-keys', 1000))
+        after = query.get('continuation-token') or query.get('start-after', '')
+        keys = sorted(k for k in objects if k.startswith(prefix) and k > after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        children = [element('Name', bucket), element('Prefix', prefix), element('KeyCount', len(page)),
+                    element('MaxKeys', max_keys), element('IsTruncated', str(truncated).lower())]
+        for k in page:
+            obj = objects[k]
+            children.append('<Contents>' + ''.join([
+                element('Key', k), element('LastModified', iso_time(obj['modified'] - self.age)),
+                element('ETag', obj['etag']), element('Size', len(obj['data'])), element('StorageClass', 'STANDARD')
+            ]) + '</Contents>')
+        if truncated:
+            children.append(element('NextContinuationToken', page[-1]))
+        self.reply(200, xml_body('ListBucketResult', children))
+
+    def delete_objects(self, objects, body):
+        root = ET.fromstring(body)
+        quiet = (root.findtext(f'{{{NS}}}Quiet') or root.findtext('Quiet') or '').lower() == 'true'
+        children = []
+        for item in root.iter():
+            if item.tag.rsplit('}', 1)[-1] != 'Object':
+                continue
+            k = item.findtext(f'{{{NS}}}Key') or item.findtext('Key')
+            objects.pop(k, None)
+            if not quiet:
+                children.append('<Deleted>' + element('Key', k) + '</Deleted>')
+        self.reply(200, xml_body('DeleteResult', children))
+
+    def list_parts(self, bucket, key, query):
+        upload = self.upload_for(bucket, key, query['uploadId'])
+        if upload is None:
+            return
+        marker = int(query.get('part-number-marker', 0))
+        max_parts = int(query.get('max-parts', 1000))
+        numbers = sorted(n for n in upload['parts'] if n > marker)
+        page, truncated = numbers[:max_parts], len(numbers) > max_parts
+        children = [element('Bucket', bucket), element('Key', key), element('UploadId', query['uploadId']),
+                    element('PartNumberMarker', marker), element('MaxParts', max_parts),
+                    element('IsTruncated', str(truncated).lower())]
+        if page:
+            children.append(element('NextPartNumberMarker', page[-1]))
+        for n in page:
+            part = upload['parts'][n]
+            children.append('<Part>' + ''.join([
+                element('PartNumber', n), element('LastModified', iso_time(part['modified'])),
+                element('ETag', part['etag']), element('Size', len(part['data']))
+            ]) + '</Part>')
+        self.reply(200, xml_body('ListPartsResult', children))
+
+    def complete_upload(self, bucket, key, upload_id, body):
+        upload = self.upload_for(bucket, key, upload_id)
+        if upload is None:
+            return
+        requested = []
+        for item in ET.fromstring(body).iter():
+            if item.tag.rsplit('}', 1)[-1] == 'Part':
+                number = int(item.findtext(f'{{{NS}}}PartNumber') or item.findtext('PartNumber'))
+                requested.append((number, item.findtext(f'{{{NS}}}ETag') or item.findtext('ETag')))
+        data = b''
+        for number, etag in requested:
+            part = upload['parts'].get(number)
+            if part is None or part['etag'] != etag:
+                return self.error(400, 'InvalidPart', f'Part {number} was not uploaded or its ETag does not match')
+            data += part['data']
+        buckets[bucket][key] = stored_object(data, upload['content_type'])
+        buckets[bucket][key]['etag'] = f'"{hashlib.md5(data).hexdigest()}-{len(requested)}"'
+        del uploads[upload_id]
+        self.reply(200, xml_body('CompleteMultipartUploadResult', [
+            element('Location', f'/{bucket}/{quote(key)}'), element('Bucket', bucket),
+            element('Key', key), element('ETag', buckets[bucket][key]['etag'])
+        ]))
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Local S3 stand-in')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--handshake-ms', type=float, default=0, help='delay per new connection')
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay per request')
+    parser.add_argument('--age-seconds', type=float, default=0, help='report objects this much older')
+    parser.add_argument('--bucket', action='append', default=['poehalidev-user-files'], help='bucket to create at start')
+    args = parser.parse_args()
+
+    StandInHandler.handshake = args.handshake_ms / 1000
+    StandInHandler.latency = args.latency_ms / 1000
+    StandInHandler.age = args.age_seconds
+    for bucket in args.bucket:
+        buckets.setdefault(bucket, {})
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StandInHandler)
+    print(f'S3 stand-in on http://127.0.0.1:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(counters))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+'''
+Local SMTP stand-in for exercising the mail transport without a real mailbox.
+
+Speaks enough ESMTP for smtplib: EHLO/HELO, AUTH PLAIN/LOGIN (any credentials), MAIL, RCPT,
+DATA, RSET, NOOP, QUIT. Messages are counted and, with --save-dir, written out as .eml files.
+No TLS: point the functions at it with SMTP_SECURITY=none.
+
+Usage:
+  python tools/smtp_standin.py --port 8025 --handshake-ms 150 --drop-after 20
+  SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_SECURITY=none SMTP_USER=u SMTP_PASSWORD=p ... (function env)
+
+--handshake-ms delays the greeting and AUTH to stand in for the TLS handshake and login cost of
+a real server. --drop-after answers 421 and closes the session after N messages, so reconnects
+can be checked. Counters are printed on Ctrl+C.
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import uuid
+
+counters = {'connections': 0, 'auths': 0, 'messages': 0, 'recipients': 0, 'dropped_sessions': 0}
+
+class Session:
+    handshake = 0.0
+    per_message = 0.0
+    drop_after = 0
+    save_dir = None
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.sent = 0
+        self.reset()
+
+    def reset(self):
+        self.mail_from = None
+        self.rcpt_to = []
+
+    async def reply(self, line):
+        self.writer.write(f'{line}\r\n'.encode())
+        await self.writer.drain()
+
+    async def read_line(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionResetError
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    async def read_data(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionResetError
+            if line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            lines.append(line[1:] if line.startswith(b'..') else line)
+
+    async def handle_auth(self, args):
+        await asyncio.sleep(self.handshake)
+        mechanism = args.split()[0].upper() if args else ''
+        if mechanism == 'PLAIN' and len(args.split()) == 1:
+            await self.reply('334 ')
+            await self.read_line()
+        elif mechanism == 'LOGIN':
+            await self.reply('334 VXNlcm5hbWU6')
+            await self.read_line()
+            await self.reply('334 UGFzc3dvcmQ6')
+            await self.read_line()
+        elif mechanism != 'PLAIN':
+            return await self.reply('504 Unrecognized authentication type')
+        counters['auths'] += 1
+        await self.reply('235 Authentication successful')
+
+    async def handle_data(self):
+        if not self.mail_from or not self.rcpt_to:
+            return await self.reply('503 Need MAIL and RCPT first')
+        await self.reply('354 End data with <CR><LF>.<CR><LF>')
+        data = await self.read_data()
+        await asyncio.sleep(self.per_message)
+        if self.save_dir:
+            with open(os.path.join(self.save_dir, f'{uuid.uuid4()}.eml'), 'wb') as f:
+                f.write(data)
+        counters['messages'] += 1
+        counters['recipients'] += len(self.rcpt_to)
+        self.sent += 1
+        self.reset()
+        await self.reply('250 OK queued')
+
+    async def run(self):
+        counters['connections'] += 1
+        await asyncio.sleep(self.handshake)
+        await self.reply('220 smtp-standin ESMTP')
+        while True:
+            line = await self.read_line()
+            verb, _, args = line.partition(' ')
+            verb = verb.upper()
+
+            if self.drop_after and self.sent >= self.drop_after and verb in ('MAIL', 'NOOP'):
+                counters['dropped_sessions'] += 1
+                await self.reply('421 Too many messages in this session')
+                return
+            if verb == 'EHLO':
+                await self.reply('250-smtp-standin')
+                await self.reply('250-8BITMIME')
+                await self.reply('250 AUTH PLAIN LOGIN')
+            elif verb == 'HELO':
+                await self.reply('250 smtp-standin')
+            elif verb == 'AUTH':
+                await self.handle_auth(args)
+            elif verb == 'MAIL':
+                self.reset()
+                self.mail_from = args
+                await self.reply('250 OK')
+            elif verb == 'RCPT':
+                self.rcpt_to.append(args)
+                await self.reply('250 OK')
+            elif verb == 'DATA':
+                await self.handle_data()
+            elif verb == 'RSET':
+                self.reset()
+                await self.reply('250 OK')
+            elif verb == 'NOOP':
+                await self.reply('250 OK')
+            elif verb == 'QUIT':
+                await self.reply('221 Bye')
+                return
+            else:
+                await self.reply('502 Command not implemented')
+
+async def handle_client(reader, writer):
+    try:
+        await Session(reader, writer).run()
+    except ConnectionResetError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(port):
+    server = await asyncio.start_server(handle_client, '127.0.0.1', port)
+    print(f'SMTP stand-in on 127.0.0.1:{port}')
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local SMTP stand-in')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--handshake-ms', type=float, default=100, help='delay before the greeting and on AUTH')
+    parser.add_argument('--per-message-ms', type=float, default=0)
+    parser.add_argument('--drop-after', type=int, default=0, help='messages per session before answering 421, 0 = never')
+    parser.add_argument('--save-dir', help='write every accepted message to this directory')
+    args = parser.parse_args()
+
+    Session.handshake = args.handshake_ms / 1000
+    Session.per_message = args.per_message_ms / 1000
+    Session.drop_after = args.drop_after
+    Session.save_dir = args.save_dir
+    try:
+        asyncio.run(serve(args.port))
+    except KeyboardInterrupt:
+        print(json.dumps(counters))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+'''
+Local stand-in for the YooKassa payments API, for running payment reconciliation and
+checkout flows without touching the real shop.
+
+Serves:
+  POST /v3/payments        creates a pending payment (same Idempotence-Key -> same payment)
+  GET  /v3/payments/<id>   returns the payment; unknown ids get a status picked by the id hash
+  POST /admin/<id>/<status> forces a status (succeeded, canceled, pending)
+
+Usage:
+  python tools/yookassa_standin.py --port 8765 --latency-ms 150 --rate-limit 10
+  YUKASSA_API_URL=http://127.0.0.1:8765/v3 ... (payment function env)
+
+--rate-limit answers 429 once more than N requests arrive within one second, so the
+reconciliation rate limiter can be checked; counters are printed on Ctrl+C.
+'''
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+payments = {}
+idempotence_keys = {}
+lock = threading.Lock()
+counters = {'requests': 0, 'throttled': 0, 'max_in_flight': 0}
+window = {'second': 0, 'count': 0}
+in_flight = [0]
+
+def default_status(payment_id):
+    bucket = int(hashlib.sha256(payment_id.encode()).hexdigest(), 16) % 10
+    if bucket < 5:
+        return 'succeeded'
+    if bucket < 8:
+        return 'canceled'
+    return 'pending'
+
+def payment_object(payment_id, status, amount='0.00', metadata=None):
+    return {
+        'id': payment_id,
+        'status': status,
+        'paid': status == 'succeeded',
+        'amount': {'value': amount, 'currency': 'RUB'},
+        'metadata': metadata or {},
+        'confirmation': {'type': 'redirect', 'confirmation_url': f'http://127.0.0.1/confirm/{payment_id}'}
+    }
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    rate_limit = 0
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def admit(self):
+        with lock:
+            counters['requests'] += 1
+            second = int(time.time())
+            if window['second'] != second:
+                window['second'] = second
+                window['count'] = 0
+            window['count'] += 1
+            if self.rate_limit and window['count'] > self.rate_limit:
+                counters['throttled'] += 1
+                return False
+            in_flight[0] += 1
+            counters['max_in_flight'] = max(counters['max_in_flight'], in_flight[0])
+        time.sleep(self.latency)
+        return True
+
+    def done(self):
+        with lock:
+            in_flight[0] -= 1
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[:2] != ['v3', 'payments']:
+            return self.send_json(404, {'type': 'error', 'code': 'not_found'})
+        if not self.admit():
+            return self.send_json(429, {'type': 'error', 'code': 'too_many_requests'})
+
+        payment_id = parts[2]
+        with lock:
+            payment = payments.get(payment_id) or payment_object(payment_id, default_status(payment_id))
+        self.done()
+        self.send_json(200, payment)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        parts = self.path.strip('/').split('/')
+
+        if len(parts) == 3 and parts[0] == 'admin':
+            with lock:
+                payment = payments.setdefault(parts[1], payment_object(parts[1], parts[2]))
+                payment['status'] = parts[2]
+                payment['paid'] = parts[2] == 'succeeded'
+            return self.send_json(200, payment)
+
+        if parts != ['v3', 'payments']:
+            return self.send_json(404, {'type': 'error', 'code': 'not_found'})
+        if not self.admit():
+            return self.send_json(429, {'type': 'error', 'code': 'too_many_requests'})
+
+        key = self.headers.get('Idempotence-Key')
+        with lock:
+            payment_id = idempotence_keys.get(key) if key else None
+            if payment_id is None:
+                payment_id = str(uuid.uuid4())
+                payments[payment_id] = payment_object(
+                    payment_id, 'pending', body.get('amount', {}).get('value', '0.00'), body.get('metadata')
+                )
+                if key:
+                    idempotence_keys[key] = payment_id
+            payment = payments[payment_id]
+        self.done()
+        self.send_json(200, payment)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Local YooKassa stand-in')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second before answering 429, 0 = unlimited')
+    args = parser.parse_args()
+
+    StandInHandler.latency = args.latency_ms / 1000
+    StandInHandler.rate_limit = args.rate_limit
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StandInHandler)
+    print(f'YooKassa stand-in on http://127.0.0.1:{args.port}/v3')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(counters))
+
+if __name__ == '__main__':
+    main()